@@ -5,6 +5,7 @@ import os
 import sys
 
 from matplotlib.colors import to_rgb
+import numpy as np
 
 from ._utils import IS_OSX
 
@@ -21,6 +22,14 @@ CONFIG = {
     'animate': True,
     'nice': 0,
     'tqdm': False,  # disable=CONFIG['tqdm']
+    'permutation_block_size': 1,
+    'permutation_stop_alpha': None,
+    'persistent_workers': False,
+    'permutation_dtype': 'float64',
+    'executor': 'multiprocessing',
+    'boosting_threads': 1,
+    'boosting_cache': None,
+    'boosting_cache_size': 2 ** 30,
 }
 
 # Python 3.8 switched default to spawn, which makes pytest hang  (https://docs.python.org/3/whatsnew/3.8.html#multiprocessing)
@@ -41,6 +50,14 @@ def configure(
         animate=None,
         nice=None,
         tqdm=None,
+        permutation_block_size=None,
+        permutation_stop_alpha=None,
+        persistent_workers=None,
+        permutation_dtype=None,
+        executor=None,
+        boosting_threads=None,
+        boosting_cache=None,
+        boosting_cache_size=None,
 ):
     """Set basic configuration parameters for the current session
 
@@ -84,6 +101,87 @@ def configure(
         other processes; negative numbers require root privileges).
     tqdm : bool
         Enable or disable :mod:`tqdm` progress bars.
+    permutation_block_size : int
+        Number of permutations that are evaluated together in permutation tests
+        that provide a batched implementation (currently :class:`testnd.TTestOneSample`,
+        :class:`testnd.TTestRelated`, :class:`testnd.Correlation` and
+        :class:`testnd.ANOVA`). Batched evaluation produces the same
+        permutation distribution (up to rounding errors for
+        :class:`testnd.Correlation` and :class:`testnd.ANOVA`), but reads the
+        data only once per block.
+        The default, ``1``, evaluates one permutation at a time.
+    permutation_stop_alpha : scalar | False
+        Sequential stopping for permutation tests: stop drawing permutations as
+        soon as additional permutations can not change whether any cluster
+        (or, for ``tfce`` and ``raw`` tests, any data point) is significant at
+        this alpha level (e.g., ``0.05``). This mostly speeds up tests without
+        significant effects. Decisions at ``permutation_stop_alpha`` are
+        identical to running all permutations, but p-values of
+        non-significant results are estimated from fewer permutations (the
+        number of permutations that were actually used is reported in the
+        test's ``info_list()``). Not used for tests with ``parc`` or
+        ``force_permutation``. ``False`` (default) to always run all
+        permutations.
+    persistent_workers : bool
+        Keep the worker processes for permutation tests and boosting alive
+        between jobs, instead of starting ``n_workers`` new processes for every
+        test (default ``False``). This saves the process start-up time when
+        running many tests. Set ``persistent_workers=False`` to shut down the
+        running worker processes.
+    permutation_dtype : 'float64' | 'float32' | numpy.dtype
+        Default data type for the permutations in :mod:`testnd` tests that
+        support the ``dtype`` parameter (:class:`testnd.TTestOneSample`,
+        :class:`testnd.TTestRelated`, :class:`testnd.TTestIndependent` and
+        :class:`testnd.ANOVA`). With ``'float32'``, the data and the permuted
+        statistical maps are stored in single precision, which halves memory
+        use and memory traffic of large tests. The statistic of the original
+        data is always computed in double precision. Single precision
+        statistics are accurate to about 6 significant digits, so a permuted
+        maximum statistic that is within this tolerance of an observed value
+        can be counted on the other side, and p-values can differ slightly
+        from ``'float64'`` (use ``'float64'`` when p-values need to be
+        reproduced exactly).
+    executor : str | concurrent.futures.Executor
+        Backend for the ``n_workers`` workers of permutation tests and boosting:
+
+        - ``'multiprocessing'`` (default): worker processes on the local
+          machine.
+        - ``'threading'``: threads in the current process (avoids copying
+          data, but only parts of the computation release the GIL).
+        - A :class:`concurrent.futures.Executor`: each worker occupies one of
+          the executor's workers while a job is running. Data is shared
+          through shared memory with a
+          :class:`~concurrent.futures.ProcessPoolExecutor` or
+          :class:`~concurrent.futures.ThreadPoolExecutor`, and sent by value
+          to the workers of other executors.
+        - ``'HOST:PORT'``: serve jobs at this address to worker processes on
+          other machines. Start workers on each machine with
+          ``python -m eelbrain._utils.parallel HOST:PORT [N]`` (``N`` worker
+          processes, default is the number of CPUs); they keep reconnecting
+          to serve subsequent tests until they are interrupted. The
+          ``EELBRAIN_AUTHKEY`` environment variable needs to be set to the
+          same secret key for the main process and the workers, because
+          workers execute the jobs they receive (only use this on a trusted
+          network). ``n_workers`` should be set to the total number of remote
+          worker processes.
+    boosting_threads : bool | int
+        Number of threads with which each boosting job evaluates the candidate
+        steps (predictor × lag) in each iteration (default ``1``). This speeds
+        up fitting a few responses with many predictors, when there are fewer
+        boosting jobs than ``n_workers``. The total number of threads used is
+        ``n_workers * boosting_threads``. ``True`` to use as many threads as
+        cores are available. Results are identical to ``boosting_threads=1``.
+    boosting_cache : str | Path | False
+        Directory in which to store :func:`boosting` results (default
+        ``False``, i.e., no cache). When :func:`boosting` is called with the
+        same data and parameters as a stored result, the stored result is
+        returned instead of estimating the model again. Results are identified
+        by a hash of the data (``y``, ``x`` and their dimensions, after
+        normalization) and all parameters that affect the result.
+    boosting_cache_size : int
+        Maximum size of the ``boosting_cache`` directory in bytes (default
+        1 GiB). When the cache grows larger, the results that have not been
+        used for the longest time are removed.
     """
     # don't change values before raising an error
     new = {}
@@ -129,5 +227,59 @@ def configure(
         new['nice'] = nice
     if tqdm is not None:
         new['tqdm'] = not tqdm
+    if permutation_block_size is not None:
+        if not isinstance(permutation_block_size, int):
+            raise TypeError(f"permutation_block_size={permutation_block_size!r}")
+        elif permutation_block_size < 1:
+            raise ValueError(f"permutation_block_size={permutation_block_size!r}; needs to be >= 1")
+        new['permutation_block_size'] = permutation_block_size
+    if permutation_stop_alpha is not None:
+        if permutation_stop_alpha is False:
+            permutation_stop_alpha = None
+        elif not 0 < permutation_stop_alpha < 1:
+            raise ValueError(f"permutation_stop_alpha={permutation_stop_alpha!r}; needs to be between 0 and 1")
+        new['permutation_stop_alpha'] = permutation_stop_alpha
+    if persistent_workers is not None:
+        new['persistent_workers'] = bool(persistent_workers)
+    if permutation_dtype is not None:
+        try:
+            dtype = np.dtype(permutation_dtype)
+        except TypeError:
+            dtype = None
+        if dtype not in (np.float64, np.float32):
+            raise ValueError(f"permutation_dtype={permutation_dtype!r}; needs to be 'float64' or 'float32'")
+        new['permutation_dtype'] = dtype.name
+    if executor is not None:
+        if isinstance(executor, str):
+            if executor not in ('multiprocessing', 'threading'):
+                from ._utils.parallel import parse_address
+                parse_address(executor)
+        else:
+            from concurrent.futures import Executor
+            if not isinstance(executor, Executor):
+                raise TypeError(f"executor={executor!r}")
+        new['executor'] = executor
+    if boosting_threads is not None:
+        if boosting_threads is True:
+            boosting_threads = multiprocessing.cpu_count()
+        elif boosting_threads is False:
+            boosting_threads = 1
+        elif not isinstance(boosting_threads, int):
+            raise TypeError(f"boosting_threads={boosting_threads!r}")
+        elif boosting_threads < 1:
+            raise ValueError(f"boosting_threads={boosting_threads!r}; needs to be >= 1")
+        new['boosting_threads'] = boosting_threads
+    if boosting_cache is not None:
+        new['boosting_cache'] = None if boosting_cache is False else os.fspath(os.path.expanduser(boosting_cache))
+    if boosting_cache_size is not None:
+        if not isinstance(boosting_cache_size, int):
+            raise TypeError(f"boosting_cache_size={boosting_cache_size!r}")
+        elif boosting_cache_size < 0:
+            raise ValueError(f"boosting_cache_size={boosting_cache_size!r}; needs to be >= 0")
+        new['boosting_cache_size'] = boosting_cache_size
+
+    if not new.get('persistent_workers', True) or new.get('n_workers', CONFIG['n_workers']) != CONFIG['n_workers'] or new.get('executor', CONFIG['executor']) != CONFIG['executor']:
+        from ._utils.parallel import shutdown_worker_pool
+        shutdown_worker_pool()
 
     CONFIG.update(new)
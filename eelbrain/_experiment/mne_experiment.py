@@ -3592,7 +3592,9 @@ class MneExperiment(FileTree):
             Number of random permutations of the data used to determine cluster
             *p*-values (default 10'000). If the test is already cached with a
             number ≥ ``samples`` the cached version is returned, otherwise the
-            test is recomputed.
+            test is recomputed (for mass-univariate tests, permutations from
+            the cached version are reused and only the additional permutations
+            are computed).
         data : str
             Data to test, for example:
 
@@ -3646,6 +3648,7 @@ class MneExperiment(FileTree):
 
         # try to load cached test
         res = None
+        resume = None  # cached test with fewer permutations
         desc = self._get_rel('test-file', 'test-dir')
         if self._result_file_mtime(dst, data):
             try:
@@ -3665,6 +3668,8 @@ class MneExperiment(FileTree):
                                   "make=True to perform the test." %
                                   (desc, res.samples, samples))
                 else:
+                    if isinstance(res, testnd.NDTest) and res.samples > 0:
+                        resume = res
                     res = None
         elif not make and exists(dst):
             raise IOError("The requested test is outdated: %s. Set make=True "
@@ -3717,7 +3722,11 @@ class MneExperiment(FileTree):
                 raise ValueError(f"data={data.string!r}")
 
             if do_test:
-                self._log.info("Make test: %s", desc)
+                if resume is None:
+                    self._log.info("Make test: %s", desc)
+                else:
+                    self._log.info("Extend test from samples=%i: %s", resume.samples, desc)
+                    test_kwargs['resume'] = resume
                 res = self._make_test(data.y_name, res_data, test_obj, test_kwargs)
 
         if do_test:
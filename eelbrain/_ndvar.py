@@ -235,7 +235,7 @@ def parallel_convolve(
         convolve_jit(h_flat[i_h], x_flat[i_x], out_flat[i_x, i_h], i_start, i_stop)
 
 
-@njit
+@njit(nogil=True)
 def convolve_jit(
         h: np.ndarray,  # n_h, n_h_times
         x: np.ndarray,  # n_h, n_x_times
@@ -54,6 +54,12 @@ class Connectivity:
             if ctype != 'grid':
                 self.struct[(slice(None),) * i + (slice(None, None, 2),)] = False
 
+    @property
+    def grid(self):
+        "For each axis, whether neighbors along the axis are connected"
+        ndim = self.struct.ndim
+        return np.array([self.struct[(1,) * ax + (0,) + (1,) * (ndim - ax - 1)] for ax in range(ndim)], np.int8)
+
     def __getstate__(self):
         return {k: getattr(self, k) for k in self.__slots__}
 
@@ -5,100 +5,6 @@ import numpy as np
 cimport numpy as np
 
 
-def merge_labels(
-        np.npy_uint32[:,:] cmap,
-        long n_labels_in,
-        const np.npy_uint32[:,:] edges,
-        const np.npy_int64[:] edge_start,
-        const np.npy_int64[:] edge_stop,
-):
-    """Mrge adjacent labels with non-standard connectivity
-
-    Parameters
-    ----------
-    cmap : array of int, ndim=2
-        Array with labels, labels are merged along the second axis; cmap is
-        modified in-place.
-    n_labels_in : int
-        Number of labels in cmap.
-    edges : array of int (n_edges, 2)
-        Edges of the connectivity graph.
-    edge_start : array, (n_nodes,)
-        Index from node into edges starting with that node.
-    edge_stop : array, (n_nodes,)
-        Index from node into edges starting with that node.
-    """
-    cdef unsigned int slice_i, i, dst_i, edge_i
-    cdef unsigned int n_vert = cmap.shape[0]
-    cdef unsigned int n_slices = cmap.shape[1]
-    cdef unsigned int label, connected_label, src, dst
-    cdef unsigned int relabel_src, relabel_dst
-
-    n_labels_in += 1
-    cdef unsigned int* relabel = <unsigned int*> malloc(sizeof(unsigned int) * n_labels_in)
-    for i in range(n_labels_in):
-        relabel[i] = i
-
-    # find targets for relabeling
-    for slice_i in range(n_slices):
-        for src in range(n_vert):
-            label = cmap[src, slice_i]
-            if label == 0:
-                continue
-
-            for edge_i in range(edge_start[src], edge_stop[src]):
-                dst = edges[edge_i, 1]
-                connected_label = cmap[dst, slice_i]
-                if connected_label == 0:
-                    continue
-
-                while relabel[label] < label:
-                    label = relabel[label]
-
-                while relabel[connected_label] < connected_label:
-                    connected_label = relabel[connected_label]
-
-                if label > connected_label:
-                    relabel_src = label
-                    relabel_dst = connected_label
-                else:
-                    relabel_src = connected_label
-                    relabel_dst = label
-
-                relabel[relabel_src] = relabel_dst
-
-    # find lowest labels
-    cdef int n_labels_out = -1
-    for i in range(n_labels_in):
-        relabel_dst = relabel[i]
-        if relabel_dst == i:
-            n_labels_out += 1
-        else:
-            while relabel[relabel_dst] < relabel_dst:
-                relabel_dst = relabel[relabel_dst]
-            relabel[i] = relabel_dst
-
-    # relabel cmap
-    for i in range(n_vert):
-        for slice_i in range(n_slices):
-            label = cmap[i, slice_i]
-            if label != 0:
-                relabel_dst = relabel[label]
-                if relabel_dst != label:
-                    cmap[i, slice_i] = relabel_dst
-
-    # find all label ids in cmap
-    out = np.empty(n_labels_out, dtype=np.uint32)
-    dst_i = 0
-    for i in range(1, n_labels_in):
-        if i == relabel[i]:
-            out[dst_i] = i
-            dst_i += 1
-
-    free(relabel)
-    return out
-
-
 def tfce_increment(
         const np.npy_uint32[:] labels,
         const np.npy_uint32[:] label_image,
@@ -133,3 +39,317 @@ def tfce_increment(
             image[i] += area[cid]
 
     free(area)
+
+
+cdef inline Py_ssize_t _find(Py_ssize_t *parent, Py_ssize_t i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+cdef inline void _union_min(Py_ssize_t *parent, Py_ssize_t i, Py_ssize_t j):
+    # merge the trees of i and j, keeping the smaller root
+    i = _find(parent, i)
+    j = _find(parent, j)
+    if i < j:
+        parent[j] = i
+    elif j < i:
+        parent[i] = j
+
+
+def label_sparse(
+        np.npy_uint32[:] cmap,
+        const np.npy_intp[:] index,
+        const np.npy_intp[:] shape,
+        const np.npy_int8[:] grid,
+        const np.npy_uint32[:,:] edges,
+        const np.npy_int64[:] edge_start,
+        const np.npy_int64[:] edge_stop,
+):
+    """Label clusters among supra-threshold voxels with custom connectivity
+
+    Only the voxels in ``index`` are visited. Cluster ids are the same as
+    those from labeling the grid connectivity with :func:`ndimage.label` and
+    merging labels connected through custom edges to the lowest label: each
+    cluster is identified by the ``ndimage.label`` id of the grid component
+    that contains its first voxel.
+
+    Parameters
+    ----------
+    cmap : array of uint32 (n_voxels,)
+        Flattened cluster map; needs to be 0 everywhere on input, cluster ids
+        are written to the voxels in ``index``.
+    index : array of intp (n_active,)
+        Flat indices of the supra-threshold voxels, in ascending order.
+    shape : array of intp (n_dims,)
+        Shape of the cluster map.
+    grid : array of int8 (n_dims,)
+        Whether each axis has grid connectivity.
+    edges : array of int (n_edges, 2)
+        Custom connectivity along the first axis, sorted by source.
+    edge_start : array, (n_nodes,)
+        Index from node into edges starting with that node.
+    edge_stop : array, (n_nodes,)
+        Index from node into edges starting with that node.
+
+    Returns
+    -------
+    cluster_ids : array of uint32
+        Sorted cluster ids.
+    """
+    cdef Py_ssize_t i, j, k, r, ax, edge_i, vert, rest
+    cdef np.npy_uint32 n_labels = 0
+    cdef Py_ssize_t n_clusters = 0
+
+    cdef Py_ssize_t n = cmap.shape[0]
+    cdef Py_ssize_t n_active = index.shape[0]
+    cdef Py_ssize_t n_dims = shape.shape[0]
+    cdef Py_ssize_t vert_stride = n // shape[0]
+    cdef Py_ssize_t *strides = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_dims)
+    cdef Py_ssize_t *parent = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+    cdef np.npy_uint32 *label = <np.npy_uint32*> malloc(sizeof(np.npy_uint32) * n_active)
+
+    strides[n_dims - 1] = 1
+    for ax in range(n_dims - 1, 0, -1):
+        strides[ax - 1] = strides[ax] * shape[ax]
+    # temporarily mark each active voxel with its position in index + 1
+    for k in range(n_active):
+        cmap[index[k]] = k + 1
+        parent[k] = k
+
+    # grid components, numbered in order of their first voxel like ndimage.label
+    for k in range(n_active):
+        i = index[k]
+        for ax in range(n_dims):
+            if grid[ax] and (i // strides[ax]) % shape[ax] < shape[ax] - 1:
+                j = cmap[i + strides[ax]]
+                if j:
+                    _union_min(parent, k, j - 1)
+    for k in range(n_active):
+        if _find(parent, k) == k:
+            n_labels += 1
+            label[k] = n_labels
+
+    # merge through custom edges; the root of each cluster is its first
+    # voxel, which belongs to the grid component with the lowest id
+    for k in range(n_active):
+        i = index[k]
+        vert = i // vert_stride
+        rest = i - vert * vert_stride
+        for edge_i in range(edge_start[vert], edge_stop[vert]):
+            j = cmap[edges[edge_i, 1] * vert_stride + rest]
+            if j:
+                _union_min(parent, k, j - 1)
+
+    for k in range(n_active):
+        if parent[k] == k:
+            n_clusters += 1
+    out = np.empty(n_clusters, np.uint32)
+    cdef np.npy_uint32[:] cids = out
+    n_clusters = 0
+    for k in range(n_active):
+        r = _find(parent, k)
+        if r == k:
+            cids[n_clusters] = label[k]
+            n_clusters += 1
+        cmap[index[k]] = label[r]
+
+    free(strides)
+    free(parent)
+    free(label)
+    return out
+
+
+def tfce_sweep(
+        const np.npy_float64[:] x,
+        const np.npy_intp[:] order,
+        const np.npy_float64[:] heights,
+        const np.npy_float64[:] h_factors,
+        double e,
+        const np.npy_intp[:] shape,
+        const np.npy_int8[:] grid,
+        const np.npy_uint32[:,:] edges,
+        const np.npy_int64[:] edge_start,
+        const np.npy_int64[:] edge_stop,
+        np.npy_float64[:] out,
+):
+    """Threshold-free cluster enhancement with a single sweep over heights
+
+    Voxels are added to a union-find structure in order of descending value,
+    so that the clusters at each height are available without labeling the
+    thresholded map. The contribution of each cluster at each height is
+    summed in order of ascending height, as in the labeling implementation.
+
+    Parameters
+    ----------
+    x : array (n_voxels,)
+        Flattened statistical map (negative tail: inverted map).
+    order : array of intp (n_active,)
+        Indices of all voxels with ``x >= heights[0]``, sorted by descending
+        ``x``.
+    heights : array (n_steps,)
+        Cluster-forming thresholds in ascending order.
+    h_factors : array (n_steps,)
+        Height factor for each threshold (``height ** h``).
+    e : scalar
+        Cluster extent exponent.
+    shape : array of intp (n_dims,)
+        Shape of the statistical map.
+    grid : array of int8 (n_dims,)
+        Whether each axis has grid connectivity.
+    edges : array of int (n_edges, 2)
+        Custom connectivity along the first axis, including both directions
+        for each edge, sorted by source.
+    edge_start : array, (n_nodes,)
+        Index from node into edges starting with that node.
+    edge_stop : array, (n_nodes,)
+        Index from node into edges starting with that node.
+    out : array (n_voxels,)
+        Output; the TFCE value is written to every voxel in ``order``.
+    """
+    cdef Py_ssize_t i, j, ri, rj, r, k, ax, coord, i_order, i_new, t, c, s, step
+    cdef Py_ssize_t n_touched, n_closed, n_neighbors, edge_i, vert, rest
+    cdef double v, area
+
+    cdef Py_ssize_t n = x.shape[0]
+    cdef Py_ssize_t n_active = order.shape[0]
+    cdef Py_ssize_t n_steps = heights.shape[0]
+    cdef Py_ssize_t n_dims = shape.shape[0]
+    cdef Py_ssize_t vert_stride = n // shape[0]
+    cdef bint custom = edges.shape[0] > 0
+    if n_active == 0:
+        return
+
+    cdef Py_ssize_t max_neighbors = 2 * n_dims
+    if custom:
+        for vert in range(shape[0]):
+            if edge_stop[vert] - edge_start[vert] > max_neighbors - 2 * n_dims:
+                max_neighbors = 2 * n_dims + edge_stop[vert] - edge_start[vert]
+    cdef Py_ssize_t *neighbors = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * max_neighbors)
+    cdef Py_ssize_t *strides = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_dims)
+    # union-find over voxels
+    cdef Py_ssize_t *parent = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n)
+    cdef Py_ssize_t *size = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n)
+    cdef Py_ssize_t *open_rec = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n)
+    # voxels and records changed in the current step
+    cdef Py_ssize_t *touched = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+    cdef Py_ssize_t *closed_rec = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+    cdef Py_ssize_t *closed_root = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+    # record for each cluster between changes: cluster size for heights
+    # rec_lo to rec_hi; smaller heights are represented by rec_parent
+    cdef Py_ssize_t *rec_size = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+    cdef Py_ssize_t *rec_lo = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+    cdef Py_ssize_t *rec_hi = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+    cdef Py_ssize_t *rec_parent = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+    cdef double *acc = <double*> malloc(sizeof(double) * n_active)
+    # record at the height at which each voxel was added
+    cdef Py_ssize_t *leaf = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n_active)
+
+    strides[n_dims - 1] = 1
+    for ax in range(n_dims - 1, 0, -1):
+        strides[ax - 1] = strides[ax] * shape[ax]
+    for i in range(n):
+        parent[i] = -1
+
+    cdef Py_ssize_t n_rec = 0
+    i_order = 0
+    for step in range(n_steps - 1, -1, -1):
+        n_touched = 0
+        n_closed = 0
+        i_new = i_order
+        while i_order < n_active and x[order[i_order]] >= heights[step]:
+            i = order[i_order]
+            i_order += 1
+            parent[i] = i
+            size[i] = 1
+            open_rec[i] = -1
+            touched[n_touched] = i
+            n_touched += 1
+            # find active neighbors
+            n_neighbors = 0
+            for ax in range(n_dims):
+                if grid[ax]:
+                    coord = (i // strides[ax]) % shape[ax]
+                    if coord > 0:
+                        neighbors[n_neighbors] = i - strides[ax]
+                        n_neighbors += 1
+                    if coord < shape[ax] - 1:
+                        neighbors[n_neighbors] = i + strides[ax]
+                        n_neighbors += 1
+            if custom:
+                vert = i // vert_stride
+                rest = i - vert * vert_stride
+                for edge_i in range(edge_start[vert], edge_stop[vert]):
+                    neighbors[n_neighbors] = edges[edge_i, 1] * vert_stride + rest
+                    n_neighbors += 1
+            # merge clusters
+            for c in range(n_neighbors):
+                j = neighbors[c]
+                if parent[j] < 0:
+                    continue
+                ri = _find(parent, i)
+                rj = _find(parent, j)
+                if ri == rj:
+                    continue
+                if open_rec[ri] >= 0:
+                    closed_rec[n_closed] = open_rec[ri]
+                    closed_root[n_closed] = ri
+                    n_closed += 1
+                    open_rec[ri] = -1
+                if open_rec[rj] >= 0:
+                    closed_rec[n_closed] = open_rec[rj]
+                    closed_root[n_closed] = rj
+                    n_closed += 1
+                    open_rec[rj] = -1
+                if size[ri] < size[rj]:
+                    ri, rj = rj, ri
+                parent[rj] = ri
+                size[ri] += size[rj]
+
+        # new records for clusters that changed
+        for t in range(n_touched):
+            r = _find(parent, touched[t])
+            if open_rec[r] < 0:
+                rec_size[n_rec] = size[r]
+                rec_lo[n_rec] = 0
+                rec_hi[n_rec] = step
+                rec_parent[n_rec] = -1
+                open_rec[r] = n_rec
+                n_rec += 1
+        for c in range(n_closed):
+            k = closed_rec[c]
+            rec_parent[k] = open_rec[_find(parent, closed_root[c])]
+            rec_lo[k] = step + 1
+        for t in range(i_new, i_order):
+            leaf[t] = open_rec[_find(parent, order[t])]
+
+    # sum contributions in order of ascending height (parents are created
+    # after their children)
+    for k in range(n_rec - 1, -1, -1):
+        if rec_parent[k] >= 0:
+            v = acc[rec_parent[k]]
+        else:
+            v = 0
+        area = (<double> rec_size[k]) ** e
+        for s in range(rec_lo[k], rec_hi[k] + 1):
+            v += area * h_factors[s]
+        acc[k] = v
+
+    for t in range(n_active):
+        out[order[t]] = acc[leaf[t]]
+
+    free(neighbors)
+    free(strides)
+    free(parent)
+    free(size)
+    free(open_rec)
+    free(touched)
+    free(closed_rec)
+    free(closed_root)
+    free(rec_size)
+    free(rec_lo)
+    free(rec_hi)
+    free(rec_parent)
+    free(acc)
+    free(leaf)
@@ -325,6 +325,8 @@ class _NDANOVA:
         self.dfs_nom = [e.df for e in effects]
         self.dfs_denom = dfs_denom
         self._flat_f_map = None
+        self._flat_f_maps_block = None
+        self._block_buffers = {}
 
     def __repr__(self):
         return '%s(%s)' % (self.__class__.__name__, self.x.name)
@@ -353,7 +355,7 @@ class _NDANOVA:
         # find result container
         if self._flat_f_map is None:
             shape = (self.n_effects,) + y.shape[1:]
-            f_map = np.empty(shape)
+            f_map = np.empty(shape, y.dtype)
             flat_f_map = f_map.reshape((self.n_effects, -1))
         else:
             f_map = None
@@ -368,6 +370,90 @@ class _NDANOVA:
     def _map(self, y, flat_f_map, perm):
         raise NotImplementedError
 
+    def map_block(self, y, perms):
+        """Fit the model to a block of permutations of ``y``
+
+        Parameters
+        ----------
+        y : np.array (n_cases, ...)
+            Dependent variable (as for :meth:`map`).
+        perms : array (n_perm, n_cases)
+            Permutations, one per row.
+
+        Returns
+        -------
+        f_maps : array (n_effects, n_perm, ...)
+            F-maps for each permutation (``None`` if the output container was
+            allocated with :meth:`preallocate`).
+
+        Notes
+        -----
+        Each model is factorized once into projectors whose output has the
+        relevant sum of squares as squared norm. Permuting ``y`` is equivalent
+        to permuting the columns of these projectors, so the sums of squares
+        for all permutations in the block are computed with one matrix product
+        per projector.
+        """
+        if y.shape[0] != self._n_obs:
+            raise ValueError("y has wrong number of observations (%i, model "
+                             "has %i)" % (y.shape[0], self._n_obs))
+
+        # find result container
+        n_perm = len(perms)
+        flat_f_maps = self._flat_f_maps_block
+        if flat_f_maps is None or flat_f_maps.shape[1] < n_perm or flat_f_maps.shape[2] != y[0].size:
+            f_maps = np.empty((self.n_effects, n_perm, *y.shape[1:]), y.dtype)
+            flat_f_maps = f_maps.reshape((self.n_effects, n_perm, -1))
+        else:
+            f_maps = None
+            flat_f_maps = flat_f_maps[:, :n_perm]
+
+        if y.ndim > 2:
+            y = y.reshape((self._n_obs, -1))
+        # sums of squares are computed from centered data to avoid cancellation
+        y_c = self._buffer('y', y.shape, y.dtype)
+        np.subtract(y, y.mean(0), y_c)
+        ss_total = self._buffer('SS_total', y.shape[1:], y.dtype)
+        np.einsum('ij,ij->j', y_c, y_c, out=ss_total)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._map_block(y_c, ss_total, flat_f_maps, perms)
+        # zero variance (consistent with opt.anova_fmaps())
+        flat_f_maps[..., ss_total == 0] = 0
+        return f_maps
+
+    def _map_block(self, y, ss_total, flat_f_maps, perms):
+        raise NotImplementedError
+
+    def _buffer(self, key, shape, dtype):
+        "Reusable work array for :meth:`map_block`"
+        n = int(np.prod(shape))
+        buf = self._block_buffers.get(key)
+        if buf is None or buf.size < n or buf.dtype != dtype:
+            buf = self._block_buffers[key] = np.empty(n, dtype)
+        return buf[:n].reshape(shape)
+
+    def _projection_ss(self, projector, y, perms, out):
+        """Squared norm of ``projector[:, perm] @ y`` for each permutation
+
+        Parameters
+        ----------
+        projector : array (k, n_cases)
+            Projector.
+        y : array (n_cases, n_tests)
+            Data.
+        perms : array (n_perm, n_cases)
+            Permutations.
+        out : array (n_perm, n_tests)
+            Container for the result.
+        """
+        n_perm = len(perms)
+        n_rows = len(projector) * n_perm
+        x = projector[:, perms].reshape((n_rows, self._n_obs)).astype(y.dtype, copy=False)
+        proj = self._buffer('projection', (n_rows, y.shape[1]), y.dtype)
+        np.dot(x, y, proj)
+        np.square(proj, proj)
+        proj.reshape((-1, n_perm, y.shape[1])).sum(0, out=out)
+
     def p_maps(self, f_maps):
         """Convert F-maps for uncorrected p-maps
 
@@ -386,7 +472,7 @@ class _NDANOVA:
             p_maps[i] = ftest_p(f_maps[i], self.dfs_nom[i], self.dfs_denom[i])
         return p_maps
 
-    def preallocate(self, y_shape):
+    def preallocate(self, y_shape, dtype=np.float64, block_size=None):
         """Pre-allocate an output array container.
 
         Parameters
@@ -394,16 +480,28 @@ class _NDANOVA:
         y_shape : tuple
             Data shape (excluding case), will allow preallocation of containers
             for results.
+        dtype : numpy.dtype
+            Data type of ``y`` in subsequent calls to :meth:`map`.
+        block_size : int
+            Pre-allocate a container for :meth:`map_block` with blocks of up
+            to ``block_size`` permutations.
 
         Returns
         -------
         f_maps : array
             Properly shaped output array. Every time .map() is called, the
             content of this array will change (and map() will not return
-            anything)
+            anything). With ``block_size``, the array has shape
+            ``(n_effects, block_size, ...)`` and is filled by
+            :meth:`map_block`.
         """
+        if block_size:
+            shape = (self.n_effects, block_size) + y_shape
+            f_maps = np.empty(shape, dtype)
+            self._flat_f_maps_block = f_maps.reshape((self.n_effects, block_size, -1))
+            return f_maps
         shape = (self.n_effects,) + y_shape
-        f_map = np.empty(shape)
+        f_map = np.empty(shape, dtype)
         self._flat_f_map = f_map.reshape((self.n_effects, -1))
         return f_map
 
@@ -433,6 +531,16 @@ class _BalancedNDANOVA(_NDANOVA):
     def _map_balanced(self, y, flat_f_map, x_full, xsinv):
         raise NotImplementedError
 
+    @LazyProperty
+    def _effect_projectors(self):
+        # with G = L @ L.T, SS = b.T @ G @ b = |L.T @ b|^2
+        projectors = []
+        for start, df in self._effect_to_beta:
+            x = self.p.x[:, start: start + df]
+            l = np.linalg.cholesky(x.T.dot(x))
+            projectors.append(l.T.dot(self.p.projector[start: start + df]))
+        return projectors
+
 
 class _BalancedFixedNDANOVA(_BalancedNDANOVA):
     "For balanced but not fully specified models"
@@ -451,6 +559,20 @@ class _BalancedFixedNDANOVA(_BalancedNDANOVA):
         anova_fmaps(y, x_full, xsinv, flat_f_map, self._effect_to_beta,
                     self.df_error)
 
+    @LazyProperty
+    def _basis(self):
+        return _orthonormal_basis(self.p.x)
+
+    def _map_block(self, y, ss_total, flat_f_maps, perms):
+        MS_res = self._buffer('MS_res', (len(perms), y.shape[1]), y.dtype)
+        self._projection_ss(self._basis, y, perms, MS_res)
+        np.subtract(ss_total, MS_res, MS_res)
+        MS_res /= self.df_error
+        for projector, df, f_map in zip(self._effect_projectors, self.dfs_nom, flat_f_maps):
+            self._projection_ss(projector, y, perms, f_map)
+            f_map /= df
+            f_map /= MS_res
+
 
 class _BalancedMixedNDANOVA(_BalancedNDANOVA):
     """For balanced, fully specified models.
@@ -474,11 +596,24 @@ class _BalancedMixedNDANOVA(_BalancedNDANOVA):
         dfs_denom = tuple(df_den[i] for i in keep)
         _BalancedNDANOVA.__init__(self, x, effects, dfs_denom)
         self._e_ms_array = _hopkins_ems_array(x)
+        self._keep = keep
 
     def _map_balanced(self, y, flat_f_map, x_full, xsinv):
         anova_full_fmaps(y, x_full, xsinv, flat_f_map, self._effect_to_beta,
                          self._e_ms_array)
 
+    def _map_block(self, y, ss_total, flat_f_maps, perms):
+        MS = self._buffer('MS', (len(self._effect_to_beta), len(perms), y.shape[1]), y.dtype)
+        for projector, (_, df), MS_effect in zip(self._effect_projectors, self._effect_to_beta, MS):
+            self._projection_ss(projector, y, perms, MS_effect)
+            MS_effect /= df
+        for i, f_map in zip(self._keep, flat_f_maps):
+            i_ms, *i_ms_others = np.flatnonzero(self._e_ms_array[i])
+            np.copyto(f_map, MS[i_ms])
+            for i_ms in i_ms_others:
+                f_map += MS[i_ms]
+            np.divide(MS[i], f_map, f_map)
+
 
 class _IncrementalNDANOVA(_NDANOVA):
     def __init__(self, x):
@@ -504,21 +639,23 @@ class _IncrementalNDANOVA(_NDANOVA):
             self._x_orig[-1] = None
         self._x_perm = None
 
-    def preallocate(self, y_shape):
-        f_map = _NDANOVA.preallocate(self, y_shape)
+    def preallocate(self, y_shape, dtype=np.float64, block_size=None):
+        f_map = _NDANOVA.preallocate(self, y_shape, dtype, block_size)
+        if block_size:
+            return f_map
 
         shape = self._flat_f_map.shape[1]
-        self._SS_diff = np.empty(shape)
-        self._MS_e = np.empty(shape)
-        self._SS_res = {i: np.empty(shape) for i in self._x_orig.keys()}
+        self._SS_diff = np.empty(shape, dtype)
+        self._MS_e = np.empty(shape, dtype)
+        self._SS_res = {i: np.empty(shape, dtype) for i in self._x_orig.keys()}
         return f_map
 
     def _map(self, y, flat_f_map, perm):
         if self._SS_diff is None:
             shape = y.shape[1]
-            SS_diff = MS_diff = np.empty(shape)
-            MS_e = np.empty(shape)
-            SS_res = {i: np.empty(shape) for i in self._x_orig.keys()}
+            SS_diff = MS_diff = np.empty(shape, y.dtype)
+            MS_e = np.empty(shape, y.dtype)
+            SS_res = {i: np.empty(shape, y.dtype) for i in self._x_orig.keys()}
         else:
             SS_diff = MS_diff = self._SS_diff
             MS_e = self._MS_e
@@ -563,6 +700,45 @@ class _IncrementalNDANOVA(_NDANOVA):
             np.divide(SS_diff, df_diff, MS_diff)
             np.divide(MS_diff, MS_e, flat_f_map[i])
 
+    @LazyProperty
+    def _bases(self):
+        return {i: None if x is None else _orthonormal_basis(x[0]) for i, x in self._x_orig.items()}
+
+    def _map_block(self, y, ss_total, flat_f_maps, perms):
+        shape = (len(perms), y.shape[1])
+        SS_diff = MS_diff = self._buffer('SS_diff', shape, y.dtype)
+        MS_e = self._buffer('MS_e', shape, y.dtype)
+
+        # calculate SS_res for all models
+        SS_res = {}
+        for i, basis in self._bases.items():
+            if basis is None:
+                SS_res[i] = ss_total
+            else:
+                SS_res[i] = self._buffer(('SS_res', i), shape, y.dtype)
+                self._projection_ss(basis, y, perms, SS_res[i])
+                np.subtract(ss_total, SS_res[i], SS_res[i])
+
+        # incremental comparisons
+        if not self._comparisons.mixed:
+            np.divide(SS_res[0], self.x.df_error, MS_e)
+        for i, (i_test, (i1, i0)) in enumerate(self._comparisons.comparisons.items()):
+            if self._comparisons.mixed:
+                i_ems = self._comparisons.ems_idx[i_test]
+                np.subtract(SS_res[self._full_ss_i], SS_res[i_ems], MS_e)
+                np.divide(MS_e, self.dfs_denom[i], MS_e)
+            df_diff = self._comparisons.x.effects[i_test].df
+            np.subtract(SS_res[i0], SS_res[i1], SS_diff)
+            np.divide(SS_diff, df_diff, MS_diff)
+            np.divide(MS_diff, MS_e, flat_f_maps[i])
+
+
+def _orthonormal_basis(x):
+    "Orthonormal basis for the column space of ``x``, as rows (k, n_cases)"
+    u, s, _ = np.linalg.svd(x, full_matrices=False)
+    rank = np.sum(s > s[0] * max(x.shape) * np.finfo(s.dtype).eps)
+    return u[:, :rank].T.copy()
+
 
 def effect_id(effects):
     return tuple(map(id, effects))
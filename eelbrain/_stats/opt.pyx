@@ -1,15 +1,16 @@
 # optimized statistics functions
 # cython: language_level=3, boundscheck=False, wraparound=False
+from cython cimport floating
 from cython.view cimport array as cvarray
 from libc.stdlib cimport malloc, free
 cimport numpy as np
 
 
 def anova_full_fmaps(
-        const np.npy_float64[:,:] y,
+        const floating[:,:] y,
         const np.npy_float64[:,:] x,
         const np.npy_float64[:,:] xsinv,
-        np.npy_float64[:,:] f_map,
+        floating[:,:] f_map,
         const np.npy_int64[:,:] effects,
         const np.npy_int8[:, :] e_ms,
 ):
@@ -78,10 +79,10 @@ def anova_full_fmaps(
     free(mss)
 
 
-def anova_fmaps(const np.npy_float64[:,:] y,
+def anova_fmaps(const floating[:,:] y,
                 const np.npy_float64[:,:] x,
                 const np.npy_float64[:,:] xsinv,
-                np.npy_float64[:,:] f_map,
+                floating[:,:] f_map,
                 const np.npy_int64[:,:] effects,
                 int df_res):
     """Compute f-maps for a balanced ANOVA model with residuals
@@ -180,8 +181,8 @@ def sum_square(
 
 
 def ss(
-        const np.npy_float64[:,:] y,
-        np.npy_float64[:] out,
+        const floating[:,:] y,
+        floating[:] out,
 ):
     """Compute sum squares in the data (after subtracting the intercept)
 
@@ -215,7 +216,7 @@ def ss(
 
 
 cdef int zero_variance(
-        const np.npy_float64[:,:] y,
+        const floating[:,:] y,
         unsigned long i,
 ):
     """Check whether a column of y has zero variance"""
@@ -229,7 +230,7 @@ cdef int zero_variance(
 
 
 cdef void _lm_betas(
-        const np.npy_float64[:,:] y,
+        const floating[:,:] y,
         unsigned long i,
         const np.npy_float64[:,:] xsinv,
         double *betas,
@@ -262,7 +263,7 @@ cdef void _lm_betas(
 
 
 cdef double _lm_res_ss(
-        const np.npy_float64[:,:] y,
+        const floating[:,:] y,
         int i,
         const np.npy_float64[:,:] x,
         int df_x,
@@ -297,10 +298,10 @@ cdef double _lm_res_ss(
 
 
 def lm_res(
-        const np.npy_float64[:,:] y,
+        const floating[:,:] y,
         const np.npy_float64[:,:] x,
         const np.npy_float64[:,:] xsinv,
-        np.npy_float64[:,:] res,
+        floating[:,:] res,
 ):
     """Fit a linear model and compute the residuals
 
@@ -338,10 +339,10 @@ def lm_res(
 
 
 def lm_res_ss(
-        const np.npy_float64[:,:] y,
+        const floating[:,:] y,
         const np.npy_float64[:,:] x,
         const np.npy_float64[:,:] xsinv,
-        np.npy_float64[:] ss,
+        floating[:] ss,
 ):
     """Fit a linear model and compute the residual sum squares
 
@@ -411,8 +412,8 @@ def t_1samp(
 
 
 def t_1samp_perm(
-        const np.npy_float64[:,:] y,
-        np.npy_float64[:] out,
+        const floating[:,:] y,
+        floating[:] out,
         const np.npy_int8[:] sign,
 ):
     """T-values for 1-sample t-test
@@ -457,9 +458,70 @@ def t_1samp_perm(
             out[i] = 0
 
 
+def t_1samp_perm_block(
+        const floating[:,:] y,
+        floating[:,:] out,
+        const np.npy_int8[:,:] signs,
+):
+    """T-values for 1-sample t-test for a block of permutations
+
+    Parameters
+    ----------
+    y : array (n_cases, n_tests)
+        Dependent Measurement.
+    out : array (n_perm, n_tests)
+        Container for output.
+    signs : array (n_perm, n_cases)
+        The randomly asigned sign for each case, one row per permutation.
+
+    Notes
+    -----
+    Each data column is read once for the whole block; the arithmetic for each
+    permutation is identical to :func:`t_1samp_perm`.
+    """
+    cdef unsigned long i, case, i_perm
+    cdef double mean, denom
+
+    cdef unsigned long n_tests = y.shape[1]
+    cdef unsigned int n_cases = y.shape[0]
+    cdef unsigned long n_perm = signs.shape[0]
+    cdef double div = (n_cases - 1) * n_cases
+    cdef double *y_buffer = <double *>malloc(sizeof(double) * n_cases)
+    cdef double *case_buffer = <double *>malloc(sizeof(double) * n_cases)
+
+    for i in range(n_tests):
+        for case in range(n_cases):
+            y_buffer[case] = y[case, i]
+
+        for i_perm in range(n_perm):
+            for case in range(n_cases):
+                case_buffer[case] = y_buffer[case] * signs[i_perm, case]
+
+            # mean
+            mean = 0
+            for case in range(n_cases):
+                mean += case_buffer[case]
+            mean /= n_cases
+
+            # variance
+            denom = 0
+            for case in range(n_cases):
+                denom += (case_buffer[case] - mean) ** 2
+
+            denom /= div
+            denom **= 0.5
+            if denom > 0:
+                out[i_perm, i] = mean / denom
+            else:
+                out[i_perm, i] = 0
+
+    free(y_buffer)
+    free(case_buffer)
+
+
 def t_ind(
-        const np.npy_float64[:,:] y,
-        np.npy_float64[:] out,
+        const floating[:,:] y,
+        floating[:] out,
         const np.npy_int8[:] group,
 ):
     "Indpendent-samples t-test, assuming equal variance"
@@ -1,12 +1,11 @@
 # Author: Christian Brodbeck <christianbrodbeck@nyu.edu>
-from itertools import chain, repeat
-from math import ceil, pi, sin
+from itertools import islice, repeat
+from math import pi, sin
 import random
 
 import numpy as np
 
 from .._data_obj import NDVar, Var, NestedEffect
-from .._utils import intervals
 from . import vector
 
 
@@ -47,7 +46,7 @@ def _resample_params(N, samples):
     return n_samples, samples
 
 
-def permute_order(n, samples=10000, replacement=False, unit=None, rng=None):
+def permute_order(n, samples=10000, replacement=False, unit=None, rng=None, skip=0):
     """Generator function to create indices to shuffle n items
 
     Parameters
@@ -66,6 +65,9 @@ def permute_order(n, samples=10000, replacement=False, unit=None, rng=None):
         within units (no replacement).
     rng : numpy.random.RandomState
         Random number generator. By default, a random state with seed 0 is used.
+    skip : int
+        Skip the first ``skip`` of the ``samples`` permutations (to resume a
+        previous permutation sequence).
 
     Returns
     -------
@@ -76,6 +78,10 @@ def permute_order(n, samples=10000, replacement=False, unit=None, rng=None):
     if samples < 0:
         raise NotImplementedError("Complete permutation for resampling through reordering")
 
+    if skip:
+        yield from islice(permute_order(n, samples, replacement, unit, rng), skip, None)
+        return
+
     if _YIELD_ORIGINAL:
         original = np.arange(n)
         for _ in range(samples):
@@ -114,7 +120,33 @@ def permute_order(n, samples=10000, replacement=False, unit=None, rng=None):
             yield idx_perm
 
 
-def permute_sign_flip(n, samples=10000, rng=None, out=None):
+def _random_sign_flip_sequences(n, rng):
+    """Iterate over distinct random non-zero ``n`` bit integers
+
+    The first ``k`` values are the same as ``rng.sample(range(1, 2 ** n), k)``
+    (with the partial shuffle method for ``n <= 16``, and the rejection
+    sampling method otherwise), but the sequence does not depend on ``k``, so
+    that shorter sequences are always the beginning of longer sequences.
+    """
+    n_perm_possible = 2 ** n
+    if n <= 16:
+        pool = list(range(1, n_perm_possible))
+        n_pool = len(pool)
+        for i in range(n_pool):
+            j = rng.randrange(n_pool - i)
+            yield pool[j]
+            pool[j] = pool[n_pool - i - 1]
+    else:
+        used = set()
+        while True:
+            j = rng.randrange(n_perm_possible - 1)
+            while j in used:
+                j = rng.randrange(n_perm_possible - 1)
+            used.add(j)
+            yield j + 1
+
+
+def permute_sign_flip(n, samples=10000, rng=None, out=None, skip=0):
     """Iterate over indices for ``samples`` permutations of the data
 
     Parameters
@@ -128,6 +160,10 @@ def permute_sign_flip(n, samples=10000, rng=None, out=None):
         Random number generator.
     out : array of int8  (n,)
         Buffer for the ``sign`` variable that is yielded in each iteration.
+    skip : int
+        Skip the first ``skip`` of the ``samples`` permutations (to resume a
+        previous permutation sequence; the sequence for a given ``rng`` does not
+        depend on ``samples``).
 
     Yields
     ------
@@ -144,25 +180,15 @@ def permute_sign_flip(n, samples=10000, rng=None, out=None):
     else:
         assert out.shape == (n,)
 
-    if n > 62:  # Python 2 limit for xrange
-        if samples < 0:
-            raise NotImplementedError("All possibilities for more than 62 cases")
-        n_groups = ceil(n / 62.)
-        group_size = int(ceil(n / n_groups))
-        out_parts = chain(range(0, n, group_size), [n])
-        for _ in zip(*(permute_sign_flip(stop - start, samples, rng, out[start: stop])
-                       for start, stop in intervals(out_parts))):
-            yield out
-        return
-
-    # determine possible number of permutations
     n_perm_possible = 2 ** n
     if samples < 0:
+        if n > 62:
+            raise NotImplementedError("All possibilities for more than 62 cases")
         # do all permutations
-        sample_sequences = range(1, n_perm_possible)
+        sample_sequences = range(1 + skip, n_perm_possible)
     else:
         # random resampling
-        sample_sequences = rng.sample(range(1, n_perm_possible), samples)
+        sample_sequences = islice(_random_sign_flip_sequences(n, rng), skip, samples)
 
     for seq in sample_sequences:
         out.fill(1)
@@ -171,6 +197,37 @@ def permute_sign_flip(n, samples=10000, rng=None, out=None):
         yield out
 
 
+def permutation_blocks(iterator, block_size):
+    """Group the permutations from a permutation iterator into blocks
+
+    Parameters
+    ----------
+    iterator : iterator over array  (n,)
+        Permutation iterator, such as :func:`permute_sign_flip`.
+    block_size : int
+        Number of permutations per block.
+
+    Yields
+    ------
+    block : array  (block_size, n)
+        Consecutive permutations from ``iterator``, one per row (the last block
+        can be shorter).
+    """
+    block = None
+    i = 0
+    for perm in iterator:
+        if block is None:
+            block = np.empty((block_size, len(perm)), perm.dtype)
+            i = 0
+        block[i] = perm
+        i += 1
+        if i == block_size:
+            yield block
+            block = None
+    if block is not None:
+        yield block[:i]
+
+
 def resample(y, samples=10000, replacement=False, unit=None):
     """
     Generator function to resample a dependent variable (y) multiple times
@@ -210,13 +267,16 @@ def resample(y, samples=10000, replacement=False, unit=None):
         yield out
 
 
-def random_seeds(samples):
+def random_seeds(samples, skip=0):
     """Sequence of seeds for permutation based on random numbers
 
     Parameters
     ----------
     samples : int
         Number of samples to yield.
+    skip : int
+        Skip the first ``skip`` seeds (to resume a previous permutation
+        sequence).
 
     Returns
     -------
@@ -225,7 +285,7 @@ def random_seeds(samples):
         but its content modified in every iteration).
     """
     rng = np.random.RandomState(0)
-    return rng.randint(2**32, size=samples, dtype=np.uint32)
+    return rng.randint(2**32, size=samples, dtype=np.uint32)[skip:]
 
 
 def _sample_xi_by_rejection(n, seed):
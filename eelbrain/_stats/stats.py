@@ -102,6 +102,62 @@ def corr(y, x, out=None, perm=None):
     return out
 
 
+def corr_normalize(y):
+    """Normalize data for :func:`corr_perm`
+
+    Parameters
+    ----------
+    y : array_like, shape = (n_cases, ...)
+        Data.
+
+    Returns
+    -------
+    y_norm : array, shape = (n_cases, ...)
+        ``y`` with mean zero and unit norm along the case axis (``0`` for
+        data without variance), so that the correlation of two normalized
+        variables is their dot product.
+    """
+    y_norm = y - y.mean(0)
+    norm = np.sqrt(np.einsum('i...,i...->...', y_norm, y_norm))
+    with np.errstate(invalid='ignore'):
+        y_norm /= norm
+    return np.nan_to_num(y_norm, copy=False)
+
+
+def corr_perm(y, x, out, perm):
+    """Correlation for one permutation of ``x``
+
+    Parameters
+    ----------
+    y : array, shape = (n_cases, n_tests)
+        Dependent variable, normalized with :func:`corr_normalize`.
+    x : array, shape = (n_cases,)
+        Covariate, normalized with :func:`corr_normalize`.
+    out : array, shape = (n_tests,)
+        Container for the correlation.
+    perm : array of int, shape = (n_cases,)
+        Permutation of the cases of ``x``.
+    """
+    np.dot(x[perm], y, out=out)
+
+
+def corr_perm_block(y, x, out, perms):
+    """Correlation for a block of permutations of ``x``
+
+    Parameters
+    ----------
+    y : array, shape = (n_cases, n_tests)
+        Dependent variable, normalized with :func:`corr_normalize`.
+    x : array, shape = (n_cases,)
+        Covariate, normalized with :func:`corr_normalize`.
+    out : array, shape = (n_perm, n_tests)
+        Container for the correlations.
+    perms : array of int, shape = (n_perm, n_cases)
+        Permutations of the cases of ``x``, one per row.
+    """
+    np.dot(x[perms], y, out=out)
+
+
 def lm_betas_se_1d(y, b, p):
     """Regression coefficient standard errors
 
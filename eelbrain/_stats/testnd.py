@@ -22,26 +22,24 @@ n_samples : None | int
 '''
 from datetime import datetime, timedelta
 from functools import reduce, partial
-from itertools import chain, repeat
+from itertools import chain, islice, repeat
 from math import ceil
-from multiprocessing.sharedctypes import RawArray
 import logging
 import operator
-import os
 import re
 import socket
-from time import time as current_time
+from time import sleep, time as current_time
 from typing import Union
 
 import numpy as np
 import scipy.stats
 from scipy import ndimage
-from tqdm import trange
+from tqdm import tqdm
 
 from .. import fmtxt, _info, _text
 from ..fmtxt import FMText
 from .._celltable import Celltable
-from .._config import CONFIG, mpc
+from .._config import CONFIG
 from .._data_obj import (
     CategorialArg, CellArg, IndexArg, ModelArg, NDVarArg, VarArg,
     Dataset, Var, Factor, Interaction, NestedEffect,
@@ -49,20 +47,23 @@ from .._data_obj import (
     ascategorial, asmodel, asndvar, asvar, assub,
     cellname, combine, dataobj_repr, longname)
 from .._exceptions import OldVersionError, WrongDimension, ZeroVariance
-from .._utils import LazyProperty, user_activity, restore_main_spec
+from .._utils import LazyProperty, user_activity
 from .._utils.numpy_utils import FULL_AXIS_SLICE
+from .._utils.parallel import worker_pool
 from . import opt, stats, vector
 from .connectivity import Connectivity, find_peaks
-from .connectivity_opt import merge_labels, tfce_increment
+from .connectivity_opt import label_sparse, tfce_increment, tfce_sweep
 from .glm import _nd_anova
 from .permutation import (
-    _resample_params, permute_order, permute_sign_flip, random_seeds,
-    rand_rotation_matrices)
+    _resample_params, permutation_blocks, permute_order, permute_sign_flip,
+    random_seeds, rand_rotation_matrices)
 from .t_contrast import TContrastSpec
 from .test import star, star_factor, _independent_measures_args, _related_measures_args
 
 
 __test__ = False
+# sequential stopping: number of permutations between checks
+STOP_CHECK_INTERVAL = 100
 
 
 def check_for_vector_dim(y: NDVar) -> None:
@@ -71,6 +72,19 @@ def check_for_vector_dim(y: NDVar) -> None:
             raise WrongDimension(f"{dim}: mass-univariate methods are not suitable for vectors. Consider using vector norm as test statistic, or using a testnd.Vector test function.")
 
 
+def permutation_dtype(dtype):
+    "Data type for permutations (``dtype`` parameter)"
+    if dtype is None:
+        return np.dtype(CONFIG['permutation_dtype'])
+    try:
+        out = np.dtype(dtype)
+    except TypeError:
+        out = None
+    if out not in (np.float64, np.float32):
+        raise ValueError(f"dtype={dtype!r}; needs to be 'float64' or 'float32'")
+    return out
+
+
 def check_variance(x):
     if x.ndim != 2:
         x = x.reshape((len(x), -1))
@@ -444,6 +458,10 @@ class TContrastRelated(NDTest):
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation: bool
         Conduct permutations regardless of whether there are any clusters.
+    resume : NDTest
+        Result of the same test on the same data with fewer ``samples``. The
+        permutations from ``resume`` are reused, and only the additional
+        permutations are computed.
     mintime : scalar
         Minimum duration for clusters (in seconds).
     minsource : int
@@ -507,6 +525,7 @@ class TContrastRelated(NDTest):
             tstop: float = None,
             parc: str = None,
             force_permutation: bool = False,
+            resume: NDTest = None,
             **criteria):
         if match is None:
             raise TypeError("The `match` parameter needs to be specified for TContrastRelated")
@@ -539,8 +558,9 @@ class TContrastRelated(NDTest):
                 tstart, tstop, criteria, parc, force_permutation)
             cdist.add_original(tmap)
             if cdist.do_permutation:
-                iterator = permute_order(len(ct.y), samples, unit=ct.match)
-                run_permutation(t_contrast, cdist, iterator)
+                skip = resume_permutation(cdist, resume, samples)
+                permutations = partial(permute_order, len(ct.y), samples, unit=ct.match, skip=skip)
+                run_permutation(t_contrast, cdist, permutations)
 
         # NDVar map of t-values
         info = _info.for_stat_map('t', threshold, tail=tail, old=ct.y.info)
@@ -706,13 +726,16 @@ class Correlation(NDTest):
             else:
                 threshold = None
 
+            # permute normalized data, so that each permutation is a dot product
+            y_norm = NDVar(stats.corr_normalize(y.x), y.dims, y.name, y.info)
             cdist = NDPermutationDistribution(
-                y, samples, threshold, tfce, 0, 'r', name,
+                y_norm, samples, threshold, tfce, 0, 'r', name,
                 tstart, tstop, criteria, parc)
             cdist.add_original(rmap)
             if cdist.do_permutation:
-                iterator = permute_order(n, samples, unit=match)
-                run_permutation(stats.corr, cdist, iterator, x.x)
+                permutations = partial(permute_order, n, samples, unit=match)
+                x_norm = stats.corr_normalize(x.x)
+                run_permutation(stats.corr_perm, cdist, permutations, x_norm, block_func=stats.corr_perm_block)
 
         # compile results
         info = _info.for_stat_map('r', threshold)
@@ -857,6 +880,14 @@ class TTestOneSample(NDDifferenceTest):
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation: bool
         Conduct permutations regardless of whether there are any clusters.
+    resume : NDTest
+        Result of the same test on the same data with fewer ``samples``. The
+        permutations from ``resume`` are reused, and only the additional
+        permutations are computed.
+    dtype : 'float64' | 'float32' | numpy.dtype
+        Data type for computing the permutations (default set by
+        :func:`configure`; see ``permutation_dtype`` for the effect on
+        p-values).
     mintime : scalar
         Minimum duration for clusters (in seconds).
     minsource : int
@@ -911,6 +942,8 @@ class TTestOneSample(NDDifferenceTest):
             tstop: float = None,
             parc: str = None,
             force_permutation: bool = False,
+            resume: NDTest = None,
+            dtype: str = None,
             **criteria):
         ct = Celltable(y, match=match, sub=sub, ds=ds, coercion=asndvar, dtype=np.float64)
         check_for_vector_dim(ct.y)
@@ -948,11 +981,12 @@ class TTestOneSample(NDDifferenceTest):
             n_samples, samples = _resample_params(len(y_perm), samples)
             cdist = NDPermutationDistribution(
                 y_perm, n_samples, threshold, tfce, tail, 't', '1-Sample t-Test',
-                tstart, tstop, criteria, parc, force_permutation)
+                tstart, tstop, criteria, parc, force_permutation, permutation_dtype(dtype))
             cdist.add_original(tmap)
             if cdist.do_permutation:
-                iterator = permute_sign_flip(n, samples)
-                run_permutation(opt.t_1samp_perm, cdist, iterator)
+                skip = resume_permutation(cdist, resume, samples)
+                permutations = partial(permute_sign_flip, n, samples, skip=skip)
+                run_permutation(opt.t_1samp_perm, cdist, permutations, block_func=opt.t_1samp_perm_block)
 
         # NDVar map of t-values
         info = _info.for_stat_map('t', threshold, tail=tail, old=ct.y.info)
@@ -1062,6 +1096,14 @@ class TTestIndependent(NDDifferenceTest):
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation: bool
         Conduct permutations regardless of whether there are any clusters.
+    resume : NDTest
+        Result of the same test on the same data with fewer ``samples``. The
+        permutations from ``resume`` are reused, and only the additional
+        permutations are computed.
+    dtype : 'float64' | 'float32' | numpy.dtype
+        Data type for computing the permutations (default set by
+        :func:`configure`; see ``permutation_dtype`` for the effect on
+        p-values).
     mintime : scalar
         Minimum duration for clusters (in seconds).
     minsource : int
@@ -1121,6 +1163,8 @@ class TTestIndependent(NDDifferenceTest):
             tstop: float = None,
             parc: str = None,
             force_permutation: bool = False,
+            resume: NDTest = None,
+            dtype: str = None,
             **criteria):
         y, y1, y0, c1, c0, match, x_name, c1_name, c0_name = _independent_measures_args(y, x, c1, c0, match, ds, sub, True)
         check_for_vector_dim(y)
@@ -1146,11 +1190,12 @@ class TTestIndependent(NDDifferenceTest):
             else:
                 threshold = None
 
-            cdist = NDPermutationDistribution(y, samples, threshold, tfce, tail, 't', 'Independent Samples t-Test', tstart, tstop, criteria, parc, force_permutation)
+            cdist = NDPermutationDistribution(y, samples, threshold, tfce, tail, 't', 'Independent Samples t-Test', tstart, tstop, criteria, parc, force_permutation, permutation_dtype(dtype))
             cdist.add_original(tmap)
             if cdist.do_permutation:
-                iterator = permute_order(n, samples)
-                run_permutation(stats.t_ind, cdist, iterator, groups)
+                skip = resume_permutation(cdist, resume, samples)
+                permutations = partial(permute_order, n, samples, skip=skip)
+                run_permutation(stats.t_ind, cdist, permutations, groups)
 
         # store attributes
         NDDifferenceTest.__init__(self, y, match, sub, samples, tfce, pmin, cdist, tstart, tstop)
@@ -1281,6 +1326,14 @@ class TTestRelated(NDMaskedC1Mixin, NDDifferenceTest):
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation: bool
         Conduct permutations regardless of whether there are any clusters.
+    resume : NDTest
+        Result of the same test on the same data with fewer ``samples``. The
+        permutations from ``resume`` are reused, and only the additional
+        permutations are computed.
+    dtype : 'float64' | 'float32' | numpy.dtype
+        Data type for computing the permutations (default set by
+        :func:`configure`; see ``permutation_dtype`` for the effect on
+        p-values).
     mintime : scalar
         Minimum duration for clusters (in seconds).
     minsource : int
@@ -1345,6 +1398,8 @@ class TTestRelated(NDMaskedC1Mixin, NDDifferenceTest):
             tstop: float = None,
             parc: str = None,
             force_permutation: bool = False,
+            resume: NDTest = None,
+            dtype: str = None,
             **criteria):
         y1, y0, c1, c0, match, n, x_name, c1_name, c0_name = _related_measures_args(y, x, c1, c0, match, ds, sub, True)
         check_for_vector_dim(y1)
@@ -1371,11 +1426,12 @@ class TTestRelated(NDMaskedC1Mixin, NDDifferenceTest):
             n_samples, samples = _resample_params(len(diff), samples)
             cdist = NDPermutationDistribution(
                 diff, n_samples, threshold, tfce, tail, 't', 'Related Samples t-Test',
-                tstart, tstop, criteria, parc, force_permutation)
+                tstart, tstop, criteria, parc, force_permutation, permutation_dtype(dtype))
             cdist.add_original(tmap)
             if cdist.do_permutation:
-                iterator = permute_sign_flip(n, samples)
-                run_permutation(opt.t_1samp_perm, cdist, iterator)
+                skip = resume_permutation(cdist, resume, samples)
+                permutations = partial(permute_sign_flip, n, samples, skip=skip)
+                run_permutation(opt.t_1samp_perm, cdist, permutations, block_func=opt.t_1samp_perm_block)
 
         # NDVar map of t-values
         info = _info.for_stat_map('t', threshold, tail=tail, old=y1.info)
@@ -1680,6 +1736,14 @@ class ANOVA(MultiEffectNDTest):
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation: bool
         Conduct permutations regardless of whether there are any clusters.
+    resume : NDTest
+        Result of the same test on the same data with fewer ``samples``. The
+        permutations from ``resume`` are reused, and only the additional
+        permutations are computed.
+    dtype : 'float64' | 'float32' | numpy.dtype
+        Data type for computing the permutations (default set by
+        :func:`configure`; see ``permutation_dtype`` for the effect on
+        p-values).
     mintime : scalar
         Minimum duration for clusters (in seconds).
     minsource : int
@@ -1733,6 +1797,8 @@ class ANOVA(MultiEffectNDTest):
             match: Union[CategorialArg, bool] = None,
             parc: str = None,
             force_permutation: bool = False,
+            resume: NDTest = None,
+            dtype: str = None,
             **criteria):
         x_arg = x
         sub_arg = sub
@@ -1770,10 +1836,11 @@ class ANOVA(MultiEffectNDTest):
             else:
                 thresholds = tuple(repeat(None, len(effects)))
 
+            dtype = permutation_dtype(dtype)
             cdists = [
                 NDPermutationDistribution(
                     y, samples, thresh, tfce, 1, 'f', e.name,
-                    tstart, tstop, criteria, parc, force_permutation)
+                    tstart, tstop, criteria, parc, force_permutation, dtype)
                 for e, thresh in zip(effects, thresholds)]
 
             # Find clusters in the actual data
@@ -1783,8 +1850,9 @@ class ANOVA(MultiEffectNDTest):
                 do_permutation += cdist.do_permutation
 
             if do_permutation:
-                iterator = permute_order(len(y), samples, unit=match)
-                run_permutation_me(lm, cdists, iterator)
+                skip = resume_permutation(cdists, resume, samples)
+                permutations = partial(permute_order, len(y), samples, unit=match, skip=skip)
+                run_permutation_me(lm, cdists, permutations)
 
         # create ndvars
         dims = y.dims[1:]
@@ -1960,6 +2028,10 @@ class Vector(NDDifferenceTest):
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation: bool
         Conduct permutations regardless of whether there are any clusters.
+    resume : NDTest
+        Result of the same test on the same data with fewer ``samples``. The
+        permutations from ``resume`` are reused, and only the additional
+        permutations are computed.
     norm : bool
         Use the vector norm as univariate test statistic (instead of Hotelling’s
         T-Square statistic).
@@ -2018,6 +2090,7 @@ class Vector(NDDifferenceTest):
             tstop: float = None,
             parc: str = None,
             force_permutation: bool = False,
+            resume: NDTest = None,
             norm: bool = False,
             **criteria):
         use_norm = bool(norm)
@@ -2041,9 +2114,10 @@ class Vector(NDDifferenceTest):
             self.t2 = None
 
         if cdist.do_permutation:
-            iterator = random_seeds(samples)
+            skip = resume_permutation(cdist, resume, samples)
+            permutations = partial(random_seeds, samples, skip)
             vector_perm = partial(self._vector_perm, use_norm=use_norm)
-            run_permutation(vector_perm, cdist, iterator)
+            run_permutation(vector_perm, cdist, permutations)
 
         # store attributes
         NDTest.__init__(self, ct.y, ct.match, sub, samples, tfce, None, cdist, tstart, tstop)
@@ -2140,6 +2214,10 @@ class VectorDifferenceIndependent(Vector):
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation: bool
         Conduct permutations regardless of whether there are any clusters.
+    resume : NDTest
+        Result of the same test on the same data with fewer ``samples``. The
+        permutations from ``resume`` are reused, and only the additional
+        permutations are computed.
     norm : bool
         Use the vector norm as univariate test statistic (instead of Hotelling’s
         T-Square statistic).
@@ -2199,6 +2277,7 @@ class VectorDifferenceIndependent(Vector):
             tstop: float = None,
             parc: str = None,
             force_permutation: bool = False,
+            resume: NDTest = None,
             norm: bool = False,
             **criteria):
         use_norm = bool(norm)
@@ -2222,9 +2301,10 @@ class VectorDifferenceIndependent(Vector):
             self.t2 = None
 
         if cdist.do_permutation:
-            iterator = random_seeds(samples)
+            skip = resume_permutation(cdist, resume, samples)
+            permutations = partial(random_seeds, samples, skip)
             vector_perm = partial(self._vector_perm, use_norm=use_norm)
-            run_permutation(vector_perm, cdist, iterator, self.n1)
+            run_permutation(vector_perm, cdist, permutations, self.n1)
 
         NDTest.__init__(self, y, match, sub, samples, tfce, None, cdist, tstart, tstop)
         self._expand_state()
@@ -2244,7 +2324,7 @@ class VectorDifferenceIndependent(Vector):
         rotation = rand_rotation_matrices(n_cases, seed)
         # randomize groups
         cases = np.arange(n_cases)
-        np.random.shuffle(cases)
+        np.random.RandomState([seed, 1]).shuffle(cases)
         # group 1
         mean_1 = np.zeros((n_dims, n_tests))
         for case in cases[:n1]:
@@ -2306,6 +2386,10 @@ class VectorDifferenceRelated(NDMaskedC1Mixin, Vector):
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation: bool
         Conduct permutations regardless of whether there are any clusters.
+    resume : NDTest
+        Result of the same test on the same data with fewer ``samples``. The
+        permutations from ``resume`` are reused, and only the additional
+        permutations are computed.
     norm : bool
         Use the vector norm as univariate test statistic (instead of Hotelling’s
         T-Square statistic).
@@ -2361,6 +2445,7 @@ class VectorDifferenceRelated(NDMaskedC1Mixin, Vector):
             tstop: float = None,
             parc: str = None,
             force_permutation: bool = False,
+            resume: NDTest = None,
             norm: bool = False,
             **criteria):
         use_norm = bool(norm)
@@ -2386,9 +2471,10 @@ class VectorDifferenceRelated(NDMaskedC1Mixin, Vector):
             self.t2 = None
 
         if cdist.do_permutation:
-            iterator = random_seeds(n_samples)
+            skip = resume_permutation(cdist, resume, samples)
+            permutations = partial(random_seeds, n_samples, skip)
             vector_perm = partial(self._vector_perm, use_norm=use_norm)
-            run_permutation(vector_perm, cdist, iterator)
+            run_permutation(vector_perm, cdist, permutations)
 
         # store attributes
         NDTest.__init__(self, difference, match, sub, samples, tfce, None, cdist, tstart, tstop)
@@ -2447,6 +2533,16 @@ def flatten(array, connectivity):
         return out
 
 
+def _sub_key(sub):
+    "Hashable key for a ``**sub`` index (``None`` if not hashable)"
+    key = tuple(sorted(sub.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
 def flatten_1d(array):
     if array.ndim == 1:
         return array
@@ -2565,7 +2661,7 @@ def _label_clusters_binary(bin_map, cmap, cmap_flat, connectivity, criteria):
     cmap : np.ndarray
         Array in which to label the clusters.
     cmap_flat : np.ndarray
-        Flat copy of cmap (ndim=2, only used when all_adjacent==False)
+        Flat copy of cmap (ndim=2, not used with custom connectivity)
     connectivity : Connectivity
         Connectivity.
     criteria : None | list
@@ -2578,44 +2674,164 @@ def _label_clusters_binary(bin_map, cmap, cmap_flat, connectivity, criteria):
         Sorted identifiers of the clusters that survive the selection criteria.
     """
     # find clusters
-    n = ndimage.label(bin_map, connectivity.struct, cmap)
-    if n <= 1:
-        # in older versions, n is 1 even when no cluster is found
-        if n == 0 or cmap.max() == 0:
-            return np.array((), np.uint32)
-        else:
-            cids = np.array((1,), np.uint32)
-    elif connectivity.custom:
-        cids = merge_labels(cmap_flat, n, *connectivity.custom[0])
+    if connectivity.custom:
+        # only visit supra-threshold points
+        cmap.fill(0)
+        index = np.flatnonzero(bin_map)
+        shape = np.array(cmap.shape, np.intp)
+        cids = label_sparse(flatten_1d(cmap), index, shape, connectivity.grid, *connectivity.custom[0])
+        if cids.size == 0:
+            return cids
     else:
-        cids = np.arange(1, n + 1, 1, np.uint32)
+        n = ndimage.label(bin_map, connectivity.struct, cmap)
+        if n <= 1:
+            # in older versions, n is 1 even when no cluster is found
+            if n == 0 or cmap.max() == 0:
+                return np.array((), np.uint32)
+            else:
+                cids = np.array((1,), np.uint32)
+        else:
+            cids = np.arange(1, n + 1, 1, np.uint32)
 
     # apply minimum cluster size criteria
     if criteria and cids.size:
         for axes, v in criteria:
-            cids = np.setdiff1d(cids,
-                                [i for i in cids if np.count_nonzero(np.equal(cmap, i).any(axes)) < v],
-                                True)
+            ax = next(i for i in range(cmap.ndim) if i not in axes)
+            extent = _cluster_extent(cmap, cids, ax, ax in connectivity.custom)
+            cids = cids[extent >= v]
             if cids.size == 0:
                 break
 
     return cids
 
 
+def _cluster_points(cmap, cids):
+    """Locate the points belonging to each cluster
+
+    Parameters
+    ----------
+    cmap : np.ndarray of int
+        Cluster map.
+    cids : array_like of int
+        Identifiers of the clusters to locate.
+
+    Returns
+    -------
+    rows : np.ndarray of intp
+        For each point, the index of its cluster in ``cids``.
+    index : tuple of np.ndarray
+        Index of the points in ``cmap`` (one array per axis).
+    """
+    cids = np.asarray(cids, np.intp)
+    index = np.nonzero(cmap)
+    lut = np.full(max(cmap.max(), cids.max(initial=0)) + 1, -1, np.intp)
+    lut[cids] = np.arange(len(cids))
+    rows = lut[cmap[index]]
+    keep = rows >= 0
+    if not keep.all():
+        rows = rows[keep]
+        index = tuple(i[keep] for i in index)
+    return rows, index
+
+
+def _cluster_extent(cmap, cids, ax, custom):
+    """Number of distinct indices along ``ax`` that each cluster occupies
+
+    Parameters
+    ----------
+    cmap : np.ndarray of uint32
+        Cluster map.
+    cids : np.ndarray of uint32
+        Sorted identifiers of the clusters to measure.
+    ax : int
+        Axis along which to measure the clusters.
+    custom : bool
+        ``ax`` has custom connectivity. Along other axes, clusters are
+        contiguous, and their extent is given by their bounding box.
+
+    Returns
+    -------
+    extent : np.ndarray of int
+        Extent of each cluster in ``cids``.
+    """
+    if custom:
+        n = cmap.shape[ax]
+        mask = cmap != 0
+        keys = cmap[mask].astype(np.int64)
+        keys *= n
+        keys += np.nonzero(mask)[ax]
+        keys = np.unique(keys)
+        return np.bincount(keys // n, minlength=cids[-1] + 1)[cids]
+    slices = ndimage.find_objects(cmap, cids[-1])
+    return np.array([slices[i - 1][ax].stop - slices[i - 1][ax].start for i in cids])
+
+
 def tfce(stat_map, tail, connectivity, dh=0.1):
     tfce_im = np.empty(stat_map.shape, np.float64)
-    tfce_im_1d = flatten_1d(tfce_im)
-    bin_buff = np.empty(stat_map.shape, np.bool8)
-    int_buff = np.empty(stat_map.shape, np.uint32)
-    int_buff_flat = flatten(int_buff, connectivity)
-    int_buff_1d = flatten_1d(int_buff)
-    return _tfce(stat_map, tail, connectivity, tfce_im, tfce_im_1d, bin_buff, int_buff,
-                 int_buff_flat, int_buff_1d, dh)
+    graph = tfce_graph(stat_map.shape, connectivity)
+    return _tfce_sweep(stat_map, tail, graph, tfce_im, dh)
+
+
+def tfce_graph(shape, connectivity):
+    """Describe the connectivity of a statistical map for :func:`tfce_sweep`
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape of the statistical map (non-adjacent dimension on the first
+        axis).
+    connectivity : Connectivity
+        N-dimensional connectivity.
+
+    Returns
+    -------
+    graph : tuple
+        ``(shape, grid, edges, edge_start, edge_stop)`` arguments for
+        :func:`tfce_sweep`.
+    """
+    grid = connectivity.grid
+    if connectivity.custom:
+        edges = connectivity.custom[0][0]
+        edges = np.vstack((edges, edges[:, ::-1]))
+        edges = edges[np.lexsort(edges.T[::-1])]
+        n_edges = np.bincount(edges[:, 0], minlength=shape[0])
+        edge_stop = np.cumsum(n_edges)
+        edge_start = edge_stop - n_edges
+    else:
+        edges = np.empty((0, 2), np.uint32)
+        edge_start = edge_stop = np.zeros(shape[0], np.int64)
+    return np.array(shape, np.intp), grid, edges, edge_start, edge_stop
+
+
+def _tfce_sweep(stat_map, tail, graph, out, dh=0.1, e=0.5, h=2.0):
+    """Threshold-free cluster enhancement
+
+    Same output as :func:`_tfce`, but based on a single sweep through the
+    voxels sorted by value (see :func:`tfce_sweep`) instead of labeling the
+    map at each height.
+    """
+    out.fill(0)
+    x = stat_map.astype(np.float64, copy=False).ravel()
+    out_1d = flatten_1d(out)
+    sides = []
+    if tail <= 0:
+        hs = np.arange(-dh, stat_map.min(), -dh)
+        sides.append((-x, -hs, [(-h_) ** h for h_ in hs]))
+    if tail >= 0:
+        hs = np.arange(dh, stat_map.max(), dh)
+        sides.append((x, hs, [h_ ** h for h_ in hs]))
+    for x_side, hs, h_factors in sides:
+        if len(hs) == 0:
+            continue
+        index = np.flatnonzero(x_side >= hs[0])
+        order = index[np.argsort(-x_side[index], kind='stable')]
+        tfce_sweep(x_side, order, hs, np.array(h_factors, np.float64), e, *graph, out_1d)
+    return out
 
 
 def _tfce(stat_map, tail, conn, out, out_1d, bin_buff, int_buff,
           int_buff_flat, int_buff_1d, dh=0.1, e=0.5, h=2.0):
-    "Threshold-free cluster enhancement"
+    "Threshold-free cluster enhancement (reference implementation based on labeling each height)"
     out.fill(0)
 
     # determine slices
@@ -2665,6 +2881,25 @@ class StatMapProcessor:
         else:
             return [v[idx].max() for idx in self.parc]
 
+    def max_stats(self, stat_maps):
+        "Maximum statistic for each map in a block (first axis) of stat-maps"
+        if self.max_axes is None:
+            axes = tuple(range(1, stat_maps.ndim))
+        else:
+            axes = tuple(ax + 1 for ax in self.max_axes)
+
+        if self.tail == 0:
+            v = np.abs(stat_maps, stat_maps).max(axes)
+        elif self.tail > 0:
+            v = stat_maps.max(axes)
+        else:
+            v = -stat_maps.min(axes)
+
+        if self.parc is None:
+            return v
+        else:
+            return np.column_stack([v[:, idx].reshape((len(v), -1)).max(1) for idx in self.parc])
+
 
 class TFCEProcessor(StatMapProcessor):
 
@@ -2675,24 +2910,19 @@ class TFCEProcessor(StatMapProcessor):
         self.dh = dh
 
         # Pre-allocate memory buffers used for cluster processing
-        self._bin_buff = np.empty(shape, np.bool8)
-        self._int_buff = np.empty(shape, np.uint32)
         self._tfce_im = np.empty(shape, np.float64)
-        self._tfce_im_1d = flatten_1d(self._tfce_im)
-        self._int_buff_flat = flatten(self._int_buff, connectivity)
-        self._int_buff_1d = flatten_1d(self._int_buff)
+        self._graph = tfce_graph(shape, connectivity)
 
     def max_stat(self, stat_map):
-        v = _tfce(
-            stat_map, self.tail, self.connectivity, self._tfce_im, self._tfce_im_1d,
-            self._bin_buff, self._int_buff, self._int_buff_flat, self._int_buff_1d,
-            self.dh,
-        ).max(self.max_axes)
+        v = _tfce_sweep(stat_map, self.tail, self._graph, self._tfce_im, self.dh).max(self.max_axes)
         if self.parc is None:
             return v
         else:
             return [v[idx].max() for idx in self.parc]
 
+    def max_stats(self, stat_maps):
+        return np.array([self.max_stat(stat_map) for stat_map in stat_maps])
+
 
 class ClusterProcessor(StatMapProcessor):
 
@@ -2743,6 +2973,9 @@ class ClusterProcessor(StatMapProcessor):
         else:
             return 0
 
+    def max_stats(self, stat_maps):
+        return np.array([self.max_stat(stat_map) for stat_map in stat_maps])
+
 
 def get_map_processor(kind, *args):
     if kind == 'tfce':
@@ -2787,6 +3020,8 @@ class NDPermutationDistribution:
         this dimension. For threshold-based test, the regions are disconnected.
     force_permutation : bool
         Conduct permutations regardless of whether there are any clusters.
+    dtype : numpy.dtype
+        Data type for computing the permuted statistical maps.
 
 
     Notes
@@ -2809,7 +3044,8 @@ class NDPermutationDistribution:
     tfce_warning = None
 
     def __init__(self, y, samples, threshold, tfce=False, tail=0, meas='?', name=None,
-                 tstart=None, tstop=None, criteria={}, parc=None, force_permutation=False):
+                 tstart=None, tstop=None, criteria={}, parc=None, force_permutation=False,
+                 dtype=np.float64):
         assert y.has_case
         assert parc is None or isinstance(parc, str)
         if tfce and threshold:
@@ -2946,6 +3182,7 @@ class NDPermutationDistribution:
         self.shape = shape  # internal stat map shape
         self._connectivity = connectivity
         self.samples = samples
+        self.samples_requested = samples
         self.dist_shape = dist_shape
         self._dist_dims = dist_dims
         self._max_axes = max_axes
@@ -2963,13 +3200,22 @@ class NDPermutationDistribution:
         self._criteria = criteria_
         self.criteria = criteria
         self.map_args = map_args
+        self.dtype = np.dtype(dtype)
         self.has_original = False
         self.do_permutation = False
+        self.n_resumed = 0
         self.dt_perm = None
         self._finalized = False
         self._init_time = current_time()
         self._host = socket.gethostname()
         self.force_permutation = force_permutation
+        # sequential stopping: parc and force_permutation distributions are
+        # used for other decisions
+        if parc or force_permutation:
+            self.stop_alpha = None
+        else:
+            self.stop_alpha = CONFIG['permutation_stop_alpha']
+        self._stop_values = None
 
         from .. import __version__
         self._version = __version__
@@ -3050,25 +3296,100 @@ class NDPermutationDistribution:
         self._original_param_map = stat_map
 
         if self.force_permutation or (self.samples and n_clusters):
-            self._create_dist()
+            self.dist = np.zeros(self.dist_shape)
             self.do_permutation = True
+            if self.stop_alpha:
+                self._stop_values = np.sort(self._decision_values(), None)
         else:
-            self.dist_array = None
             self.finalize()
 
-    def _create_dist(self):
-        "Create the distribution container"
-        if CONFIG['n_workers']:
-            n = reduce(operator.mul, self.dist_shape)
-            dist_array = RawArray('d', n)
-            dist = np.frombuffer(dist_array, np.float64, n)
-            dist.shape = self.dist_shape
+    def resume(self, previous):
+        """Reuse the permutations from a previous distribution
+
+        Parameters
+        ----------
+        previous : NDPermutationDistribution
+            Distribution for the same test on the same data, but with fewer
+            permutations.
+
+        Returns
+        -------
+        n_resumed : int
+            Number of permutations copied from ``previous``; the permutation
+            sequence should continue after these.
+        """
+        if not self.do_permutation:
+            return 0
+        elif previous.dist is None:
+            raise ValueError("Can not resume from a distribution without permutations")
+        elif previous.samples >= self.samples:
+            raise ValueError(f"Can not resume from a distribution with samples={previous.samples} for samples={self.samples}")
+        for attr in ('kind', 'threshold', 'tfce', 'tail', 'tstart', 'tstop', 'parc', 'criteria', 'shape', 'dtype'):
+            if getattr(previous, attr) != getattr(self, attr):
+                raise ValueError(f"Can not resume from a distribution with different settings: {attr}={getattr(previous, attr)!r}, but {getattr(self, attr)!r} in the new distribution")
+        if not np.array_equal(previous._original_param_map, self._original_param_map):
+            raise ValueError("Can not resume from a distribution for different data")
+        self.dist[:previous.samples] = previous.dist
+        self.n_resumed = previous.samples
+        return self.n_resumed
+
+    def _decision_values(self):
+        "Original values that are compared with the distribution"
+        if self.kind == 'cluster':
+            cluster_v = ndimage.sum(self._original_param_map, self._original_cluster_map, self._cids)
+            return np.abs(cluster_v)
+        elif self.kind == 'tfce':
+            return self._original_cluster_map
+        elif self.tail == 0:
+            return np.abs(self._original_param_map)
+        elif self.tail < 0:
+            return -self._original_param_map
         else:
-            dist_array = None
-            dist = np.zeros(self.dist_shape)
+            return self._original_param_map
 
-        self.dist_array = dist_array
-        self.dist = dist
+    def _permutation_decided(self, n):
+        """Whether further permutations could change any decision at ``stop_alpha``
+
+        Parameters
+        ----------
+        n : int
+            Number of permutations in ``dist`` that are complete.
+
+        Notes
+        -----
+        With ``c`` the number of the ``n`` completed permutations with a value
+        larger than or equal to an original value, the final ``p <= alpha`` iff
+        the final count is ``<= k``, with ``k`` the largest count for which
+        ``k / samples <= alpha``. Counts can only increase, so ``c > k`` can
+        not become significant, and ``c + (samples - n) <= k`` can not become
+        non-significant.
+        """
+        if n >= self.samples:
+            return True
+        elif n == 0:
+            return False
+        k = int(self.stop_alpha * self.samples)
+        while (k + 1) / self.samples <= self.stop_alpha:
+            k += 1
+        while k >= 0 and k / self.samples > self.stop_alpha:
+            k -= 1
+        if k < 0:
+            return True
+        dist = np.sort(self.dist[:n])
+        # undecided: v in (lower, upper]
+        lower = dist[n - k - 1] if n > k else -np.inf
+        if k - (self.samples - n) >= 0:
+            upper = dist[self.samples - k - 1]
+        else:
+            upper = np.inf
+        values = self._stop_values
+        return np.searchsorted(values, upper, 'right') == np.searchsorted(values, lower, 'right')
+
+    def _stop_permutation(self, n):
+        "Discard the distribution after ``n`` permutations"
+        self.dist = self.dist[:n].copy()
+        self.dist_shape = self.dist.shape
+        self.samples = n
 
     def _aggregate_dist(self, **sub):
         """Aggregate permutation distribution to one value per permutation
@@ -3114,13 +3435,13 @@ class NDPermutationDistribution:
             name: getattr(self, name) for name in (
                 'name', 'meas', '_version', '_host', '_init_time',
                 # settings ...
-                'kind', 'threshold', 'tfce', 'tail', 'criteria', 'samples', 'tstart', 'tstop', 'parc',
+                'kind', 'threshold', 'tfce', 'tail', 'criteria', 'samples', 'samples_requested', 'stop_alpha', 'tstart', 'tstop', 'parc', 'dtype',
                 # data properties ...
                 'dims', 'shape', '_nad_ax', '_vector_ax', '_criteria', '_connectivity',
                 # results ...
-                'dt_original', 'dt_perm', 'n_clusters', '_dist_dims', 'dist', '_original_param_map', '_original_cluster_map', '_cids',
+                'dt_original', 'dt_perm', 'n_resumed', 'n_clusters', '_dist_dims', 'dist', '_original_param_map', '_original_cluster_map', '_cids',
             )}
-        state['version'] = 3
+        state['version'] = 6
         return state
 
     def __setstate__(self, state):
@@ -3162,6 +3483,13 @@ class NDPermutationDistribution:
             state['_vector_ax'] = None
         if version < 3:
             state['tfce'] = ['kind'] == 'tfce'
+        if version < 4:
+            state['n_resumed'] = 0
+        if version < 5:
+            state['samples_requested'] = state['samples']
+            state['stop_alpha'] = None
+        if version < 6:
+            state['dtype'] = np.dtype(np.float64)
 
         for k, v in state.items():
             setattr(self, k, v)
@@ -3170,7 +3498,7 @@ class NDPermutationDistribution:
 
     def _repr_test_args(self, pmin):
         "Argument representation for TestResult repr"
-        args = [f'samples={self.samples}']
+        args = [f'samples={self.samples_requested}']
         if pmin is not None:
             args.append(f"pmin={pmin!r}")
         elif self.kind == 'tfce':
@@ -3184,6 +3512,8 @@ class NDPermutationDistribution:
             args.append(f"tstop={self.tstop!r}")
         for k, v in self.criteria.items():
             args.append(f"{k}={v!r}")
+        if self.dtype != np.float64:
+            args.append(f"dtype={self.dtype.name!r}")
         return args
 
     def _repr_clusters(self):
@@ -3236,16 +3566,12 @@ class NDPermutationDistribution:
         else:
             self.cluster_map = None
 
+        self._probability_maps.clear()
+        self._sorted_dists.clear()
         self._finalized = True
 
-    def data_for_permutation(self, raw=True):
-        """Retrieve data flattened for permutation
-
-        Parameters
-        ----------
-        raw : bool
-            Return a RawArray and a shape tuple instead of a numpy array.
-        """
+    def data_for_permutation(self):
+        "Retrieve data flattened for permutation"
         # get data in the right shape
         x = self.y_perm.x
         if self._vector_ax:
@@ -3263,14 +3589,7 @@ class NDPermutationDistribution:
         ndims = 1 + (self._vector_ax is not None)
         n_flat = 1 if x.ndim == ndims else reduce(operator.mul, x.shape[ndims:])
         y_flat_shape = x.shape[:ndims] + (n_flat,)
-
-        if not raw:
-            return x.reshape(y_flat_shape)
-
-        n = reduce(operator.mul, y_flat_shape)
-        ra = RawArray('d', n)
-        ra[:] = x.ravel()  # OPT: don't copy data
-        return ra, y_flat_shape, x.shape[ndims:]
+        return x.reshape(y_flat_shape).astype(self.dtype, copy=False)
 
     @staticmethod
     def _cluster_properties(cluster_map, cids):
@@ -3290,28 +3609,18 @@ class NDPermutationDistribution:
             Cluster properties. Which properties are included depends on the
             dimensions.
         """
-        ndim = cluster_map.ndim
         n_clusters = len(cids)
 
-        # setup compression
-        compression = []
-        for ax, dim in enumerate(cluster_map.dims):
-            extents = np.empty((n_clusters, len(dim)), dtype=np.bool_)
-            axes = tuple(i for i in range(ndim) if i != ax)
-            compression.append((ax, dim, axes, extents))
-
-        # find extents for all clusters
-        c_mask = np.empty(cluster_map.shape, np.bool_)
-        for i, cid in enumerate(cids):
-            np.equal(cluster_map, cid, c_mask)
-            for ax, dim, axes, extents in compression:
-                np.any(c_mask, axes, extents[i])
+        # find extents for all clusters in one pass over the cluster points
+        rows, index = _cluster_points(cluster_map.x, cids)
 
         # prepare Dataset
         ds = Dataset()
         ds['id'] = Var(cids)
 
-        for ax, dim, axes, extents in compression:
+        for dim, dim_index in zip(cluster_map.dims, index):
+            extents = np.zeros((n_clusters, len(dim)), dtype=np.bool_)
+            extents[rows, dim_index] = True
             properties = dim._cluster_properties(extents)
             if properties is not None:
                 ds.update(properties)
@@ -3400,8 +3709,7 @@ class NDPermutationDistribution:
                     # p-values: "the proportion of random partitions that
                     # resulted in a larger test statistic than the observed
                     # one" (179)
-                    dist = self._aggregate_dist(**sub)
-                    n_larger = np.sum(dist >= np.abs(cluster_v[:, None]), 1)
+                    n_larger = self._n_larger(np.abs(cluster_v), **sub)
                     cluster_p = n_larger / self.samples
 
                     # select clusters
@@ -3413,8 +3721,7 @@ class NDPermutationDistribution:
 
                     # p-value corrected across parc
                     if sub:
-                        dist = self._aggregate_dist()
-                        n_larger = np.sum(dist > np.abs(cluster_v[:, None]), 1)
+                        n_larger = self._n_larger(np.abs(cluster_v), True)
                         cluster_p_corr = n_larger / self.samples
             else:
                 cluster_v = cluster_p = cluster_p_corr = []
@@ -3462,11 +3769,9 @@ class NDPermutationDistribution:
         # expand clusters
         if maps:
             shape = (ds.n_cases,) + param_map.shape
-            c_maps = np.empty(shape, dtype=param_map.x.dtype)
-            c_mask = np.empty(param_map.shape, dtype=np.bool_)
-            for i, cid in enumerate(cids):
-                np.equal(cluster_map.x, cid, c_mask)
-                np.multiply(param_map.x, c_mask, c_maps[i])
+            c_maps = np.zeros(shape, dtype=param_map.x.dtype)
+            rows, index = _cluster_points(cluster_map.x, cids)
+            c_maps[(rows, *index)] = param_map.x[index]
 
             # package ndvar
             dims = ('case',) + param_map.dims
@@ -3533,11 +3838,55 @@ class NDPermutationDistribution:
         if not self.samples:
             raise RuntimeError("Can't compute probability without permutations")
 
+        key = _sub_key(sub)
+        if key in self._probability_maps:
+            cpmap, dims = self._probability_maps[key]
+        else:
+            cpmap, dims = self._compute_probability_map(**sub)
+            if key is not None:
+                self._probability_maps[key] = (cpmap, dims)
+
+        if dims:
+            return NDVar(cpmap.copy(), dims, self.name, _info.for_cluster_pmap())
+        else:
+            return cpmap
+
+    @LazyProperty
+    def _probability_maps(self):
+        # memoized probability maps:  {sub: (p_map, dims)}
+        return {}
+
+    @LazyProperty
+    def _sorted_dists(self):
+        # memoized sorted aggregate distributions:  {sub: dist}
+        return {}
+
+    def _n_larger(self, values, strict=False, **sub):
+        """Number of permutations with a maximum ``>= values``
+
+        Parameters
+        ----------
+        values : array
+            Values to compare with the permutation distribution.
+        strict : bool
+            Count permutations with a maximum ``> values``.
+        [dimname] : index
+            Limit the data for the distribution.
+        """
+        key = _sub_key(sub)
+        if key in self._sorted_dists:
+            dist = self._sorted_dists[key]
+        else:
+            dist = np.sort(self._aggregate_dist(**sub))
+            if key is not None:
+                self._sorted_dists[key] = dist
+        return len(dist) - np.searchsorted(dist, values, 'right' if strict else 'left')
+
+    def _compute_probability_map(self, **sub):
         if self.kind == 'cluster':
             cpmap = np.ones(self.shape)
             if self.n_clusters:
                 cids = self._cids
-                dist = self._aggregate_dist(**sub)
                 cluster_map = self._original_cluster_map
                 param_map = self._original_param_map
 
@@ -3546,13 +3895,10 @@ class NDPermutationDistribution:
 
                 # p-values: "the proportion of random partitions that resulted
                 # in a larger test statistic than the observed one" (179)
-                n_larger = np.sum(dist >= np.abs(cluster_v[:, None]), 1)
-                cluster_p = n_larger / self.samples
-
-                c_mask = np.empty(self.shape, dtype=np.bool8)
-                for i, cid in enumerate(cids):
-                    np.equal(cluster_map, cid, c_mask)
-                    cpmap[c_mask] = cluster_p[i]
+                n_larger = self._n_larger(np.abs(cluster_v), **sub)
+                cluster_p = np.ones(cluster_map.max() + 1)
+                cluster_p[cids] = n_larger / self.samples
+                np.take(cluster_p, cluster_map, out=cpmap)
             # revert to original shape
             if self._nad_ax:
                 cpmap = cpmap.swapaxes(0, self._nad_ax)
@@ -3573,21 +3919,12 @@ class NDPermutationDistribution:
                 stat_map = stat_map.sub(**sub)
             dims = stat_map.dims if isinstance(stat_map, NDVar) else None
 
-            cpmap = np.zeros(stat_map.shape) if dims else 0.
             if self.dist is None:  # flat stat-map
-                cpmap += 1
+                cpmap = np.ones(stat_map.shape) if dims else 1.
             else:
-                dist = self._aggregate_dist(**sub)
-                idx = np.empty(stat_map.shape, dtype=np.bool8)
                 actual = stat_map.x if self.dims else stat_map
-                for v in dist:
-                    cpmap += np.greater_equal(v, actual, idx)
-                cpmap /= self.samples
-
-        if dims:
-            return NDVar(cpmap, dims, self.name, _info.for_cluster_pmap())
-        else:
-            return cpmap
+                cpmap = self._n_larger(actual, **sub) / self.samples
+        return cpmap, dims
 
     def masked_parameter_map(self, pmin=0.05, name=None, **sub):
         """Parameter map masked by significance
@@ -3649,6 +3986,10 @@ class NDPermutationDistribution:
                        .strftime('%y-%m-%d %H:%M'))
         l.add_item("Original time:  %s" % timedelta(seconds=round(self.dt_original)))
         l.add_item("Permutation time:  %s" % timedelta(seconds=round(self.dt_perm)))
+        if self.n_resumed:
+            l.add_item(f"Resumed after {self.n_resumed} of {self.samples_requested} permutations")
+        if self.samples < self.samples_requested:
+            l.add_item(f"Sequential stopping:  {self.samples} of {self.samples_requested} permutations (all decisions at alpha={self.stop_alpha} fixed)")
         return l
 
 
@@ -3698,132 +4039,403 @@ class _MergedTemporalClusterDist:
         return clusters
 
 
-def distribution_worker(dist_array, dist_shape, in_queue, kill_beacon):
-    "Worker that accumulates values and places them into the distribution"
-    n = reduce(operator.mul, dist_shape)
-    dist = np.frombuffer(dist_array, np.float64, n)
-    dist.shape = dist_shape
-    samples = dist_shape[0]
-    for i in trange(samples, desc="Permutation test", unit=' permutations',
-                    disable=CONFIG['tqdm']):
-        dist[i] = in_queue.get()
-        if kill_beacon.is_set():
-            return
+def resume_permutation(dists, previous, samples):
+    """Reuse the permutations from a previous test result
 
+    Parameters
+    ----------
+    dists : NDPermutationDistribution | list of NDPermutationDistribution
+        Distribution(s) of the new test.
+    previous : None | NDTest
+        Previous test result.
+    samples : int
+        ``samples`` parameter for the permutation iterator.
 
-def permutation_worker(in_queue, out_queue, y, y_flat_shape, stat_map_shape,
-                       test_func, args, map_args, kill_beacon):
-    "Worker for 1 sample t-test"
-    if CONFIG['nice']:
-        os.nice(CONFIG['nice'])
+    Returns
+    -------
+    n_resumed : int
+        Number of permutations that were reused (the number of permutations
+        the iterator should skip).
+    """
+    if previous is None or samples < 0 or not previous.samples:
+        return 0
+    elif isinstance(dists, NDPermutationDistribution):
+        return dists.resume(previous._cdist)
+    previous_dists = {dist.name: dist for dist in previous._cdist}
+    names = [dist.name for dist in dists]
+    if set(names) != set(previous_dists):
+        missing = [name for name in names if name not in previous_dists]
+        extra = [name for name in previous_dists if name not in names]
+        desc = []
+        if missing:
+            desc.append(f"missing {', '.join(map(repr, missing))}")
+        if extra:
+            desc.append(f"additional {', '.join(map(repr, extra))}")
+        raise ValueError(f"Can not resume from a test with different effects ({'; '.join(desc)})")
+    n_resumed = {dist.resume(previous_dists[dist.name]) for dist in dists if dist.do_permutation}
+    if len(n_resumed) != 1:
+        raise RuntimeError(f"Inconsistent number of permutations in {previous}")
+    return n_resumed.pop()
+
+
+class PermutationProgress:
+    """Permutations that have been entered into the distribution
 
-    n = reduce(operator.mul, y_flat_shape)
-    y = np.frombuffer(y, np.float64, n).reshape(y_flat_shape)
-    stat_map = np.empty(stat_map_shape)
-    stat_map_flat = stat_map.ravel()
-    map_processor = get_map_processor(*map_args)
+    Attributes
+    ----------
+    value : int
+        End of the completed prefix (all permutations before ``value`` have
+        been entered).
+    n_ranges : int
+        Number of ranges that have been entered.
+    """
+    def __init__(self, value):
+        self.value = value
+        self.n_ranges = 0
+        self._done = {}  # range.start -> range.stop beyond the prefix
+
+    def add(self, permutation_range):
+        "Record that the permutations in ``permutation_range`` are complete"
+        self.n_ranges += 1
+        self._done[permutation_range.start] = permutation_range.stop
+        while self.value in self._done:
+            self.value = self._done.pop(self.value)
+
+
+def stop_when_decided(iterator, dists, start, block=False, n_done=None, max_pending=None):
+    """Stop iterating over permutations once all decisions are fixed
+
+    Parameters
+    ----------
+    iterator : iterator
+        Iterator over permutations.
+    dists : list of NDPermutationDistribution
+        Distributions with ``stop_alpha``.
+    start : int
+        Index of the first permutation yielded by ``iterator``.
+    block : bool
+        ``iterator`` yields blocks (or :class:`range` objects) of permutations.
+    n_done : PermutationProgress
+        When permutations are evaluated by worker processes, the progress of
+        the workers.
+    max_pending : int
+        With ``n_done``, the maximum number of ranges that are yielded before
+        they are complete.
+
+    Notes
+    -----
+    Without ``n_done``, the distributions are checked every
+    :data:`STOP_CHECK_INTERVAL` permutations (all permutations yielded so far
+    are complete). With ``n_done``, up to ``max_pending`` ranges are kept in
+    flight, and the distributions are checked whenever the completed prefix
+    has grown by :data:`STOP_CHECK_INTERVAL`, without waiting for pending
+    ranges. When stopping, all distributions are truncated to the permutations
+    that were used.
+    """
+    if n_done is not None:
+        n_yielded = 0
+        checked = start
+        for perm in iterator:
+            while n_yielded - n_done.n_ranges >= max_pending:
+                sleep(0.01)
+            if n_done.value >= checked + STOP_CHECK_INTERVAL:
+                checked = n_done.value
+                if all(d._permutation_decided(checked) for d in dists):
+                    for d in dists:
+                        d._stop_permutation(checked)
+                    return
+            yield perm
+            n_yielded += 1
+        return
+
+    n = start
+    next_check = start
+    for perm in iterator:
+        if n >= next_check:
+            if all(d._permutation_decided(n) for d in dists):
+                for d in dists:
+                    d._stop_permutation(n)
+                return
+            next_check = n + STOP_CHECK_INTERVAL
+        yield perm
+        n += len(perm) if block else 1
+
+
+def permutation_ranges(start, stop, block_size=1):
+    """Split permutations into ranges for worker processes
+
+    Parameters
+    ----------
+    start : int
+        Index of the first permutation.
+    stop : int
+        Number of permutations.
+    block_size : int
+        Minimum size of the ranges.
+
+    Yields
+    ------
+    permutation_range : range
+        Indexes of consecutive permutations.
+    """
+    n = (stop - start) // (4 * CONFIG['n_workers'])
+    size = max(block_size, min(n, STOP_CHECK_INTERVAL))
+    for i in range(start, stop, size):
+        yield range(i, min(i + size, stop))
+
+
+def iter_permutation_ranges(in_queue, kill_beacon, permutations, start):
+    """Generate the permutations for ranges received by a worker process
+
+    Parameters
+    ----------
+    in_queue : SimpleQueue
+        Queue with :class:`range` objects (``None`` to stop).
+    kill_beacon : Event
+        Stop when set.
+    permutations : callable
+        Function that returns an iterator over the permutations, starting with
+        permutation ``start``.
+    start : int
+        Index of the first permutation.
+
+    Yields
+    ------
+    permutation_range : range
+        Indexes of the permutations.
+    iterator : iterator
+        Iterator that yields the permutations in ``permutation_range`` (needs
+        to be exhausted for ``len(permutation_range)`` permutations before
+        the next range is requested).
+    """
+    iterator = iter(permutations())
+    i = start
     while not kill_beacon.is_set():
-        perm = in_queue.get()
-        if perm is None:
+        permutation_range = in_queue.get()
+        if permutation_range is None:
             break
-        test_func(y, *args, stat_map_flat, perm)
-        max_v = map_processor.max_stat(stat_map)
-        out_queue.put(max_v)
+        if permutation_range.start > i:
+            # skip permutations evaluated by other workers
+            n_skip = permutation_range.start - i
+            next(islice(iterator, n_skip, n_skip), None)
+        yield permutation_range, islice(iterator, len(permutation_range))
+        i = permutation_range.stop
 
 
-def run_permutation(test_func, dist, iterator, *args):
-    if CONFIG['n_workers']:
-        workers, out_queue, kill_beacon = setup_workers(test_func, dist, args)
-
-        try:
-            for perm in iterator:
-                out_queue.put(perm)
-
-            for _ in range(len(workers) - 1):
-                out_queue.put(None)
-
-            logger = logging.getLogger(__name__)
-            for w in workers:
-                w.join()
-                logger.debug("worker joined")
-        except KeyboardInterrupt:
-            kill_beacon.set()
-            raise
-    else:
-        y = dist.data_for_permutation(False)
-        map_processor = get_map_processor(*dist.map_args)
-        stat_map = np.empty(dist.shape)
-        stat_map_flat = stat_map.ravel()
-        for i, perm in enumerate(iterator):
+def permutation_worker(in_queue, out_queue, kill_beacon, y, dist, start,
+                       permutations, stat_map_shape, test_func, args, map_args,
+                       block_size=1):
+    "Worker for 1 sample t-test"
+    y = y.array
+    dists = [dist]
+    dist = dist.array
+    map_processor = get_map_processor(*map_args)
+    ranges = iter_permutation_ranges(in_queue, kill_beacon, permutations, start)
+    if block_size > 1:
+        stat_maps = np.empty((block_size, *stat_map_shape), y.dtype)
+        stat_maps_flat = stat_maps.reshape((block_size, -1))
+        for permutation_range, iterator in ranges:
+            i = permutation_range.start
+            for perms in permutation_blocks(iterator, block_size):
+                n_block = len(perms)
+                test_func(y, *args, stat_maps_flat[:n_block], perms)
+                dist[i: i + n_block] = map_processor.max_stats(stat_maps[:n_block])
+                i += n_block
+            out_queue.put(permutation_range_result(permutation_range, dists))
+        return
+
+    stat_map = np.empty(stat_map_shape, y.dtype)
+    stat_map_flat = stat_map.ravel()
+    for permutation_range, iterator in ranges:
+        for i, perm in zip(permutation_range, iterator):
             test_func(y, *args, stat_map_flat, perm)
-            dist.dist[i] = map_processor.max_stat(stat_map)
-    dist.finalize()
+            dist[i] = map_processor.max_stat(stat_map)
+        out_queue.put(permutation_range_result(permutation_range, dists))
 
 
-def setup_workers(test_func, dist, func_args):
-    "Initialize workers for permutation tests"
-    logger = logging.getLogger(__name__)
-    logger.debug("Setting up %i worker processes..." % CONFIG['n_workers'])
-    permutation_queue = mpc.SimpleQueue()
-    dist_queue = mpc.SimpleQueue()
-    kill_beacon = mpc.Event()
+def permutation_range_result(permutation_range, dists):
+    """Result of a worker for a range of permutations
+
+    Parameters
+    ----------
+    permutation_range : range
+        Indexes of the permutations that were evaluated.
+    dists : list of SharedArray | LocalArray | None
+        The worker's permutation distributions.
+
+    Returns
+    -------
+    result : range | tuple
+        ``permutation_range`` if all distributions are shared with the main
+        process; otherwise ``(permutation_range, values)`` with the values of
+        each distribution (with remote workers).
+    """
+    if all(d is None or d.is_shared for d in dists):
+        return permutation_range
+    index = slice(permutation_range.start, permutation_range.stop)
+    return permutation_range, [None if d is None else d.array[index] for d in dists]
+
 
-    restore_main_spec()
+def add_permutation_range_result(result, dists):
+    """Add a result of :func:`permutation_range_result` to the distributions
 
-    # permutation workers
-    y, y_flat_shape, stat_map_shape = dist.data_for_permutation()
-    args = (permutation_queue, dist_queue, y, y_flat_shape, stat_map_shape,
-            test_func, func_args, dist.map_args, kill_beacon)
-    workers = []
-    for _ in range(CONFIG['n_workers']):
-        w = mpc.Process(target=permutation_worker, args=args)
-        w.start()
-        workers.append(w)
+    Returns
+    -------
+    permutation_range : range
+        Indexes of the permutations in ``result``.
+    """
+    if isinstance(result, range):
+        return result
+    permutation_range, values = result
+    index = slice(permutation_range.start, permutation_range.stop)
+    for dist, value in zip(dists, values):
+        if value is not None:
+            dist[index] = value
+    return permutation_range
 
-    # distribution worker
-    args = (dist.dist_array, dist.dist_shape, dist_queue, kill_beacon)
-    w = mpc.Process(target=distribution_worker, args=args)
-    w.start()
-    workers.append(w)
 
-    return workers, permutation_queue, kill_beacon
+def run_permutation(test_func, dist, permutations, *args, block_func=None):
+    """Compute the permutation distribution
 
+    Parameters
+    ----------
+    test_func : callable
+        Compute the statistical map for one permutation,
+        ``test_func(y, *args, out, perm)``.
+    dist : NDPermutationDistribution
+        Distribution in which to collect the results.
+    permutations : callable
+        Function that returns an iterator over permutations (worker processes
+        call this function to generate the permutations locally, so it needs
+        to be picklable and return the same sequence on every call).
+    ...
+        Additional arguments for ``test_func``.
+    block_func : callable
+        Batched version of ``test_func`` that computes the statistical maps for
+        a block of permutations, ``block_func(y, *args, out, perms)``, with
+        ``out`` of shape ``(n_perm, n_tests)`` and ``perms`` of shape
+        ``(n_perm, n_cases)`` (used when ``permutation_block_size > 1`` in
+        :func:`configure`).
+    """
+    block_size = CONFIG['permutation_block_size'] if block_func else 1
+    if block_size > 1:
+        test_func = block_func
 
-def run_permutation_me(test, dists, iterator):
+    if CONFIG['n_workers']:
+        start = dist.n_resumed
+        ranges = permutation_ranges(start, dist.samples, block_size)
+        n_done = PermutationProgress(start)
+        if dist.stop_alpha:
+            ranges = stop_when_decided(ranges, [dist], start, True, n_done, 2 * CONFIG['n_workers'])
+        with worker_pool() as pool, tqdm(total=dist.samples, initial=start, desc="Permutation test", unit=' permutations', disable=CONFIG['tqdm']) as progress:
+            y = pool.share(dist.data_for_permutation())
+            shared_dist = pool.share(dist.dist)
+            dist.dist = shared_dist.array
+            worker_args = (y, shared_dist, start, permutations, dist.shape, test_func, args, dist.map_args, block_size)
+            # dist.dist is truncated when stopping while ranges are pending
+            dist_arrays = [dist.dist]
+            for result in pool.run(permutation_worker, worker_args, ranges):
+                permutation_range = add_permutation_range_result(result, dist_arrays)
+                if permutation_range.start >= dist.samples:
+                    continue  # evaluated after stopping
+                progress.update(len(permutation_range))
+                n_done.add(permutation_range)
+            dist.dist = np.array(dist.dist)
+        dist.finalize()
+        return
+
+    y = dist.data_for_permutation()
+    map_processor = get_map_processor(*dist.map_args)
+    if block_size > 1:
+        blocks = permutation_blocks(permutations(), block_size)
+        if dist.stop_alpha:
+            blocks = stop_when_decided(blocks, [dist], dist.n_resumed, True)
+        stat_maps = np.empty((block_size, *dist.shape), dist.dtype)
+        stat_maps_flat = stat_maps.reshape((block_size, -1))
+        i = dist.n_resumed
+        for perms in blocks:
+            n_block = len(perms)
+            test_func(y, *args, stat_maps_flat[:n_block], perms)
+            dist.dist[i: i + n_block] = map_processor.max_stats(stat_maps[:n_block])
+            i += n_block
+    else:
+        iterator = permutations()
+        if dist.stop_alpha:
+            iterator = stop_when_decided(iterator, [dist], dist.n_resumed)
+        stat_map = np.empty(dist.shape, dist.dtype)
+        stat_map_flat = stat_map.ravel()
+        for i, perm in enumerate(iterator, dist.n_resumed):
+            test_func(y, *args, stat_map_flat, perm)
+            dist.dist[i] = map_processor.max_stat(stat_map)
+    dist.finalize()
+
+
+def run_permutation_me(test, dists, permutations):
     dist = dists[0]
     if dist.kind == 'cluster':
         thresholds = tuple(d.threshold for d in dists)
     else:
         thresholds = None
 
+    start = max(d.n_resumed for d in dists)
+    stop_dists = [d for d in dists if d.do_permutation]
+    stop = all(d.stop_alpha for d in stop_dists)
+
+    block_size = CONFIG['permutation_block_size']
     if CONFIG['n_workers']:
-        workers, out_queue, kill_beacon = setup_workers_me(test, dists, thresholds)
-
-        try:
-            for perm in iterator:
-                out_queue.put(perm)
-
-            for _ in range(len(workers) - 1):
-                out_queue.put(None)
-
-            logger = logging.getLogger(__name__)
-            for w in workers:
-                w.join()
-                logger.debug("worker joined")
-        except KeyboardInterrupt:
-            kill_beacon.set()
-            raise
+        ranges = permutation_ranges(start, dist.samples, block_size)
+        n_done = PermutationProgress(start)
+        if stop:
+            ranges = stop_when_decided(ranges, stop_dists, start, True, n_done, 2 * CONFIG['n_workers'])
+        with worker_pool() as pool, tqdm(total=dist.samples, initial=start, desc="Permutation test", unit=' permutations', disable=CONFIG['tqdm']) as progress:
+            y = pool.share(dist.data_for_permutation())
+            shared_dists = []
+            for d in dists:
+                if d.do_permutation:
+                    shared_dist = pool.share(d.dist)
+                    d.dist = shared_dist.array
+                else:
+                    shared_dist = None
+                shared_dists.append(shared_dist)
+            worker_args = (y, shared_dists, start, permutations, dist.shape, test, dist.map_args, thresholds, block_size)
+            # d.dist is truncated when stopping while ranges are pending
+            dist_arrays = [d.dist for d in dists]
+            for result in pool.run(permutation_worker_me, worker_args, ranges):
+                permutation_range = add_permutation_range_result(result, dist_arrays)
+                if permutation_range.start >= dist.samples:
+                    continue  # evaluated after stopping
+                progress.update(len(permutation_range))
+                n_done.add(permutation_range)
+            for d in stop_dists:
+                d.dist = np.array(d.dist)
+    elif block_size > 1:
+        blocks = permutation_blocks(permutations(), block_size)
+        if stop:
+            blocks = stop_when_decided(blocks, stop_dists, start, True)
+        y = dist.data_for_permutation()
+        map_processor = get_map_processor(*dist.map_args)
+        stat_maps = test.preallocate(dist.shape, dist.dtype, block_size)
+        dist_arrays = [d.dist if d.do_permutation else None for d in dists]
+        i = start
+        for perms in blocks:
+            n_block = len(perms)
+            test.map_block(y, perms)
+            add_max_stats_me(map_processor, stat_maps[:, :n_block], thresholds, dist_arrays, slice(i, i + n_block))
+            i += n_block
     else:
-        y = dist.data_for_permutation(False)
+        iterator = permutations()
+        if stop:
+            iterator = stop_when_decided(iterator, stop_dists, start)
+        y = dist.data_for_permutation()
         map_processor = get_map_processor(*dist.map_args)
 
-        stat_maps = test.preallocate(dist.shape)
+        stat_maps = test.preallocate(dist.shape, dist.dtype)
         if thresholds:
             stat_maps_iter = tuple(zip(stat_maps, thresholds, dists))
         else:
             stat_maps_iter = tuple(zip(stat_maps, dists))
 
-        for i, perm in enumerate(iterator):
+        for i, perm in enumerate(iterator, start):
             test.map(y, perm)
             if thresholds:
                 for m, t, d in stat_maps_iter:
@@ -3834,80 +4446,71 @@ def run_permutation_me(test, dists, iterator):
                     if d.do_permutation:
                         d.dist[i] = map_processor.max_stat(m)
 
-    for d in dists:
-        if d.do_permutation:
-            d.finalize()
-
-
-def setup_workers_me(test_func, dists, thresholds):
-    "Initialize workers for permutation tests"
-    logger = logging.getLogger(__name__)
-    logger.debug("Setting up %i worker processes..." % CONFIG['n_workers'])
-    permutation_queue = mpc.SimpleQueue()
-    dist_queue = mpc.SimpleQueue()
-    kill_beacon = mpc.Event()
-
-    restore_main_spec()
-
-    # permutation workers
-    dist = dists[0]
-    y, y_flat_shape, stat_map_shape = dist.data_for_permutation()
-    args = (permutation_queue, dist_queue, y, y_flat_shape, stat_map_shape,
-            test_func, dist.map_args, thresholds, kill_beacon)
-    workers = []
-    for _ in range(CONFIG['n_workers']):
-        w = mpc.Process(target=permutation_worker_me, args=args)
-        w.start()
-        workers.append(w)
-
-    # distribution worker
-    args = ([d.dist_array for d in dists], dist.dist_shape, dist_queue, kill_beacon)
-    w = mpc.Process(target=distribution_worker_me, args=args)
-    w.start()
-    workers.append(w)
-
-    return workers, permutation_queue, kill_beacon
-
-
-def permutation_worker_me(in_queue, out_queue, y, y_flat_shape, stat_map_shape,
-                          test, map_args, thresholds, kill_beacon):
-    if CONFIG['nice']:
-        os.nice(CONFIG['nice'])
-
-    n = reduce(operator.mul, y_flat_shape)
-    y = np.frombuffer(y, np.float64, n).reshape(y_flat_shape)
-    iterator = test.preallocate(stat_map_shape)
+    for d in stop_dists:
+        d.finalize()
+
+
+def permutation_worker_me(in_queue, out_queue, kill_beacon, y, dists, start,
+                          permutations, stat_map_shape, test, map_args,
+                          thresholds, block_size=1):
+    y = y.array
+    dist_arrays = [d if d is None else d.array for d in dists]
+    if block_size > 1:
+        stat_maps = test.preallocate(stat_map_shape, y.dtype, block_size)
+        map_processor = get_map_processor(*map_args)
+        for permutation_range, iterator in iter_permutation_ranges(in_queue, kill_beacon, permutations, start):
+            i = permutation_range.start
+            for perms in permutation_blocks(iterator, block_size):
+                n_block = len(perms)
+                test.map_block(y, perms)
+                add_max_stats_me(map_processor, stat_maps[:, :n_block], thresholds, dist_arrays, slice(i, i + n_block))
+                i += n_block
+            out_queue.put(permutation_range_result(permutation_range, dists))
+        return
+
+    stat_maps = test.preallocate(stat_map_shape, y.dtype)
     if thresholds:
-        iterator = tuple(zip(iterator, thresholds))
+        stat_maps_iter = tuple(zip(stat_maps, thresholds, dist_arrays))
     else:
-        iterator = tuple(iterator)
+        stat_maps_iter = tuple(zip(stat_maps, dist_arrays))
     map_processor = get_map_processor(*map_args)
-    while not kill_beacon.is_set():
-        perm = in_queue.get()
-        if perm is None:
-            break
-        test.map(y, perm)
+    for permutation_range, iterator in iter_permutation_ranges(in_queue, kill_beacon, permutations, start):
+        for i, perm in zip(permutation_range, iterator):
+            test.map(y, perm)
+            if thresholds:
+                for m, t, d in stat_maps_iter:
+                    if d is not None:
+                        d[i] = map_processor.max_stat(m, t)
+            else:
+                for m, d in stat_maps_iter:
+                    if d is not None:
+                        d[i] = map_processor.max_stat(m)
+        out_queue.put(permutation_range_result(permutation_range, dists))
 
-        if thresholds:
-            max_v = [map_processor.max_stat(m, t) for m, t in iterator]
-        else:
-            max_v = [map_processor.max_stat(m) for m in iterator]
-        out_queue.put(max_v)
-
-
-def distribution_worker_me(dist_arrays, dist_shape, in_queue, kill_beacon):
-    "Worker that accumulates values and places them into the distribution"
-    n = reduce(operator.mul, dist_shape)
-    dists = [d if d is None else np.frombuffer(d, np.float64, n).reshape(dist_shape)
-             for d in dist_arrays]
-    samples = dist_shape[0]
-    for i in trange(samples, desc="Permutation test", unit=' permutations',
-                    disable=CONFIG['tqdm']):
-        for dist, v in zip(dists, in_queue.get()):
-            if dist is not None:
-                dist[i] = v
-        if kill_beacon.is_set():
-            return
+
+def add_max_stats_me(map_processor, stat_maps, thresholds, dists, index):
+    """Add the maximum statistics for a block of permutations
+
+    Parameters
+    ----------
+    map_processor : StatMapProcessor
+        Map processor.
+    stat_maps : array  (n_effects, n_perm, ...)
+        Statistical maps for each effect and permutation.
+    thresholds : tuple | None
+        Cluster-forming threshold for each effect.
+    dists : list of array | None
+        Distribution for each effect (``None`` for effects without permutation).
+    index : slice
+        Index of the permutations in the distributions.
+    """
+    for i, (maps, dist) in enumerate(zip(stat_maps, dists)):
+        if dist is None:
+            continue
+        elif thresholds:
+            dist[index] = [map_processor.max_stat(m, thresholds[i]) for m in maps]
+        else:
+            dist[index] = map_processor.max_stats(maps)
 
 
 # Backwards compatibility for pickling
@@ -498,3 +498,21 @@ def test_lmfitter():
     for f_test, f_map, p_map in zip(aov.f_tests, f_maps, p_maps):
         assert f_map[0] == pytest.approx(f_test.F)
         assert p_map[0] == pytest.approx(f_test.p)
+
+
+def test_lmfitter_block():
+    "Test fitting blocks of permutations with the _nd_anova classes"
+    ds = datasets.get_uts(True)
+    y = ds['utsnd'].x.copy()
+    y[:, 0, 0] = 1  # zero variance
+    for x, unit in ((ds.eval("A * B"), None), (ds[3:].eval("A * B"), None), (ds.eval("A * B * rm"), ds['rm'])):
+        n = len(x)
+        perms = np.array(list(permute_order(n, 5, unit=unit if unit is None else unit[:n])))
+        for lm in (glm._nd_anova(x), glm._IncrementalNDANOVA(x)):
+            f_maps = np.stack([lm.map(y[:n], perm) for perm in perms], 1)
+            f_maps[:, :, 0, 0] = 0
+            assert_allclose(lm.map_block(y[:n], perms), f_maps, rtol=1e-10, atol=1e-10)
+            # preallocated
+            out = lm.preallocate(y.shape[1:], block_size=7)
+            lm.map_block(y[:n], perms)
+            assert_allclose(out[:, :5], f_maps, rtol=1e-10, atol=1e-10)
@@ -1,7 +1,7 @@
 # Author: Christian Brodbeck <christianbrodbeck@nyu.edu>
 import numpy as np
 import scipy.stats
-from numpy.testing import assert_allclose
+from numpy.testing import assert_allclose, assert_array_equal
 from eelbrain import datasets
 from eelbrain._stats import opt
 from eelbrain._stats.permutation import permute_sign_flip
@@ -25,3 +25,11 @@ def test_t_1samp():
         opt.t_1samp_perm(y, t_perm, sign)
         opt.t_1samp(y * sign[:,None], t)
         assert_allclose(t_perm, t)
+
+    # block of permutations
+    signs = np.array(list(sign.copy() for sign in permute_sign_flip(n_cases, 5)))
+    t_block = np.empty((len(signs), y.shape[1]))
+    opt.t_1samp_perm_block(y, t_block, signs)
+    for sign, t_b in zip(signs, t_block):
+        opt.t_1samp_perm(y, t_perm, sign)
+        assert_array_equal(t_b, t_perm)
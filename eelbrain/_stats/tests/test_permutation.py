@@ -5,7 +5,7 @@ import numpy as np
 
 from eelbrain import Factor, Var
 from eelbrain._stats.permutation import (
-    resample, permute_order, permute_sign_flip)
+    resample, permute_order, permute_sign_flip, random_seeds)
 
 
 def test_permutation():
@@ -33,6 +33,12 @@ def test_permutation():
     # make sure sequence is stable
     assert list(map(tuple, permute_order(4, 3))) == [(2, 3, 1, 0), (2, 1, 3, 0), (0, 2, 3, 1)]
 
+    # resume sequence
+    full = list(map(tuple, permute_order(6, 20, unit=s)))
+    assert list(map(tuple, permute_order(6, 20, unit=s, skip=5))) == full[5:]
+    seeds = random_seeds(20)
+    assert np.array_equal(random_seeds(20, skip=5), seeds[5:])
+
 
 def test_permutation_sign_flip():
     "Test permute_sign_flip()"
@@ -57,3 +63,14 @@ def test_permutation_sign_flip():
     else:
         target = [(-1, 1, -1, -1), (-1, -1, 1, -1), (1, -1, -1, 1)]
     assert list(map(tuple, permute_sign_flip(4, 3))) == target
+
+    # resume sequence: continues the sequence of a longer or shorter run
+    for n, samples, skip in ((6, 40, 10), (14, 40, 10), (20, 40, 10), (66, 4, 2)):
+        full = list(map(tuple, permute_sign_flip(n, samples)))
+        rest = list(map(tuple, permute_sign_flip(n, samples, skip=skip)))
+        assert len(rest) == samples - skip
+        assert rest == full[skip:]
+        assert len(set(full)) == samples
+        # resume after stopping a run with more samples
+        first = list(map(tuple, permute_sign_flip(n, 2 * samples)))[:skip]
+        assert first + rest == full
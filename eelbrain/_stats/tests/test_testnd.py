@@ -7,11 +7,14 @@ import sys
 
 import numpy as np
 from numpy.testing import assert_array_equal, assert_allclose
+from scipy import ndimage
 
 import eelbrain
-from eelbrain import Dataset, NDVar, Categorial, Scalar, UTS, Sensor, configure, datasets, test, testnd, set_log_level, cwt_morlet
+from eelbrain import Dataset, Factor, NDVar, Var, Categorial, Scalar, UTS, Sensor, configure, datasets, test, testnd, set_log_level, cwt_morlet
 from eelbrain._exceptions import WrongDimension, ZeroVariance
-from eelbrain._stats.testnd import Connectivity, NDPermutationDistribution, label_clusters, _MergedTemporalClusterDist, find_peaks, VectorDifferenceIndependent
+from eelbrain._stats import stats
+from eelbrain._stats.permutation import permute_order
+from eelbrain._stats.testnd import Connectivity, NDPermutationDistribution, label_clusters, label_clusters_binary, _MergedTemporalClusterDist, find_peaks, flatten, tfce, _tfce, VectorDifferenceIndependent
 from eelbrain._utils.system import IS_WINDOWS
 from eelbrain.fmtxt import asfmtext
 from eelbrain.testing import assert_dataobj_equal, assert_dataset_equal, requires_mne_sample_data
@@ -156,6 +159,25 @@ def test_anova_incremental():
     testnd.ANOVA('uts', 'A*B', ds=ds[3:], pmin=0.05, samples=10)
 
 
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_anova_block(n_workers):
+    "Test batched permutations for testnd.ANOVA()"
+    ds = datasets.get_uts(True)
+    configure(n_workers=n_workers)
+    try:
+        for x, kwargs in (('A*B*rm', {}), ('A*B*rm', {'tfce': True}), ('A*B', {}), ('A*B', {'pmin': 0.05})):
+            res = testnd.ANOVA('utsnd', x, ds=ds[3:] if x == 'A*B' else ds, samples=20, **kwargs)
+            configure(permutation_block_size=7)
+            try:
+                res_b = testnd.ANOVA('utsnd', x, ds=ds[3:] if x == 'A*B' else ds, samples=20, **kwargs)
+            finally:
+                configure(permutation_block_size=1)
+            for cdist, cdist_b in zip(res._cdist, res_b._cdist):
+                assert_allclose(cdist_b.dist, cdist.dist, rtol=1e-10)
+    finally:
+        configure(n_workers=True)
+
+
 @requires_mne_sample_data
 def test_anova_parc():
     "Test ANOVA with parc argument and source space data"
@@ -381,6 +403,20 @@ def test_corr():
     res = testnd.Correlation('utsnd', 'Y', ds=ds, samples=10, tfce=True)
     repr(res)
 
+    # permutation distribution
+    res_raw = testnd.Correlation('utsnd', 'Y', ds=ds, samples=10)
+    y = utsnd.x.reshape((len(utsnd), -1))
+    y = y - y.mean(0)
+    x = Y.x - Y.x.mean()
+    dist = [np.abs(stats.corr(y, x, perm=perm)).max() for perm in permute_order(len(y), 10)]
+    assert_allclose(res_raw._cdist.dist, dist)
+    configure(permutation_block_size=4)
+    try:
+        res_block = testnd.Correlation('utsnd', 'Y', ds=ds, samples=10)
+    finally:
+        configure(permutation_block_size=1)
+    assert_allclose(res_block._cdist.dist, res_raw._cdist.dist)
+
     # persistence
     string = pickle.dumps(res, protocol=pickle.HIGHEST_PROTOCOL)
     res_ = pickle.loads(string)
@@ -389,6 +425,275 @@ def test_corr():
     assert_dataobj_equal(res.p, res_.p)
 
 
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_resume(n_workers):
+    "Test resuming permutations from a previous test"
+    ds = datasets.get_uts(True)
+    ds_different = ds.copy()
+    weights = Var(np.linspace(1, 2, ds.n_cases))
+    for key in ('uts', 'utsnd'):
+        ds_different[key] = ds[key] * weights
+    configure(n_workers=n_workers)
+    try:
+        for cls, args, kwargs in (
+                (testnd.TTestOneSample, ('uts',), {'pmin': 0.05}),
+                (testnd.TTestRelated, ('uts', 'A', 'a1', 'a0', 'rm'), {'tfce': True}),
+                (testnd.TTestIndependent, ('utsnd', 'A'), {}),
+                (testnd.ANOVA, ('uts', 'A*B*rm'), {'pmin': 0.05}),
+        ):
+            res = cls(*args, ds=ds, samples=20, **kwargs)
+            res_10 = cls(*args, ds=ds, samples=10, **kwargs)
+            res_10 = pickle.loads(pickle.dumps(res_10, pickle.HIGHEST_PROTOCOL))
+            res_20 = cls(*args, ds=ds, samples=20, resume=res_10, **kwargs)
+            cdists = res._cdist if isinstance(res._cdist, list) else [res._cdist]
+            cdists_20 = res_20._cdist if isinstance(res_20._cdist, list) else [res_20._cdist]
+            for cdist, cdist_20 in zip(cdists, cdists_20):
+                if not cdist.do_permutation:
+                    continue
+                assert cdist_20.n_resumed == 10
+                assert_array_equal(cdist_20.dist, cdist.dist)
+            # different data
+            with pytest.raises(ValueError):
+                cls(*args, ds=ds_different, samples=20, resume=res_10, **kwargs)
+        # different effects
+        res_10 = testnd.ANOVA('uts', 'A+B', ds=ds, samples=10, pmin=0.05)
+        with pytest.raises(ValueError, match="missing 'A x B'"):
+            testnd.ANOVA('uts', 'A*B', ds=ds, samples=20, pmin=0.05, resume=res_10)
+    finally:
+        configure(n_workers=True)
+
+
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_sequential_stopping(n_workers):
+    "Test stopping permutations once all decisions are fixed"
+    ds = datasets.get_uts(True)
+    ds['R'] = Factor('ab', repeat=30)[np.random.RandomState(1).permutation(60)]
+    configure(n_workers=n_workers)
+    try:
+        for cls, args, kwargs, effect in (
+                (testnd.TTestIndependent, ('uts', 'R'), {'pmin': 0.05}, False),
+                (testnd.TTestIndependent, ('uts', 'R'), {'tfce': True}, False),
+                (testnd.TTestIndependent, ('utsnd', 'R'), {}, False),
+                (testnd.TTestIndependent, ('uts', 'A'), {'pmin': 0.05}, True),
+                (testnd.ANOVA, ('uts', 'A*B*rm'), {'pmin': 0.05}, True),
+        ):
+            configure(permutation_stop_alpha=False)
+            res = cls(*args, ds=ds, samples=1000, **kwargs)
+            configure(permutation_stop_alpha=0.05)
+            res_stop = cls(*args, ds=ds, samples=1000, **kwargs)
+            ps = res.p if isinstance(res.p, list) else [res.p]
+            ps_stop = res_stop.p if isinstance(res_stop.p, list) else [res_stop.p]
+            cdists = res_stop._cdist if isinstance(res_stop._cdist, list) else [res_stop._cdist]
+            for p, p_stop, cdist in zip(ps, ps_stop, cdists):
+                assert_array_equal(p_stop <= 0.05, p <= 0.05)
+                if effect:
+                    assert cdist.samples == 1000
+                else:
+                    assert cdist.samples < 1000
+                    assert len(cdist.dist) == cdist.samples
+                    assert "Sequential stopping" in str(res_stop.info_list())
+            res_pickled = pickle.loads(pickle.dumps(res_stop, pickle.HIGHEST_PROTOCOL))
+            assert repr(res_pickled) == repr(res_stop)
+        # batched permutations
+        ds['noise'] = NDVar(np.random.RandomState(0).normal(size=ds['uts'].x.shape), ds['uts'].dims)
+        for kwargs in ({'pmin': 0.05}, {'tfce': True}):
+            configure(permutation_stop_alpha=False)
+            res = testnd.TTestOneSample('noise', ds=ds, samples=1000, **kwargs)
+            configure(permutation_stop_alpha=0.05)
+            res_stop = testnd.TTestOneSample('noise', ds=ds, samples=1000, **kwargs)
+            configure(permutation_block_size=4)
+            res_block = testnd.TTestOneSample('noise', ds=ds, samples=1000, **kwargs)
+            configure(permutation_block_size=1)
+            assert res_block._cdist.samples < 1000
+            assert_array_equal(res_block.p <= 0.05, res.p <= 0.05)
+            if not n_workers:
+                assert res_block._cdist.samples == res_stop._cdist.samples
+                assert_array_equal(res_block._cdist.dist, res_stop._cdist.dist)
+    finally:
+        configure(n_workers=True, permutation_stop_alpha=False, permutation_block_size=1)
+
+
+def test_sequential_stopping_remote(monkeypatch):
+    "Test sequential stopping with workers that return results by value"
+    import socket
+    from eelbrain._config import mpc
+    from eelbrain._utils import parallel
+
+    ds = datasets.get_uts(True)
+    ds['noise'] = NDVar(np.random.RandomState(0).normal(size=ds['uts'].x.shape), ds['uts'].dims)
+    ds['R'] = Factor('ab', repeat=30)[np.random.RandomState(1).permutation(60)]
+    configure(n_workers=0)
+    res_ref = testnd.TTestOneSample('noise', ds=ds, samples=2000, pmin=0.05)
+    anova_ref = testnd.ANOVA('uts', 'R', ds=ds, samples=2000, pmin=0.05)
+    monkeypatch.setenv('EELBRAIN_AUTHKEY', 'test-key')
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+    processes = [mpc.Process(target=parallel.remote_worker, args=(('localhost', port), b'test-key', 0.1), daemon=True) for _ in range(2)]
+    for process in processes:
+        process.start()
+    configure(n_workers=2, executor=f'localhost:{port}', permutation_stop_alpha=0.05)
+    try:
+        res = testnd.TTestOneSample('noise', ds=ds, samples=2000, pmin=0.05)
+        anova = testnd.ANOVA('uts', 'R', ds=ds, samples=2000, pmin=0.05)
+    finally:
+        configure(n_workers=True, executor='multiprocessing', permutation_stop_alpha=False)
+        for process in processes:
+            process.terminate()
+    for result, result_ref in ((res, res_ref), (anova, anova_ref)):
+        cdists = result._cdist if isinstance(result._cdist, list) else [result._cdist]
+        cdists_ref = result_ref._cdist if isinstance(result_ref._cdist, list) else [result_ref._cdist]
+        for cdist, cdist_ref in zip(cdists, cdists_ref):
+            assert cdist.samples < 2000
+            assert len(cdist.dist) == cdist.samples
+            assert_array_equal(cdist.dist, cdist_ref.dist[:cdist.samples])
+
+
+def test_persistent_workers():
+    "Test reusing worker processes across tests"
+    from eelbrain._utils import parallel
+
+    ds = datasets.get_uts(True)
+    configure(n_workers=0)
+    res_ref = testnd.TTestRelated('uts', 'A', match='rm', ds=ds, samples=20, pmin=0.05)
+    anova_ref = testnd.ANOVA('uts', 'A*B*rm', ds=ds, samples=20, tfce=True)
+    configure(n_workers=2, persistent_workers=True)
+    try:
+        res = testnd.TTestRelated('uts', 'A', match='rm', ds=ds, samples=20, pmin=0.05)
+        pool = parallel.POOL
+        pids = [process.pid for process in pool._processes]
+        anova = testnd.ANOVA('uts', 'A*B*rm', ds=ds, samples=20, tfce=True)
+        assert parallel.POOL is pool
+        assert [process.pid for process in pool._processes] == pids
+        assert not pool._shared
+    finally:
+        configure(n_workers=True, persistent_workers=False)
+    assert parallel.POOL is None
+    assert not any(process.is_alive() for process in pool._processes)
+    # workers generate the same permutations
+    assert_array_equal(res._cdist.dist, res_ref._cdist.dist)
+    for cdist, cdist_ref in zip(anova._cdist, anova_ref._cdist):
+        assert_array_equal(cdist.dist, cdist_ref.dist)
+    # workers close nested shared arrays at the end of each job
+    shared = [parallel.SharedArray(np.arange(3)) for _ in range(3)]
+    try:
+        args = (shared[0], [shared[1], None], 1.5, {'a': (shared[2],)})
+        assert list(parallel.find_shared_arrays(args)) == shared
+    finally:
+        for shared_array in shared:
+            shared_array.unlink()
+
+
+def test_memmap_workers(tmp_path, monkeypatch):
+    "Test worker processes with data backed by a memory-mapped file"
+    from eelbrain._utils.parallel import SharedArray, WorkerPool
+
+    ds = datasets.get_uts(True)
+    y = ds['utsnd']
+    np.save(tmp_path / 'y.npy', y.x)
+    x = np.load(tmp_path / 'y.npy', mmap_mode='r')
+    # views are transferred without copying the data
+    for view in (x, x[5:], x[:, 1:], x[2:, :, ::2]):
+        shared = SharedArray(view)
+        assert shared._file is not None
+        shared_view = pickle.loads(pickle.dumps(shared))
+        assert_array_equal(shared_view.array, view)
+    shared = SharedArray(np.array(x))
+    assert shared._file is None
+    shared.unlink()
+
+    ds['ymm'] = NDVar(x, y.dims, 'ymm')
+    configure(n_workers=0)
+    res_ref = testnd.ANOVA('utsnd', 'A*B*rm', ds=ds, samples=10, pmin=0.05)
+    # record the arrays sent to the workers
+    shared_arrays = []
+    share = WorkerPool.share
+
+    def record_share(self, array):
+        shared_array = share(self, array)
+        shared_arrays.append(shared_array)
+        return shared_array
+
+    monkeypatch.setattr(WorkerPool, 'share', record_share)
+    configure(n_workers=2)
+    try:
+        res = testnd.ANOVA('ymm', 'A*B*rm', ds=ds, samples=10, pmin=0.05)
+    finally:
+        configure(n_workers=True)
+    # the data is mapped from the file, the distributions are in shared memory
+    y_shared, *dists_shared = shared_arrays
+    assert y_shared._file is not None
+    assert len(dists_shared) == 3
+    for shared_array in dists_shared:
+        assert shared_array.name is not None
+    for cdist, cdist_ref in zip(res._cdist, res_ref._cdist):
+        assert_array_equal(cdist.dist, cdist_ref.dist)
+
+
+@pytest.mark.parametrize('executor', ['threading', 'process-executor', 'other-executor', 'socket'])
+def test_executors(executor, monkeypatch):
+    "Test worker pool backends"
+    from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+    import socket
+    from eelbrain._config import mpc
+    from eelbrain._utils import parallel
+
+    class OtherExecutor(Executor):
+        "Executor that could run its workers on other machines"
+        def __init__(self, n):
+            self._executor = ThreadPoolExecutor(n)
+
+        def submit(self, fn, *args, **kwargs):
+            return self._executor.submit(fn, *args, **kwargs)
+
+        def shutdown(self, wait=True):
+            self._executor.shutdown(wait)
+
+    ds = datasets.get_uts(True)
+    configure(n_workers=0)
+    res_ref = testnd.TTestRelated('uts', 'A', match='rm', ds=ds, samples=20, pmin=0.05)
+    anova_ref = testnd.ANOVA('uts', 'A*B*rm', ds=ds, samples=20, tfce=True)
+    processes = []
+    if executor == 'threading':
+        pool_class = parallel.ThreadPool
+    elif executor == 'socket':
+        pool_class = parallel.SocketPool
+        monkeypatch.setenv('EELBRAIN_AUTHKEY', 'test-key')
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            port = sock.getsockname()[1]
+        executor = f'localhost:{port}'
+        processes = [mpc.Process(target=parallel.remote_worker, args=(('localhost', port), b'test-key', 0.1), daemon=True) for _ in range(2)]
+        for process in processes:
+            process.start()
+    else:
+        pool_class = parallel.ExecutorPool
+        if executor == 'process-executor':
+            executor = ProcessPoolExecutor(2, mp_context=mpc)
+        else:
+            executor = OtherExecutor(2)
+    configure(n_workers=2, executor=executor)
+    try:
+        with parallel.worker_pool() as pool:
+            assert isinstance(pool, pool_class)
+        # without persistent workers, remote workers reconnect for each test
+        res = testnd.TTestRelated('uts', 'A', match='rm', ds=ds, samples=20, pmin=0.05)
+        anova = testnd.ANOVA('uts', 'A*B*rm', ds=ds, samples=20, tfce=True)
+    finally:
+        configure(n_workers=True, executor='multiprocessing')
+        for process in processes:
+            process.terminate()
+        if not isinstance(executor, str):
+            executor.shutdown()
+    assert_array_equal(res._cdist.dist, res_ref._cdist.dist)
+    for cdist, cdist_ref in zip(anova._cdist, anova_ref._cdist):
+        assert_array_equal(cdist.dist, cdist_ref.dist)
+    # arrays sent to workers
+    for pool in (parallel.ThreadPool(0), parallel.ExecutorPool(0, OtherExecutor(1))):
+        assert isinstance(pool.share(np.arange(3)), parallel.LocalArray)
+        pool.shutdown()
+
+
 def test_t_contrast():
     ds = datasets.get_uts()
 
@@ -447,6 +752,112 @@ def test_labeling():
     assert len(cids) == 6
     assert_array_equal(cmap > 0, np.abs(pmap) > 2)
 
+    # cluster size criteria
+    rng = np.random.RandomState(0)
+    for _ in range(10):
+        pmap = rng.normal(0, 2, shape)
+        cmap, cids_all = label_clusters(pmap, 1, 0, conn, None)
+        for criteria in ([((1,), 2)], [((0,), 3)], [((1,), 2), ((0,), 3)]):
+            target = cids_all
+            for axes, v in criteria:
+                target = [i for i in target if np.count_nonzero(np.equal(cmap, i).any(axes)) >= v]
+            cmap_, cids = label_clusters(pmap, 1, 0, conn, criteria)
+            assert_array_equal(cmap_, cmap)
+            assert_array_equal(cids, target)
+
+    # cluster ids:  grid labels, merged to the lowest connected label
+    for _ in range(10):
+        bin_map = rng.normal(0, 2, shape) > 1
+        cmap_grid, n = ndimage.label(bin_map, conn.struct)
+        pairs = np.concatenate([np.column_stack((cmap_grid[src], cmap_grid[dst])) for src, dst in edges])
+        pairs = pairs[np.all(pairs > 0, 1)]
+        target = np.arange(n + 1)
+        while True:
+            new = target.copy()
+            np.minimum.at(new, pairs[:, 0], target[pairs[:, 1]])
+            np.minimum.at(new, pairs[:, 1], target[pairs[:, 0]])
+            new = new[new]
+            if np.array_equal(new, target):
+                break
+            target = new
+        cmap, cids = label_clusters_binary(bin_map, conn)
+        assert_array_equal(cmap, target[cmap_grid])
+        assert_array_equal(cids, np.unique(target[1:]))
+
+
+def test_cluster_properties():
+    "Test cluster properties for many clusters"
+    ds = datasets.get_uts(True)
+    utsnd = ds['utsnd']
+    rng = np.random.RandomState(0)
+    y = NDVar(rng.normal(0, 1, utsnd.shape), utsnd.dims)
+    res = testnd.TTestOneSample(y, pmin=0.5, samples=0)
+    clusters = res.find_clusters(maps=True)
+    assert clusters.n_cases > 20
+    cluster_map = res._cdist.cluster_map
+    for cid, n_sensors, tstart, tstop, c_map in clusters.zip('id', 'n_sensors', 'tstart', 'tstop', 'cluster'):
+        mask = cluster_map == cid
+        assert_array_equal(c_map.x, res.t.x * mask.x)
+        assert n_sensors == mask.any('time').sum()
+        times = mask.any('sensor')
+        assert tstart == times.time.times[times.x].min()
+        assert tstop == times.time.times[times.x].max() + times.time.tstep
+
+
+def test_probability_map():
+    "Test p-values from the sorted permutation distribution"
+    ds = datasets.get_uts(True)
+    utsnd = ds['utsnd']
+    categorial = Categorial('categorial', ('a', 'b'))
+    y = NDVar(utsnd.x.reshape((30, 2, 5, 100)).swapaxes(1, 2), ('case', utsnd.sensor, categorial, utsnd.time))
+    for kwargs in ({}, {'tfce': True}, {'pmin': 0.1}, {'pmin': 0.1, 'parc': 'categorial'}):
+        res = testnd.TTestOneSample(y, samples=50, **kwargs)
+        cdist = res._cdist
+        for sub in ({}, {'categorial': 'b'}) if 'parc' in kwargs else ({},):
+            p_map = res.compute_probability_map(**sub)
+            dist = cdist._aggregate_dist(**sub)
+            if cdist.kind == 'cluster':
+                target = np.ones(cdist.shape)
+                cluster_v = np.abs(ndimage.sum(cdist._original_param_map, cdist._original_cluster_map, cdist._cids))
+                for cid, v in zip(cdist._cids, cluster_v):
+                    target[cdist._original_cluster_map == cid] = np.mean(dist >= v)
+                target = target.swapaxes(0, cdist._nad_ax)
+            else:
+                stat_map = cdist.tfce_map if cdist.kind == 'tfce' else cdist.parameter_map.abs()
+                stat_map = stat_map.sub(**sub)
+                target = np.mean(dist.reshape((-1,) + (1,) * stat_map.ndim) >= stat_map.x, 0)
+            assert_allclose(p_map.x, target)
+            # memoized
+            p_map.x[:] = 2
+            assert_allclose(res.compute_probability_map(**sub).x, target)
+
+
+def test_tfce():
+    "Test TFCE sweep against labeling each height"
+    ds = datasets.get_uts(True)
+    edges = np.array([(0, 1), (0, 3), (1, 2), (2, 3)], np.uint32)
+    dims_list = [
+        ds['uts'].dims[1:],
+        ds['utsnd'].dims[1:],
+        (ds['utsnd'].sensor,),
+        (Scalar('graph', range(4), connectivity=edges), UTS(0, 0.01, 20)),
+        (Categorial('cat', ('a', 'b', 'c')), UTS(0, 0.01, 20)),
+    ]
+    rng = np.random.RandomState(0)
+    for dims in dims_list:
+        conn = Connectivity(dims)
+        shape = tuple(map(len, dims))
+        out = np.empty(shape)
+        bin_buff = np.empty(shape, np.bool8)
+        int_buff = np.empty(shape, np.uint32)
+        int_buff_flat = flatten(int_buff, conn)
+        for smooth, tail, dh in product((False, True), (0, 1, -1), (0.1, 0.37)):
+            x = rng.normal(0, 2, shape)
+            if smooth:
+                x = np.cumsum(x, -1) / 3
+            target = _tfce(x, tail, conn, out, out.ravel(), bin_buff, int_buff, int_buff_flat, int_buff.ravel(), dh)
+            assert_array_equal(tfce(x, tail, conn, dh), target)
+
 
 def test_ttest_1samp():
     "Test testnd.TTestOneSample()"
@@ -522,6 +933,76 @@ def test_ttest_1samp():
         testnd.TTestOneSample('utsnd', sub="A[:-1] == 'a0'", ds=ds, samples=0)
 
 
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_ttest_1samp_block(n_workers):
+    "Test batched permutations for testnd.TTestOneSample()"
+    ds = datasets.get_uts(True)
+    dss = ds.sub("A == 'a0'")
+    y = dss['utsnd']
+    dss['ynd'] = NDVar(y.x, ('case', Categorial('channel', y.sensor.names), y.time))
+    configure(n_workers=n_workers)
+    try:
+        for kwargs in ({}, {'pmin': 0.05}, {'tfce': True}, {'parc': 'channel'}):
+            res = testnd.TTestOneSample('ynd', ds=dss, samples=20, **kwargs)
+            configure(permutation_block_size=7)
+            try:
+                res_b = testnd.TTestOneSample('ynd', ds=dss, samples=20, **kwargs)
+            finally:
+                configure(permutation_block_size=1)
+            assert_array_equal(res_b._cdist.dist, res._cdist.dist)
+    finally:
+        configure(n_workers=True)
+
+
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_permutation_dtype(n_workers):
+    "Test permutations in single precision"
+    ds = datasets.get_uts(True, nrm=True)
+    configure(n_workers=n_workers)
+    try:
+        for kwargs in ({}, {'pmin': 0.05}, {'tfce': True}):
+            tests = [
+                (testnd.TTestOneSample, ('utsnd',)),
+                (testnd.TTestRelated, ('utsnd', 'A', 'a1', 'a0', 'rm')),
+                (testnd.TTestIndependent, ('utsnd', 'A', 'a1', 'a0')),
+                (testnd.ANOVA, ('utsnd', 'A*B*rm')),
+            ]
+            for cls, args in tests:
+                res = cls(*args, ds=ds, samples=10, **kwargs)
+                res_32 = cls(*args, ds=ds, samples=10, dtype='float32', **kwargs)
+                cdists = res._cdist if isinstance(res._cdist, list) else [res._cdist]
+                cdists_32 = res_32._cdist if isinstance(res_32._cdist, list) else [res_32._cdist]
+                for cdist, cdist_32 in zip(cdists, cdists_32):
+                    assert cdist_32.dtype == np.float32
+                    # original statistic in double precision
+                    assert_array_equal(cdist_32.parameter_map.x, cdist.parameter_map.x)
+                    if cdist.kind == 'raw':  # clusters can change at the threshold
+                        assert_allclose(cdist_32.dist, cdist.dist, 1e-5)
+                    elif cdist.do_permutation:
+                        assert len(cdist_32.dist) == len(cdist.dist)
+    finally:
+        configure(n_workers=True)
+
+    # can not resume with different dtype
+    res = testnd.TTestOneSample('utsnd', ds=ds, samples=10)
+    with pytest.raises(ValueError):
+        testnd.TTestOneSample('utsnd', ds=ds, samples=20, resume=res, dtype='float32')
+    with pytest.raises(ValueError):
+        testnd.TTestOneSample('utsnd', ds=ds, dtype='int32')
+    with pytest.raises(ValueError):
+        configure(permutation_dtype='float16')
+    # numpy dtypes
+    for dtype in (np.float32, np.dtype('float32')):
+        res = testnd.TTestOneSample('utsnd', ds=ds, samples=2, dtype=dtype)
+        assert res._cdist.dtype == np.float32
+    configure(permutation_dtype=np.float32)
+    try:
+        res = testnd.TTestOneSample('utsnd', ds=ds, samples=2)
+        assert res._cdist.dtype == np.float32
+    finally:
+        configure(permutation_dtype='float64')
+
+
 def test_ttest_ind():
     "Test testnd.TTestIndependent()"
     ds = datasets.get_uts(True)
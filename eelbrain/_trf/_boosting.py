@@ -6,6 +6,9 @@ Stored in ``algorithm_version`` attribute
 
  -1. Prior to storing version
  0. Normalize ``x`` after applying basis
+ 1. Padding of the first samples of each segment when predicting ``y`` (for
+    model fit metrics) consistent with the padding used for estimating
+    the kernel
 
 Profiling
 ---------
@@ -17,35 +20,39 @@ x2 = ds['x2']
 %prun -s cumulative res = boosting(y, x1, 0, 1)
 
 """
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 import inspect
-from itertools import chain, product, repeat
-from multiprocessing.sharedctypes import RawArray
+from itertools import product
+from operator import itemgetter
 import os
+import threading
 import time
-from threading import Event, Thread
-from typing import Any, Union, Tuple, Sequence
+from typing import Any, Dict, Iterator, Union, Tuple, Sequence
 import warnings
 
 import numpy as np
 from tqdm import tqdm
 
-from .._config import CONFIG, mpc
+from .._config import CONFIG
 from .._data_obj import Dataset, NDVar, NDVarArg, dataobj_repr
 from .._exceptions import OldVersionError
 from .._ndvar import convolve_jit
 from .._utils import LazyProperty, PickleableDataClass, user_activity
-from ._boosting_opt import l1, l2, generate_options, update_error
-from .shared import RevCorrData, Split, Splits, merge_segments
+from .._utils.parallel import worker_pool
+from ._boosting_opt import l1, l2, generate_options, generate_options_multi, generate_options_sparse, lagged_dot, lagged_energy, multi_buffers, update_error, update_error_events
+from .shared import RevCorrData, SparseX, Split, Splits, merge_segments, y_rows
+from ._boosting_cache import boosting_cache_key, load_result, save_result
 from ._fit_metrics import get_evaluators
 
 
-# process messages
-JOB_TERMINATE = -1
-
 # error functions
 ERROR_FUNC = {'l2': l2, 'l1': l1}
 DELTA_ERROR_FUNC = {'l2': 2, 'l1': 1}
+# shortest kernel for which predict() uses the FFT
+FFT_MIN_N_TIMES = 20
+# number of samples predicted together in Boosting.evaluate_fit()
+PREDICT_BLOCK_SIZE = 2 ** 22
 
 
 @dataclass(eq=False)
@@ -109,6 +116,14 @@ class BoostingResult(PickleableDataClass):
     algorithm_version : int
         Version of the algorithm with which the model was estimated; ``-1`` for
         results from before this attribute was added.
+    warm_start : bool | str
+        Whether boosting started from initial kernels (see :func:`boosting`;
+        description of the :class:`BoostingResult` that was used).
+    n_warm_start_steps : float
+        With ``warm_start``, the average number of boosting steps (per
+        cross-validation split and response) represented by the initial
+        kernels, i.e., the number of boosting iterations that would at least
+        be needed to reach them from 0.
     """
     # basic parameters
     y: str
@@ -145,6 +160,9 @@ class BoostingResult(PickleableDataClass):
     # store the version of the boosting algorithm with which model was fit
     version: int = 13  # file format (updates when re-saving)
     algorithm_version: int = -1  # does not change when re'saving
+    # warm start
+    warm_start: Union[bool, str] = False
+    n_warm_start_steps: float = None
     # debug parameters
     y_pred: NDVar = None
     fit: Any = None  # scanpydoc can't handle undocumented 'Boosting'
@@ -189,7 +207,7 @@ class BoostingResult(PickleableDataClass):
         for name, param in inspect.signature(boosting).parameters.items():
             if param.default is inspect.Signature.empty or name == 'ds':
                 continue
-            elif name == 'debug':
+            elif name in ('debug', 'batch_size', 'gram', 'sparse', 'warm_start'):
                 continue
             elif name == 'partitions':
                 value = self.splits.partitions_arg
@@ -286,17 +304,13 @@ class BoostingResult(PickleableDataClass):
 class SplitResult:
     __slots__ = ('split', 'h', 'h_failed')
 
-    def __init__(self, split: Split, n_y: int, n_x: int, n_times_h: int):
+    def __init__(self, split: Split, h: np.ndarray, h_failed: np.ndarray):
         self.split = split
-        self.h = np.empty((n_y, n_x, n_times_h), np.float64)
-        self.h_failed = np.zeros(n_y, bool)
+        self.h = h  # (n_y, n_x, n_times_h)
+        self.h_failed = h_failed  # (n_y,)
 
-    def add_h(self, i_y: int, h: Union[np.ndarray, None]):
-        if h is None:
-            self.h_failed[i_y] = True
-            self.h[i_y] = 0
-        else:
-            self.h[i_y] = h
+    def add_h(self, i_y: Union[int, slice], h: Union[np.ndarray, None, list]):
+        store_h(self.h, self.h_failed, i_y, h)
 
     def h_with_nan(self):
         "Set failed TRFs to NaN"
@@ -331,6 +345,9 @@ class Boosting:
     error = None
     delta = None
     mindelta = None
+    sparse = None
+    warm_start = False
+    n_warm_start_steps = None
     # timing
     t_fit_start = None
     t_fit_done = None
@@ -355,14 +372,60 @@ class Boosting:
             error: str = 'l1',
             delta: float = 0.005,  # coordinate search step
             mindelta: float = None,  # narrow search by reducing delta until reaching mindelta
+            batch_size: int = 1,  # fit batches of responses together
+            gram: bool = False,  # l2 only: update candidate errors from predictor inner products
+            sparse: bool = None,  # store predictors as events (default: detect sparse predictors)
+            warm_start: Union[bool, BoostingResult] = False,  # initial kernels (see boosting())
+    ):
+        self._prepare_fit(tstart, tstop, selective_stopping, error, delta, mindelta, batch_size, gram, sparse, warm_start)
+        self._run_fit()
+
+    def _run_fit(self):
+        "Boost all tasks set up by :meth:`._prepare_fit`"
+        n_units = sum(self._n_units(i_y) for tasks in self._stages for i_y, *_ in tasks)
+        pbar = tqdm(desc=f"Fitting models", total=n_units, disable=CONFIG['tqdm'])
+        self.t_fit_start = time.time()
+        if CONFIG['n_workers']:
+            # Workers write the kernels into shared memory, and only send
+            # their index (workers on other machines send the kernels)
+            with worker_pool() as pool:
+                args = self._worker_args(pool)
+                for tasks in self._stages:
+                    for _, i_y, i_split, written, h_i in pool.run(boosting_worker, ([args],), [(0, *task) for task in tasks]):
+                        self._add_h(i_y, i_split, written, h_i)
+                        pbar.update(self._n_units(i_y))
+        else:
+            for tasks in self._stages:
+                for task in tasks:
+                    self._add_h(*task[:2], False, self._boost(*task))
+                    pbar.update(self._n_units(task[0]))
+        pbar.close()
+
+    def _prepare_fit(
+            self,
+            tstart: Union[float, Sequence[float]],
+            tstop: Union[float, Sequence[float]],
+            selective_stopping: int,
+            error: str,
+            delta: float,
+            mindelta: Union[float, None],
+            batch_size: int,
+            gram: bool,
+            sparse: Union[bool, None],
+            warm_start: Union[bool, BoostingResult] = False,
     ):
+        "Set up the fit (without boosting), see :meth:`.fit`"
         self.data._check_data()
         assert error in ERROR_FUNC
+        if gram and error != 'l2':
+            raise ValueError(f"gram={gram!r} with error={error!r}: only available for error='l2'")
         mindelta_ = delta if mindelta is None else mindelta
         self.selective_stopping = selective_stopping
         self.error = error
         self.delta = delta
         self.mindelta = mindelta
+        self.sparse = sparse
+        x_sparse = self.data.sparse_x(sparse)
         n_y = len(self.data.y)
         n_x = len(self.data.x)
         # find TRF start/stop for each x
@@ -394,38 +457,101 @@ class Boosting:
         if len(self.data.segments) == 1:
             self.n_skip = h_n_times - 1
 
-        # progress bar
-        n_splits = len(self.data.splits.splits)
-        pbar = tqdm(desc=f"Fitting models", total=n_y * n_splits, disable=CONFIG['tqdm'])
-        self.t_fit_start = time.time()
-
         # boosting
-        split_results = [SplitResult(split, n_y, n_x, h_n_times) for split in self.data.splits.splits]
-        if CONFIG['n_workers']:
-            # Make sure cross-validations are added in the same order, otherwise
-            # slight numerical differences can occur
-            job_queue, result_queue = setup_workers(self.data, i_start_by_x, i_stop_by_x, delta, mindelta_, error, selective_stopping)
-            stop_jobs = Event()
-            thread = Thread(target=put_jobs, args=(job_queue, n_y, n_splits, stop_jobs))
-            thread.start()
-            # collect results
-            try:
-                for _ in range(n_y * n_splits):
-                    i_y, i_split, h = result_queue.get()
-                    split_results[i_split].add_h(i_y, h)
-                    pbar.update()
-            except KeyboardInterrupt:
-                stop_jobs.set()
-                raise
+        n_splits = len(self.data.splits.splits)
+        self._h = h = np.empty((n_splits, n_y, n_x, h_n_times), np.float64)
+        self._h_failed = h_failed = np.zeros((n_splits, n_y), bool)
+        self.split_results = [SplitResult(split, h[i], h_failed[i]) for i, split in enumerate(self.data.splits.splits)]
+        if batch_size > 1:
+            y_jobs = [slice(i, min(i + batch_size, n_y)) for i in range(0, n_y, batch_size)]
         else:
-            for i_y, y_i in enumerate(self.data.y):
-                for split in split_results:
-                    h = boost(y_i, self.data.x, self.data.x_pads, split.split, i_start_by_x, i_stop_by_x, delta, mindelta_, error, selective_stopping)
-                    split.add_h(i_y, h)
-                    pbar.update()
-        self.split_results = split_results
-        pbar.close()
-        self.t_fit_done = time.time()
+            y_jobs = range(n_y)
+        # tasks: (i_y, i_split, i_init), in stages that can run in parallel
+        self._h_init = None
+        if isinstance(warm_start, BoostingResult):
+            # the same initial kernels for all splits
+            h_data, h_index, h_i_start = self.data.kernel_data(warm_start, 'warm_start')
+            self._h_init = np.zeros((1, n_y, n_x, h_n_times))
+            offset = h_i_start - i_start
+            i0 = max(0, offset)
+            i1 = min(h_n_times, offset + h_data.shape[2])
+            if i1 > i0:
+                self._h_init[0, :, h_index, i0:i1] = h_data[:, :, i0 - offset:i1 - offset].swapaxes(0, 1)
+            # kernels can only be non-zero in the TRF of each predictor
+            for i_x, (start, stop) in enumerate(zip(i_start_by_x - i_start, i_stop_by_x - i_start)):
+                self._h_init[0, :, i_x, :start] = 0
+                self._h_init[0, :, i_x, stop:] = 0
+            self._stages = [list(product(y_jobs, range(n_splits), [0]))]
+        elif warm_start:
+            # fit the first split for each test set, then start the other
+            # splits with the same test set from its kernel
+            i_first = {}
+            for i_split, split in enumerate(self.data.splits.splits):
+                i_first.setdefault(split.i_test, i_split)
+            i_inits = [i_first[split.i_test] for split in self.data.splits.splits]
+            self._stages = [
+                [(i_y, i_split, None) for i_y, i_split in product(y_jobs, i_first.values())],
+                [(i_y, i_split, i_init) for i_y, (i_split, i_init) in product(y_jobs, enumerate(i_inits)) if i_split != i_init],
+            ]
+        else:
+            self._stages = [list(product(y_jobs, range(n_splits), [None]))]
+        self.warm_start = warm_start
+        self.n_warm_start_steps = None
+        self._n_pending = sum(map(len, self._stages))
+        self._boost_args = (i_start_by_x, i_stop_by_x, delta, mindelta_, error, selective_stopping, CONFIG['boosting_threads'], gram, x_sparse)
+        self._h_shared = None
+
+    @staticmethod
+    def _n_units(i_y: Union[int, slice]):
+        "Number of responses in task ``i_y``"
+        return 1 if isinstance(i_y, int) else i_y.stop - i_y.start
+
+    def _task_cost(self, i_y: Union[int, slice], i_split: int):
+        "Estimate of the relative time for boosting task ``(i_y, i_split)``"
+        i_start_by_x, i_stop_by_x = self._boost_args[:2]
+        n_train = sum(stop - start for start, stop in self.data.splits.splits[i_split].train)
+        return self._n_units(i_y) * n_train * int(np.sum(i_stop_by_x - i_start_by_x))
+
+    def _worker_args(self, pool, share=None):
+        """Arguments for one job of :func:`boosting_worker`
+
+        ``share(array)`` can be used to share ``y`` and ``x`` between jobs.
+        """
+        if share is None:
+            data = self.data.shared_data(pool)
+        else:
+            data = [share(array) for array in (self.data.y, self.data.x, self.data.x_pads)]
+        self._h_shared = (pool.share(self._h), pool.share(self._h_failed))
+        h_init = None if self._h_init is None else pool.share(self._h_init)
+        return (*data, self.data.y_norm, *self._h_shared, h_init, self.data.splits.splits, *self._boost_args)
+
+    def _get_h_init(self, i_y: Union[int, slice], i_init: Union[int, None]):
+        "Initial kernel for task ``(i_y, *, i_init)``"
+        if i_init is None:
+            return None
+        return (self._h if self._h_init is None else self._h_init)[i_init, i_y]
+
+    def _boost(self, i_y: Union[int, slice], i_split: int, i_init: int = None):
+        "Boost task ``(i_y, i_split, i_init)`` in the current process"
+        return boost_y(self.data.y, i_y, self.data.x, self.data.x_pads, self.data.splits.splits[i_split], *self._boost_args, self._get_h_init(i_y, i_init), self.data.y_norm)
+
+    def _add_h(self, i_y: Union[int, slice], i_split: int, written: bool, h: Any):
+        "Add the result of a boosting task"
+        if not written:
+            self.split_results[i_split].add_h(i_y, h)
+        elif self._h_shared[0].array is not self._h:
+            h_shared, h_failed_shared = self._h_shared
+            self._h[i_split, i_y] = h_shared.array[i_split, i_y]
+            self._h_failed[i_split, i_y] = h_failed_shared.array[i_split, i_y]
+        self._n_pending -= 1
+        if self._n_pending == 0:
+            self._h_shared = None
+            self.t_fit_done = time.time()
+            steps = [np.abs(self._get_h_init(i_y, i_init)).sum() / self.delta for tasks in self._stages for i_y, _, i_init in tasks if i_init is not None]
+            if steps:
+                # boosting steps needed to reach the initial kernels from 0
+                n_fits = sum(self._n_units(i_y) for tasks in self._stages for i_y, *_ in tasks)
+                self.n_warm_start_steps = sum(steps) / n_fits
 
     def _get_i_tests(self):
         assert self.data.splits.n_test
@@ -532,41 +658,36 @@ class Boosting:
 
         if metrics:
             # y dimensions
-            n_y = len(self.data.y)
-            if self.data.vector_dim:
-                n_vec = len(self.data.vector_dim)
-                n_vecs = n_y // n_vec
-            else:
-                n_vec = n_vecs = 0
-
-            # predicted y
-            if debug:
-                y_pred_iter = y_pred = np.empty(self.data.y.shape)
-            elif n_vecs:
-                y_pred = np.empty((n_vec, *self.data.y.shape[1:]))
-                y_pred_iter = chain.from_iterable(repeat(tuple(y_pred), n_vecs))
-            else:
-                y_pred = np.empty(self.data.y.shape[1:])
-                y_pred_iter = repeat(y_pred, n_y)
+            n_y, n_times = self.data.y.shape
+            n_vec = len(self.data.vector_dim) if self.data.vector_dim else 1
 
             evaluators, evaluators_s, evaluators_v = get_evaluators(metrics, self.data)
+            x_sparse = self.data.sparse_x(self.sparse)
+            y_pred = np.empty(self.data.y.shape) if debug else None
+
+            # predict and evaluate blocks of y (whole vectors) in threads
+            n_threads = CONFIG['n_workers'] or 1
+            block_size = max(1, min(PREDICT_BLOCK_SIZE // n_times, -(-n_y // n_threads) // n_vec)) * n_vec
+            blocks = [slice(i, min(i + block_size, n_y)) for i in range(0, n_y, block_size)]
 
-            # fit and evaluate each y
-            for i_y, y_pred_i in enumerate(y_pred_iter):
+            def evaluate_block(block):
+                y_pred_block = y_pred[block] if debug else np.empty((block.stop - block.start, n_times))
                 # for cross-validation, different segments are predicted by different h:
                 for h, segments in hs:
-                    convolve(h[i_y], self.data.x, self.data.x_pads, self._i_start, segments, y_pred_i)
-
-                if evaluators_s:
-                    for e in evaluators_s:
-                        e.add_y(i_y, self.data.y[i_y], y_pred_i, eval_segments)
-
-                if evaluators_v and i_y % n_vec == n_vec - 1:
-                    i_vec = i_y // n_vec
-                    i_y_vec = slice(i_y-n_vec+1, i_y+1)
-                    y_pred_i_vec = y_pred[i_y_vec] if debug else y_pred
-                    for e in evaluators_v:
-                        e.add_y(i_vec, self.data.y[i_y_vec], y_pred_i_vec, eval_segments)
+                    predict(h[block], self.data.x, self.data.x_pads, self._i_start, segments, y_pred_block, x_sparse)
+                y_block = self.data.y_rows(block)
+                for e in evaluators_s:
+                    e.add_ys(block, y_block, y_pred_block, eval_segments)
+                block_vec = slice(block.start // n_vec, block.stop // n_vec)
+                for e in evaluators_v:
+                    e.add_ys(block_vec, y_block, y_pred_block, eval_segments)
+
+            if n_threads > 1 and len(blocks) > 1:
+                for _ in thread_pool(min(n_threads, len(blocks)), 'predict').map(evaluate_block, blocks):
+                    pass
+            else:
+                for block in blocks:
+                    evaluate_block(block)
 
             # Package evaluators
             evaluations = {e.attr: self.data.package_value(e.x, e.name, meas=e.meas) for e in evaluators}
@@ -595,7 +716,9 @@ class Boosting:
             self.data.basis, self.data.basis_window, self.data.splits,
             # advanced data properties
             self.data.y.shape[1], self.data.y_info,
-            algorithm_version=0,
+            algorithm_version=1,
+            warm_start=self.warm_start if isinstance(self.warm_start, bool) else repr(self.warm_start),
+            n_warm_start_steps=self.n_warm_start_steps,
             i_test=i_test, **evaluations)
 
 
@@ -617,6 +740,10 @@ def boosting(
         test: int = 0,  # Number of segments in test set
         ds: Dataset = None,
         selective_stopping: int = 0,
+        batch_size: int = 1,
+        gram: bool = False,
+        sparse: bool = None,
+        warm_start: Union[bool, BoostingResult] = False,
         debug: bool = False,
 ):
     """Estimate a linear filter with coordinate descent
@@ -693,6 +820,42 @@ def boosting(
         increase in testing error, and continues until all predictors are
         stopped. The integer value of ``selective_stopping`` determines after
         how many steps with error increases each predictor is excluded.
+    batch_size : int
+        Fit the filters for this many responses (e.g., sensors or sources in
+        ``y``) together (default 1). The filters are still estimated
+        independently, with identical results, but each boosting iteration
+        reads the predictors only once for the whole batch, which speeds up
+        fitting many responses to the same predictors. Batches are
+        distributed to the workers (see :func:`configure`), so large batches
+        can leave workers unused when ``y`` has few responses.
+    gram : bool
+        Only for ``error='l2'``: Precompute the energy of each lagged predictor
+        and keep the inner products between the residual and all lagged
+        predictors up to date after each step, so that finding the best step
+        does not require a pass over the data (default ``False``). This can
+        speed up boosting considerably with many predictors or long TRFs. The
+        result can differ from the default algorithm due to floating point
+        rounding (e.g., when two candidate steps are nearly equivalent).
+    sparse : bool
+        Store predictors as lists of events (their non-zero samples), so that
+        boosting and predicting ``y`` only visit the events rather than every
+        time point. By default, this is done for predictors in which at most
+        10% of the samples are non-zero, such as predictors made with
+        :func:`event_impulse_predictor` or :func:`epoch_impulse_predictor`.
+        Set to ``True`` to store all predictors as events, or ``False`` to
+        disable.
+    warm_start : bool | BoostingResult
+        Start boosting from an initial kernel instead of from 0, which can
+        save many boosting iterations. With ``warm_start=True``, the first
+        cross-validation split for each test set is estimated from 0, and the
+        remaining splits with the same test set start from its kernel. A
+        :class:`BoostingResult` with kernels for (some of) the predictors in
+        ``x`` can be used as initial kernel for all splits (its kernels are
+        cropped to ``tstart``/``tstop``; e.g., a model estimated on a subset
+        of the data). In both cases, boosting stops based on the validation
+        data as usual. The average number of boosting steps represented by
+        the initial kernels (the iterations saved compared to starting from 0)
+        is stored in :attr:`BoostingResult.n_warm_start_steps`.
     debug : bool
         Add additional attributes to the returned result.
 
@@ -711,6 +874,13 @@ def boosting(
     >>> res = boosting('uts', ['a0', 'a1'], 0, 0.5, partitions=10, model='A', ds=ds)
     >>> y_pred = convolve(res.h_scaled, ['a0', 'a1'], ds=ds)
 
+    For data that do not fit into memory, ``y`` can be an :class:`NDVar`
+    whose data is a file-backed :class:`numpy.memmap` (e.g., a long continuous
+    recording with many sources). Such ``y`` is not loaded into memory: it is
+    normalized while rows are read, and workers read it from the same file
+    (this requires that ``time`` is the last dimension, and that ``y`` has no
+    ``case`` dimension).
+
     The boosting algorithm is described in [1]_.
 
     References
@@ -720,6 +890,27 @@ def boosting(
         Computation in Neural Systems, 18(3), 191-212.
         `10.1080/09548980701609235 <https://doi.org/10.1080/09548980701609235>`_.
     """
+    fit = _boosting_model(y, x, tstart, tstop, scale_data, delta, mindelta, error, basis, basis_window, partitions, model, validate, test, ds, selective_stopping, batch_size, gram, sparse, warm_start)
+    cache_key = _cache_key(fit, gram, debug)
+    if cache_key:
+        result = load_result(cache_key)
+        if result is not None:
+            return result
+    fit._run_fit()
+    result = fit.evaluate_fit(debug=debug)
+    if cache_key:
+        save_result(cache_key, result)
+    return result
+
+
+def _cache_key(fit: Boosting, gram: bool, debug: bool):
+    "Key for the result in ``CONFIG['boosting_cache']`` (``None`` if not cached)"
+    if CONFIG['boosting_cache'] and not debug:
+        return boosting_cache_key(fit, gram=gram)
+
+
+def _boosting_model(y, x, tstart, tstop, scale_data, delta, mindelta, error, basis, basis_window, partitions, model, validate, test, ds, selective_stopping, batch_size, gram, sparse, warm_start=False, cache=None):
+    "Prepare the :class:`Boosting` model for :func:`boosting` (``cache``: see :meth:`RevCorrData.normalize`)"
     # scale_data
     if isinstance(scale_data, bool):
         scale_in_place = False
@@ -738,12 +929,138 @@ def boosting(
     data = RevCorrData(y, x, ds, scale_in_place)
     data.apply_basis(basis, basis_window)
     if scale_data:
-        data.normalize(error)
+        data.normalize(error, None if scale_in_place else cache)
     data.initialize_cross_validation(partitions, model, ds, validate, test)
 
     fit = Boosting(data)
-    fit.fit(tstart, tstop, selective_stopping, error, delta, mindelta)
-    return fit.evaluate_fit(debug=debug)
+    fit._prepare_fit(tstart, tstop, selective_stopping, error, delta, mindelta, batch_size, gram, sparse, warm_start)
+    return fit
+
+
+def boosting_batch(
+        jobs: Sequence[Union[Tuple[NDVarArg, Union[NDVarArg, Sequence[NDVarArg]]], Dict[str, Any]]],
+        **kwargs,
+) -> Iterator[Tuple[int, BoostingResult]]:
+    """Estimate several models with :func:`boosting` together
+
+    Parameters
+    ----------
+    jobs : sequence of tuple | dict
+        Models to estimate. Each job is either a ``(y, x)`` tuple, or a
+        :class:`dict` with parameters for :func:`boosting`.
+    **kwargs
+        Parameters for :func:`boosting` that apply to all jobs (parameters
+        specified in a job :class:`dict` take precedence).
+
+    Yields
+    ------
+    index : int
+        Index of the job in ``jobs``.
+    result : BoostingResult
+        Result for the job.
+
+    Notes
+    -----
+    Each ``y`` and ``x`` object that occurs in several jobs (e.g., the same
+    predictors for different subjects, or the same data for different models)
+    is normalized and sent to the workers only once. The boosting tasks (one
+    for each response and cross-validation split) of all jobs are distributed
+    to the same workers (see :func:`configure`), starting with the tasks that
+    take the longest, so that workers are not left idle at the end of each
+    model. Results are yielded as soon as all tasks of a job are done, so they
+    are not necessarily in the order of ``jobs``.
+
+    Examples
+    --------
+    Compare two models for several subjects::
+
+        models = {'envelope': [envelope], 'onset': [envelope, onset]}
+        jobs = [(eeg, x) for eeg in eegs for x in models.values()]
+        results = [None] * len(jobs)
+        for i, result in boosting_batch(jobs, tstart=-0.100, tstop=0.500, partitions=5):
+            results[i] = result
+    """
+    with user_activity:
+        signature = inspect.signature(boosting)
+        fits = []  # None for results from the cache
+        debug = []
+        cache_keys = []
+        cache = {}
+        for i, job in enumerate(jobs):
+            if isinstance(job, dict):
+                params = {**kwargs, **job}
+            else:
+                y, x = job
+                params = {**kwargs, 'y': y, 'x': x}
+            try:
+                bound_arguments = signature.bind(**params)
+            except TypeError as exception:
+                raise TypeError(f"jobs[{i}]: {exception}")
+            bound_arguments.apply_defaults()
+            arguments = bound_arguments.arguments
+            if arguments.get('scale_data') == 'inplace':
+                raise ValueError(f"jobs[{i}]: scale_data='inplace' is not supported for boosting_batch()")
+            debug.append(arguments.pop('debug'))
+            fit = _boosting_model(**arguments, cache=cache)
+            cache_keys.append(_cache_key(fit, arguments['gram'], debug[-1]))
+            result = load_result(cache_keys[-1]) if cache_keys[-1] else None
+            if result is None:
+                fits.append(fit)
+            else:
+                fits.append(None)
+                yield i, result
+        del cache
+        if not any(fits):
+            return
+        # tasks of all jobs for each stage, longest first
+        stages = []
+        for i_stage in range(max(len(fit._stages) for fit in fits if fit)):
+            tasks = [(fit._task_cost(i_y, i_split), i_job, i_y, i_split, i_init) for i_job, fit in enumerate(fits) if fit and i_stage < len(fit._stages) for i_y, i_split, i_init in fit._stages[i_stage]]
+            tasks.sort(key=itemgetter(0), reverse=True)
+            stages.append([task[1:] for task in tasks])
+
+        n_units = sum(fits[i_job]._n_units(i_y) for tasks in stages for i_job, i_y, *_ in tasks)
+        pbar = tqdm(desc=f"Fitting models", total=n_units, disable=CONFIG['tqdm'])
+        t_fit_start = time.time()
+        for fit in fits:
+            if fit:
+                fit.t_fit_start = t_fit_start
+        if CONFIG['n_workers']:
+            with worker_pool() as pool:
+                shared = {}
+
+                def share(array):
+                    if id(array) not in shared:
+                        shared[id(array)] = (array, pool.share(array))
+                    return shared[id(array)][1]
+
+                args = [fit and fit._worker_args(pool, share) for fit in fits]
+                for tasks in stages:
+                    for i_job, i_y, i_split, written, h in pool.run(boosting_worker, (args,), tasks):
+                        fit = fits[i_job]
+                        fit._add_h(i_y, i_split, written, h)
+                        pbar.update(fit._n_units(i_y))
+                        if fit._n_pending == 0:
+                            fits[i_job] = None
+                            yield i_job, _batch_result(fit, debug[i_job], cache_keys[i_job])
+        else:
+            for i_job, fit in enumerate(fits):
+                if fit is None:
+                    continue
+                for tasks in fit._stages:
+                    for task in tasks:
+                        fit._add_h(*task[:2], False, fit._boost(*task))
+                        pbar.update(fit._n_units(task[0]))
+                fits[i_job] = None
+                yield i_job, _batch_result(fit, debug[i_job], cache_keys[i_job])
+        pbar.close()
+
+
+def _batch_result(fit: Boosting, debug: bool, cache_key: Union[str, None]):
+    result = fit.evaluate_fit(debug=debug)
+    if cache_key:
+        save_result(cache_key, result)
+    return result
 
 
 class BoostingStep:
@@ -757,7 +1074,60 @@ class BoostingStep:
         self.e_test = e_test
 
 
-def boost(y, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error, selective_stopping=0, return_history=False):
+_THREAD_POOLS = {}  # (name, n_threads) -> ThreadPoolExecutor
+_THREAD_POOLS_LOCK = threading.Lock()
+
+
+def thread_pool(n_threads: int, name: str = 'boosting') -> ThreadPoolExecutor:
+    """Shared thread pool for evaluating boosting candidates
+
+    There is one pool for each ``name`` and size, which is never shut down,
+    because boosting jobs in other threads (with ``executor='threading'``) may
+    be submitting to it. Model fit evaluation uses separate pools
+    (``name='predict'``), so that it does not wait for candidate evaluation in
+    jobs that are still boosting (:func:`boosting_batch`).
+    """
+    key = (name, n_threads)
+    with _THREAD_POOLS_LOCK:
+        if key not in _THREAD_POOLS:
+            _THREAD_POOLS[key] = ThreadPoolExecutor(n_threads, name)
+        return _THREAD_POOLS[key]
+
+
+def _reset_thread_pools():
+    "The threads of the pools do not exist in forked worker processes"
+    global _THREAD_POOLS_LOCK
+    _THREAD_POOLS.clear()
+    _THREAD_POOLS_LOCK = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_thread_pools)
+
+
+def candidate_ranges(i_start_by_x, i_stop_by_x, n):
+    """Divide the candidate steps (predictor × lag) into ``n`` similar chunks
+
+    Returns
+    -------
+    ranges : list of (i_start_by_x, i_stop_by_x)
+        For each chunk, lag ranges for each predictor (empty for predictors
+        that are not part of the chunk).
+    """
+    n_lags = i_stop_by_x - i_start_by_x
+    offsets = np.cumsum(n_lags) - n_lags
+    bounds = np.linspace(0, n_lags.sum(), n + 1).round().astype(np.int64)
+    ranges = []
+    for c_start, c_stop in zip(bounds[:-1], bounds[1:]):
+        if c_stop == c_start:
+            continue
+        start = i_start_by_x + np.clip(c_start - offsets, 0, n_lags)
+        stop = i_start_by_x + np.clip(c_stop - offsets, 0, n_lags)
+        ranges.append((start, stop))
+    return ranges
+
+
+def boost(y, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error, selective_stopping=0, return_history=False, n_threads=1, gram=False, x_sparse=None, h_init=None):
     """Estimate one filter with boosting
 
     Parameters
@@ -786,49 +1156,266 @@ def boost(y, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error
         Selective stopping.
     return_history : bool
         Return error history as second return value.
+    n_threads : int
+        Number of threads for evaluating candidate steps in each iteration.
+    gram : bool
+        Evaluate candidate steps from the inner products of the lagged
+        predictors (only for ``error='l2'``, see :class:`LaggedGram`).
+    x_sparse : SparseX
+        Event lists for sparse predictors (candidate steps on these predictors
+        are evaluated from the events).
+    h_init : array (n_stims, n_times_trf)
+        Start boosting from this kernel instead of 0 (warm start).
 
     Returns
     -------
     history[best_iter] : None | array
-        Winning kernel, or None if 0 is the best kernel.
+        Winning kernel, or None if 0 is the best kernel (without ``h_init``).
     test_sse_history : list (only if ``return_history==True``)
         SSE for test data at each iteration.
     """
     delta_error_func = DELTA_ERROR_FUNC[error]
-    error = ERROR_FUNC[error]
     n_stims, n_times = x.shape
     assert y.shape == (n_times,)
     i_start = np.min(i_start_by_x)
     n_times_trf = np.max(i_stop_by_x) - i_start
-    h = np.zeros((n_stims, n_times_trf))
     # buffers
     y_error = y.copy()
-    new_error = np.empty(h.shape)
+    new_error = np.empty((n_stims, n_times_trf))
     new_error.fill(np.inf)  # ignore values outside TRF
-    new_sign = np.empty(h.shape, np.int8)
+    new_sign = np.empty((n_stims, n_times_trf), np.int8)
     x_active = np.ones(n_stims, dtype=np.int8)
+    if x_sparse is None:
+        x_active_dense = x_active
+    else:
+        x_active_dense = np.empty_like(x_active)
+        x_active_sparse = np.empty_like(x_active)
+    # threads write to disjoint parts of the buffers
+    ranges = candidate_ranges(i_start_by_x, i_stop_by_x, n_threads) if n_threads > 1 else ()
+    executor = thread_pool(len(ranges)) if len(ranges) > 1 else None
+    lagged_gram = LaggedGram(x, x_pads, split, i_start_by_x, i_stop_by_x) if gram else None
+
+    booster = Booster(y_error, x, x_pads, split, i_start, delta, mindelta, error, selective_stopping, new_error, new_sign, x_active, lagged_gram, x_sparse, h_init)
+    for _ in range(999999):
+        if not booster.evaluate():
+            break
+        # generate possible movements -> training error
+        if gram:
+            booster.generate_gram_options()
+        else:
+            if x_sparse is not None:
+                np.multiply(x_active, x_sparse.dense, out=x_active_dense)
+                np.multiply(x_active, x_sparse.sparse, out=x_active_sparse)
+                generate_options_sparse(y_error, x_pads, x_active_sparse, x_sparse.event_ptr, x_sparse.event_index, x_sparse.event_value, split.train, i_start, i_start_by_x, i_stop_by_x, delta_error_func, booster.delta, new_error, new_sign)
+            if executor is None:
+                generate_options(y_error, x, x_pads, x_active_dense, split.train, i_start, i_start_by_x, i_stop_by_x, delta_error_func, booster.delta, new_error, new_sign)
+            else:
+                futures = [executor.submit(generate_options, y_error, x, x_pads, x_active_dense, split.train, i_start, start, stop, delta_error_func, booster.delta, new_error, new_sign) for start, stop in ranges]
+                for future in futures:
+                    future.result()
+        if not booster.update():
+            break
+    else:
+        raise RuntimeError("Maximum number of iterations exceeded")
+    return booster.result(return_history)
+
+
+def boost_multi(y, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error, selective_stopping=0, n_threads=1, gram=False, x_sparse=None, h_init=None):
+    """Estimate filters for several responses with boosting
+
+    Equivalent to calling :func:`boost` for each response, but the filters
+    are advanced in lockstep, so that each iteration reads the predictors only
+    once for all responses that are still being fit.
+
+    Parameters
+    ----------
+    y : array (n_y, n_times)
+        Dependent signals.
+    h_init : array (n_y, n_stims, n_times_trf)
+        Initial kernel for each response.
+    ...
+        See :func:`boost`.
 
-    # history
-    best_test_error = np.inf
-    history = []
-    i_stim = i_time = delta_signed = None
-    best_iteration = 0
-    # pre-assign iterators
-    for i_boost in range(999999):
+    Returns
+    -------
+    hs : list of (None | array)
+        Winning kernel for each response (see :func:`boost`).
+    """
+    delta_error_func = DELTA_ERROR_FUNC[error]
+    n_stims, n_times = x.shape
+    n_y = len(y)
+    assert y.shape == (n_y, n_times)
+    i_start = np.min(i_start_by_x)
+    n_times_trf = np.max(i_stop_by_x) - i_start
+    # buffers; responses are the last axis of y_error so that the kernel
+    # reads the values for all responses at one time point together
+    y_error = np.array(y.T, order='C')
+    new_error = np.empty((n_y, n_stims, n_times_trf))
+    new_error.fill(np.inf)  # ignore values outside TRF
+    new_sign = np.empty((n_y, n_stims, n_times_trf), np.int8)
+    x_active = np.ones((n_y, n_stims), dtype=np.int8)
+    if x_sparse is None:
+        x_active_dense = x_active
+    else:
+        x_active_dense = np.empty_like(x_active)
+        x_active_sparse = np.empty_like(x_active)
+    deltas = np.empty(n_y)
+    # threads write to disjoint parts of the buffers
+    ranges = candidate_ranges(i_start_by_x, i_stop_by_x, n_threads) if n_threads > 1 else ()
+    executor = thread_pool(len(ranges)) if len(ranges) > 1 else None
+    if gram:
+        # the inner products are shared by all responses
+        lagged_gram = LaggedGram(x, x_pads, split, i_start_by_x, i_stop_by_x)
+        work_buffers = None
+    else:
+        lagged_gram = None
+        work_buffers = [multi_buffers(n_times, n_y, n_times_trf) for _ in range(max(1, len(ranges)))]
+
+    boosters = [Booster(y_error[:, i], x, x_pads, split, i_start, delta, mindelta, error, selective_stopping, new_error[i], new_sign[i], x_active[i], lagged_gram, x_sparse, None if h_init is None else h_init[i]) for i in range(n_y)]
+    active = list(range(n_y))
+    for _ in range(999999):
+        for i in active:
+            if not boosters[i].evaluate():
+                x_active[i] = False
+        active = [i for i in active if x_active[i].any()]
+        if not active:
+            break
+        # generate possible movements -> training error
+        if gram:
+            for i in active:
+                boosters[i].generate_gram_options()
+        else:
+            for i in active:
+                deltas[i] = boosters[i].delta
+            if x_sparse is not None:
+                np.multiply(x_active, x_sparse.dense, out=x_active_dense)
+                np.multiply(x_active, x_sparse.sparse, out=x_active_sparse)
+                for i in active:
+                    generate_options_sparse(y_error[:, i], x_pads, x_active_sparse[i], x_sparse.event_ptr, x_sparse.event_index, x_sparse.event_value, split.train, i_start, i_start_by_x, i_stop_by_x, delta_error_func, deltas[i], new_error[i], new_sign[i])
+            if executor is None:
+                generate_options_multi(y_error, x, x_pads, x_active_dense, split.train, i_start, i_start_by_x, i_stop_by_x, delta_error_func, deltas, new_error, new_sign, *work_buffers[0])
+            else:
+                futures = [executor.submit(generate_options_multi, y_error, x, x_pads, x_active_dense, split.train, i_start, start, stop, delta_error_func, deltas, new_error, new_sign, *buffers) for (start, stop), buffers in zip(ranges, work_buffers)]
+                for future in futures:
+                    future.result()
+        for i in active:
+            if not boosters[i].update():
+                x_active[i] = False
+        active = [i for i in active if x_active[i].any()]
+        if not active:
+            break
+    else:
+        raise RuntimeError("Maximum number of iterations exceeded")
+    return [booster.result() for booster in boosters]
+
+
+class LaggedGram:
+    """Inner products of the lagged predictors in the training data
+
+    With ``error='l2'``, the training error after a step ``d`` on the lagged
+    predictor ``x_l`` is ``e - 2 d (y_error · x_l) + d² (x_l · x_l)``. Since
+    a step changes ``y_error`` by a multiple of one lagged predictor, the
+    products ``y_error · x_l`` for all candidates can be updated with that
+    predictor's column of the Gram matrix, instead of recomputing the error for
+    each candidate from the time series in every iteration. Columns are
+    computed for the predictors that are actually stepped on, and cached.
+    """
+
+    def __init__(self, x, x_pads, split, i_start_by_x, i_stop_by_x):
+        self.x = x
+        self.x_pads = x_pads
+        self.split = split
+        self.i_start = i_start = np.min(i_start_by_x)
+        self.i_start_by_x = i_start_by_x
+        self.i_stop_by_x = i_stop_by_x
+        n_stims = len(x)
+        n_times_trf = np.max(i_stop_by_x) - i_start
+        self.shape = (n_stims, n_times_trf)
+        self.energy = np.zeros(self.shape)
+        lagged_energy(x, x_pads, split.train, i_start, i_start_by_x, i_stop_by_x, self.energy)
+        # candidates outside the TRF of each predictor
+        self.invalid = np.ones(self.shape, bool)
+        for i_stim, (start, stop) in enumerate(zip(i_start_by_x, i_stop_by_x)):
+            self.invalid[i_stim, start - i_start: stop - i_start] = False
+        self._columns = {}
+
+    def dot(self, y_error):
+        "Inner products of ``y_error`` with all lagged predictors"
+        out = np.zeros(self.shape)
+        lagged_dot(y_error, self.x, self.x_pads, self.split.train, self.i_start, self.i_start_by_x, self.i_stop_by_x, out)
+        return out
+
+    def column(self, i_stim, i_time):
+        "Inner products of one lagged predictor with all lagged predictors"
+        key = (i_stim, i_time)
+        if key not in self._columns:
+            x_lagged = np.zeros(self.x.shape[1])
+            update_error(x_lagged, self.x[i_stim], self.x_pads[i_stim], self.split.train, -1., i_time + self.i_start)
+            self._columns[key] = self.dot(x_lagged)
+        return self._columns[key]
+
+
+class Booster:
+    """State of :func:`boost` for one filter
+
+    Boosting alternates between :meth:`evaluate` and :meth:`update`, with the
+    candidate steps written to ``new_error`` and ``new_sign`` in between
+    (by :meth:`generate_gram_options` when using a :class:`LaggedGram`).
+    ``y_error``, ``new_error`` and ``x_active`` are modified in place.
+    With ``h_init``, the prediction of the initial kernel is subtracted from
+    ``y_error`` before the first iteration.
+    """
+
+    def __init__(self, y_error, x, x_pads, split, i_start, delta, mindelta, error, selective_stopping, new_error, new_sign, x_active, gram=None, x_sparse=None, h_init=None):
+        self.y_error = y_error
+        self.x = x
+        self.x_pads = x_pads
+        self.split = split
+        self.i_start = i_start
+        self.delta = delta
+        self.mindelta = mindelta
+        self.error = ERROR_FUNC[error]
+        self.selective_stopping = selective_stopping
+        self.new_error = new_error
+        self.new_sign = new_sign
+        self.x_active = x_active
+        self.h = np.zeros(new_error.shape)
+        self.gram = None
+        self.x_sparse = x_sparse
+        self.warm = h_init is not None
+        if self.warm:
+            for i_stim, i_time in zip(*np.nonzero(h_init)):
+                self._step(i_stim, i_time, h_init[i_stim, i_time])
+        self.gram = gram
+        self.cross = None if gram is None else gram.dot(y_error)
+        # history
+        self.best_test_error = np.inf
+        self.history = []
+        self.i_stim = self.i_time = self.delta_signed = None
+        self.best_iteration = 0
+        self.i_boost = 0
+        self.step = None
+
+    def evaluate(self):
+        "Evaluate the current filter; ``False`` to stop boosting"
+        split = self.split
+        history = self.history
+        i_boost = self.i_boost
+        i_stim = self.i_stim
         # evaluate current h
-        e_train = error(y_error, split.train)
-        e_test = error(y_error, split.validate)
-        step = BoostingStep(i_stim, i_time, delta_signed, e_test, e_train)
+        e_train = self.error(self.y_error, split.train)
+        e_test = self.error(self.y_error, split.validate)
+        step = BoostingStep(i_stim, self.i_time, self.delta_signed, e_test, e_train)
         history.append(step)
 
         # evaluate stopping conditions
-        if e_test < best_test_error:
-            best_test_error = e_test
-            best_iteration = i_boost
+        if e_test < self.best_test_error:
+            self.best_test_error = e_test
+            self.best_iteration = i_boost
         elif i_boost >= 2 and e_test > history[-2].e_test:
-            if selective_stopping:
-                if selective_stopping > 1:
-                    n_bad = selective_stopping - 1
+            if self.selective_stopping:
+                if self.selective_stopping > 1:
+                    n_bad = self.selective_stopping - 1
                     # only stop if the predictor overfits twice without intermittent improvement
                     undo = 0
                     for i in range(-2, -len(history), -1):
@@ -851,14 +1438,13 @@ def boost(y, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error
                     # revert changes
                     for i in range(-undo):
                         step = history.pop(-1)
-                        h[step.i_stim, step.i_time] -= step.delta
-                        update_error(y_error, x[step.i_stim], x_pads[step.i_stim], split.train_and_validate, -step.delta, step.i_time + i_start)
+                        self._step(step.i_stim, step.i_time, -step.delta)
                     step = history[-1]
                     # disable predictor
-                    x_active[i_stim] = False
-                    if not np.any(x_active):
-                        break
-                    new_error[i_stim, :] = np.inf
+                    self.x_active[i_stim] = False
+                    if not np.any(self.x_active):
+                        return False
+                    self.new_error[i_stim, :] = np.inf
             # Basic
             # -----
             # stop the iteration if all the following requirements are met
@@ -867,98 +1453,180 @@ def boost(y, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error
             #    the previous two iterations
             elif i_boost > 10 and e_test > history[-3].e_test:
                 # print("error(test) not improving in 2 steps")
-                break
-
-        # generate possible movements -> training error
-        generate_options(y_error, x, x_pads, x_active, split.train, i_start, i_start_by_x, i_stop_by_x, delta_error_func, delta, new_error, new_sign)
-        i_stim, i_time = np.unravel_index(np.argmin(new_error), h.shape)
-        new_train_error = new_error[i_stim, i_time]
-        delta_signed = new_sign[i_stim, i_time] * delta
+                return False
+        self.step = step
+        return True
+
+    def update(self):
+        "Take the best step from ``new_error``; ``False`` to stop boosting"
+        step = self.step
+        self.i_boost += 1
+        i_stim, i_time = np.unravel_index(np.argmin(self.new_error), self.h.shape)
+        new_train_error = self.new_error[i_stim, i_time]
+        delta_signed = self.new_sign[i_stim, i_time] * self.delta
 
         # If no improvements can be found reduce delta
         if new_train_error > step.e_train:
-            delta *= 0.5
-            if delta >= mindelta:
-                i_stim = i_time = delta_signed = None
+            self.delta *= 0.5
+            if self.delta >= self.mindelta:
+                self.i_stim = self.i_time = self.delta_signed = None
+                if self.gram is not None:
+                    # discard rounding errors accumulated by the updates
+                    self.cross = self.gram.dot(self.y_error)
                 # print("new delta: %s" % delta)
-                continue
+                return True
             else:
                 # print("No improvement possible for training data")
-                break
+                return False
 
         # abort if we're moving in circles
         if step.delta and i_stim == step.i_stim and i_time == step.i_time and delta_signed == -step.delta:
-            break
+            return False
 
         # update h with best movement
-        h[i_stim, i_time] += delta_signed
-        update_error(y_error, x[i_stim], x_pads[i_stim], split.train_and_validate, delta_signed, i_time + i_start)
-    else:
-        raise RuntimeError("Maximum number of iterations exceeded")
-    # print('  (%i iterations)' % (i_boost + 1))
-
-    # reverse changes after best iteration
-    if best_iteration:
-        for step in history[-1: best_iteration: -1]:
-            if step.delta:
-                h[step.i_stim, step.i_time] -= step.delta
-    else:
-        h = None
-
-    if return_history:
-        return h, [step.e_test for step in history]
-    else:
-        return h
-
+        self._step(i_stim, i_time, delta_signed)
+        self.i_stim = i_stim
+        self.i_time = i_time
+        self.delta_signed = delta_signed
+        return True
+
+    def _step(self, i_stim, i_time, delta_signed):
+        self.h[i_stim, i_time] += delta_signed
+        if self.x_sparse is not None and self.x_sparse.sparse[i_stim] and self.x_pads[i_stim] == 0:
+            index, value = self.x_sparse.events(i_stim)
+            update_error_events(self.y_error, index, value, self.split.train_and_validate, delta_signed, i_time + self.i_start)
+        else:
+            update_error(self.y_error, self.x[i_stim], self.x_pads[i_stim], self.split.train_and_validate, delta_signed, i_time + self.i_start)
+        if self.gram is not None:
+            self.cross -= delta_signed * self.gram.column(i_stim, i_time)
+
+    def generate_gram_options(self):
+        "Write the candidate steps to ``new_error`` and ``new_sign`` from the :class:`LaggedGram`"
+        delta = self.delta
+        change = self.gram.energy * delta ** 2
+        change -= np.abs(self.cross) * (2 * delta)
+        # training error of the current state (``self.step`` can refer to an earlier state with selective stopping)
+        np.add(change, self.history[-1].e_train, out=self.new_error)
+        self.new_error[self.gram.invalid] = np.inf
+        self.new_error[self.x_active == 0] = np.inf
+        np.copyto(self.new_sign, np.where(self.cross < 0, -1, 1))
+
+    def result(self, return_history=False):
+        "Winning kernel (see :func:`boost`)"
+        h = self.h
+        # reverse changes after best iteration
+        if self.best_iteration or self.warm:
+            for step in self.history[-1: self.best_iteration: -1]:
+                if step.delta:
+                    h[step.i_stim, step.i_time] -= step.delta
+        else:
+            h = None
 
-def setup_workers(data, i_start, i_stop, delta, mindelta, error, selective_stopping):
-    n_y, n_times = data.y.shape
-    n_x, _ = data.x.shape
+        if return_history:
+            return h, [step.e_test for step in self.history]
+        else:
+            return h
 
-    y_buffer = RawArray('d', n_y * n_times)
-    y_buffer[:] = data.y.ravel()
-    x_buffer = RawArray('d', n_x * n_times)
-    x_buffer[:] = data.x.ravel()
-    x_pads_buffer = RawArray('d', n_x)
-    x_pads_buffer[:] = data.x_pads
 
-    job_queue = mpc.Queue(200)
-    result_queue = mpc.Queue(200)
+def boost_y(y, i_y, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error, selective_stopping, n_threads, gram=False, x_sparse=None, h_init=None, y_norm=None):
+    """Boost one response (``i_y`` is int) or a batch of responses (``i_y`` is slice)
 
-    args = (y_buffer, x_buffer, x_pads_buffer, n_y, n_times, n_x, data.splits.splits, i_start, i_stop, delta, mindelta, error, selective_stopping, job_queue, result_queue)
-    for _ in range(CONFIG['n_workers']):
-        process = mpc.Process(target=boosting_worker, args=args)
-        process.start()
+    Only the rows ``i_y`` of ``y`` are read (normalized with ``y_norm``, see
+    :attr:`RevCorrData.y_norm`).
+    """
+    y_i = y_rows(y, i_y, y_norm)
+    if isinstance(i_y, slice):
+        return boost_multi(y_i, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error, selective_stopping, n_threads, gram, x_sparse, h_init)
+    return boost(y_i, x, x_pads, split, i_start_by_x, i_stop_by_x, delta, mindelta, error, selective_stopping, n_threads=n_threads, gram=gram, x_sparse=x_sparse, h_init=h_init)
+
+
+def store_h(h_out, h_failed, i_y, h):
+    "Store the result of :func:`boost_y` in ``h_out[i_y]``"
+    if isinstance(i_y, slice):
+        for i, h_i in zip(range(i_y.start, i_y.stop), h):
+            store_h(h_out, h_failed, i, h_i)
+    elif h is None:
+        h_failed[i_y] = True
+        h_out[i_y] = 0
+    else:
+        h_out[i_y] = h
 
-    return job_queue, result_queue
 
+def boosting_worker(job_queue, result_queue, kill_beacon, jobs):
+    """Boost ``(i_job, i_y, i_split, i_init)`` tasks
 
-def boosting_worker(y_buffer, x_buffer, x_pads_buffer, n_y, n_times, n_x, splits, i_start, i_stop, delta, mindelta, error, selective_stopping, job_queue, result_queue):
-    if CONFIG['nice']:
-        os.nice(CONFIG['nice'])
+    ``jobs`` contains the arguments for each fit, as returned by
+    :meth:`Boosting._worker_args`. With ``i_init``, boosting starts from
+    ``h_init[i_init, i_y]``, or from ``h_out[i_init, i_y]`` (a previous split)
+    if ``h_init`` is ``None``.
+    """
+    while not kill_beacon.is_set():
+        job = job_queue.get()
+        if job is None:
+            return
+        i_job, i_y, i_split, i_init = job
+        y, x, x_pads, y_norm, h_out, h_failed, h_init, splits, *args = jobs[i_job]
+        if i_init is None:
+            h_init_i = None
+        else:
+            h_init_i = (h_out if h_init is None else h_init).array[i_init, i_y]
+        h = boost_y(y.array, i_y, x.array, x_pads.array, splits[i_split], *args, h_init_i, y_norm)
+        # write results directly to h_out if it is in shared memory
+        if h_out.is_shared:
+            store_h(h_out.array[i_split], h_failed.array[i_split], i_y, h)
+            result_queue.put((i_job, i_y, i_split, True, None))
+        else:
+            result_queue.put((i_job, i_y, i_split, False, h))
 
-    y = np.frombuffer(y_buffer, np.float64, n_y * n_times).reshape((n_y, n_times))
-    x = np.frombuffer(x_buffer, np.float64, n_x * n_times).reshape((n_x, n_times))
-    x_pads = np.frombuffer(x_pads_buffer, np.float64, n_x)
 
-    while True:
-        i_y, i_split = job_queue.get()
-        if i_y == JOB_TERMINATE:
-            return
-        h = boost(y[i_y], x, x_pads, splits[i_split], i_start, i_stop, delta, mindelta, error, selective_stopping)
-        result_queue.put((i_y, i_split, h))
+def predict(
+        h: np.ndarray,
+        x: np.ndarray,
+        x_pads: np.ndarray,
+        h_i_start: int,
+        segments: np.ndarray,
+        out: np.ndarray,
+        x_sparse: SparseX = None,
+):
+    """Predict several responses, ``out[i] = h[i] * x`` (see :func:`convolve`)
 
+    Parameters
+    ----------
+    h : array, (n_y, n_stims, h_n_samples)
+        Kernels.
+    ...
+        See :func:`convolve`.
+    out : array (n_y, n_samples)
+        Buffer for predicted ``y`` (only ``segments`` are written).
 
-def put_jobs(queue, n_y, n_splits, stop):
-    "Feed boosting jobs into a Queue"
-    for job in product(range(n_y), range(n_splits)):
-        queue.put(job)
-        if stop.isSet():
-            while not queue.empty():
-                queue.get()
-            break
-    for _ in range(CONFIG['n_workers']):
-        queue.put((JOB_TERMINATE, None))
+    Notes
+    -----
+    Short kernels are convolved directly. For longer kernels, the spectrum of
+    each predictor is computed once and shared by all responses.
+    """
+    n_y, n_x, h_n_times = h.shape
+    if h_n_times < FFT_MIN_N_TIMES:
+        for h_i, out_i in zip(h, out):
+            convolve(h_i, x, x_pads, h_i_start, segments, out_i, x_sparse)
+        return out
+    # x = x_pad + (x - x_pad), where (x - x_pad) is 0 outside the segment
+    y_pad = h.sum(2).dot(x_pads)
+    for start, stop in segments:
+        n_times = stop - start
+        n_fft = 1 << int(n_times + h_n_times - 2).bit_length()  # >= n_times + h_n_times - 1
+        x_fft = np.fft.rfft(x[:, start:stop] - x_pads[:, np.newaxis], n_fft)
+        y_fft = np.zeros((n_y, x_fft.shape[1]), x_fft.dtype)
+        for i_x in range(n_x):
+            h_fft = np.fft.rfft(h[:, i_x], n_fft)
+            h_fft *= x_fft[i_x]
+            y_fft += h_fft
+        y = np.fft.irfft(y_fft, n_fft)
+        # y[j] is the response at time j + h_i_start
+        i_first = max(0, h_i_start)
+        i_last = min(n_times, n_times + h_n_times - 1 + h_i_start)
+        out[:, start: stop] = y_pad[:, np.newaxis]
+        out[:, start + i_first: start + i_last] += y[:, i_first - h_i_start: i_last - h_i_start]
+    return out
 
 
 def convolve(
@@ -968,6 +1636,7 @@ def convolve(
         h_i_start: int,
         segments: np.ndarray = None,
         out: np.ndarray = None,
+        x_sparse: SparseX = None,
 ):
     """h * x with time axis matching x
 
@@ -985,6 +1654,9 @@ def convolve(
         Data segments.
     out : array
         Buffer for predicted ``y``.
+    x_sparse : SparseX
+        Event lists for sparse predictors (only the events of these predictors
+        are convolved).
     """
     n_x, n_times = x.shape
     h_n_times = h.shape[1]
@@ -997,25 +1669,51 @@ def convolve(
             out[a:b] = 0
     h_i_stop = h_i_start + h_n_times
 
+    if x_sparse is not None:
+        # x = x_pad + (x - x_pad) at events
+        for i_stim in np.flatnonzero(x_sparse.sparse):
+            h_i = h[i_stim]
+            x_pad = x_pads[i_stim]
+            index, value = x_sparse.events(i_stim)
+            value = value - x_pad
+            pad = x_pad * h_i.sum()
+            for start, stop in segments:
+                out[start:stop] += pad
+                i_first, i_last = np.searchsorted(index, (start, stop))
+                index_s = index[i_first:i_last]
+                value_s = value[i_first:i_last]
+                for i_time in np.flatnonzero(h_i):
+                    shift = h_i_start + i_time
+                    index_i = index_s + shift
+                    valid = slice(*np.searchsorted(index_i, (start, stop)))
+                    out[index_i[valid]] += h_i[i_time] * value_s[valid]
+        dense = x_sparse.dense.astype(bool)
+        h = h[dense]
+        x = x[dense]
+        x_pads = x_pads[dense]
+
     # padding
     h_pad = np.sum(h * x_pads.reshape((-1, 1)), 0)
-    # padding for pre-
-    pad_head_n_times = max(0, h_n_times + h_i_start)
+    # padding for pre- (sample j is padded for lags > j)
+    pad_head_n_times = max(0, h_n_times + h_i_start - 1)
     if pad_head_n_times:
         pad_head = np.zeros(pad_head_n_times)
-        for i in range(min(pad_head_n_times, h_n_times)):
-            pad_head[:pad_head_n_times - i] += h_pad[- i - 1]
+        for i in range(h_n_times):
+            pad_head[:max(0, h_i_start + i)] += h_pad[i]
     # padding for post-
     pad_tail_n_times = -min(0, h_i_start)
     if pad_tail_n_times:
         pad_tail = np.zeros(pad_tail_n_times)
-        for i in range(pad_tail_n_times):
+        for i in range(min(pad_tail_n_times, h_n_times)):
             pad_tail[i:] += h_pad[i]
 
     for start, stop in segments:
+        # segments can be shorter than the padding
         if pad_head_n_times:
-            out[start: start + pad_head_n_times] += pad_head
+            n = min(pad_head_n_times, stop - start)
+            out[start: start + n] += pad_head[:n]
         if pad_tail_n_times:
-            out[stop - pad_tail_n_times: stop] += pad_tail
+            n = min(pad_tail_n_times, stop - start)
+            out[stop - n: stop] += pad_tail[pad_tail_n_times - n:]
         convolve_jit(h, x[:, start:stop], out[start:stop], h_i_start, h_i_stop)
     return out
@@ -0,0 +1,135 @@
+# Author: Christian Brodbeck <christianbrodbeck@nyu.edu>
+"""Cache for :func:`boosting` results, keyed by the content of the data
+
+Results are stored as ``<key>.pickle`` in ``CONFIG['boosting_cache']``. The
+modification time of a file is updated whenever the result is used, and the
+least recently used results are removed when the size of the cache exceeds
+``CONFIG['boosting_cache_size']``.
+"""
+from hashlib import blake2b
+import os
+from pathlib import Path
+import pickle
+import time
+from typing import Any
+
+import numpy as np
+
+from .._config import CONFIG
+from .._io.pickle import pickle as save_pickle, unpickle
+
+
+# number of bytes hashed together
+HASH_BLOCK_SIZE = 2 ** 24
+# last access time set by this process
+_LAST_ACCESS_NS = 0
+
+
+def _update_array(hasher: blake2b, array: np.ndarray):
+    hasher.update(repr((array.dtype.str, array.shape)).encode())
+    if array.ndim == 0 or array.size == 0:
+        hasher.update(array.tobytes())
+        return
+    n = max(1, HASH_BLOCK_SIZE // max(1, array[0].nbytes))
+    for i in range(0, len(array), n):
+        hasher.update(np.ascontiguousarray(array[i: i + n]).data)
+
+
+def _update(hasher: blake2b, obj: Any):
+    "Add ``obj`` to ``hasher`` (arrays by content, other objects through pickle)"
+    if isinstance(obj, np.ndarray):
+        _update_array(hasher, obj)
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(f'{type(obj).__name__}{len(obj)}'.encode())
+        for item in obj:
+            _update(hasher, item)
+    elif isinstance(obj, dict):
+        _update(hasher, list(obj.items()))
+    else:
+        hasher.update(pickle.dumps(obj, 4))
+
+
+def boosting_cache_key(fit, **params) -> str:
+    """Key for the result of ``fit`` (:class:`Boosting` after :meth:`Boosting._prepare_fit`)
+
+    The key covers the data as they are used by the algorithm (after
+    normalization and cross-validation splits), the data descriptions that
+    are stored in the result, and ``params`` (parameters that affect the
+    result but are not stored on ``fit``).
+    """
+    from .. import __version__
+
+    data = fit.data
+    hasher = blake2b(digest_size=20)
+    _update(hasher, [
+        __version__,
+        # data
+        data.y, data.y_norm, data.x, data.x_pads, data.segments,
+        [(split.train, split.validate, split.test, split.i_test) for split in data.splits.splits],
+        [data.y_mean, data.y_scale, data.x_mean, data.x_scale],
+        # data description
+        data.y_name, data._y_repr, data.y_info, data.full_y_dims, data.time, data.vector_dim,
+        data.x_name, data.x_names, data._x_meta, data.basis, data.basis_window, data.scale_data,
+        data.splits.partitions_arg, data.splits.n_validate, data.splits.n_test, data.splits.model,
+        # fit parameters
+        fit.tstart, fit.tstop, fit.selective_stopping, fit.error, fit.delta, fit.mindelta,
+        fit.sparse, fit._h_init, fit.warm_start if isinstance(fit.warm_start, bool) else repr(fit.warm_start),
+        params,
+    ])
+    return hasher.hexdigest()
+
+
+def _touch(path: Path):
+    """Mark ``path`` as most recently used
+
+    The access time is set explicitly, and is increased for each access, so
+    that the order is preserved on file systems with coarse timestamps.
+    """
+    global _LAST_ACCESS_NS
+    _LAST_ACCESS_NS = max(time.time_ns(), _LAST_ACCESS_NS + 1)
+    os.utime(path, ns=(_LAST_ACCESS_NS, _LAST_ACCESS_NS))
+
+
+def load_result(key: str):
+    "Load the result for ``key`` (or ``None``)"
+    path = Path(CONFIG['boosting_cache']) / f'{key}.pickle'
+    if not path.exists():
+        return None
+    try:
+        result = unpickle(path)
+        _touch(path)
+    except FileNotFoundError:  # removed by another process
+        return None
+    except Exception:  # outdated file
+        path.unlink()
+        return None
+    return result
+
+
+def save_result(key: str, result):
+    "Save ``result`` for ``key`` and remove the least recently used results exceeding the cache size"
+    root = Path(CONFIG['boosting_cache'])
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / f'{key}.pickle'
+    tmp_path = root / f'{key}.{os.getpid()}.tmp'
+    save_pickle(result, tmp_path)
+    os.replace(tmp_path, path)
+    _touch(path)
+    # evict least recently used
+    files = []
+    for file in root.glob('*.pickle'):
+        try:
+            stat = file.stat()
+        except FileNotFoundError:  # removed by another process
+            continue
+        files.append((stat.st_mtime_ns, file.name, stat.st_size, file))
+    files.sort()
+    size = sum(size for _, _, size, _ in files)
+    for _, _, file_size, file in files:
+        if size <= CONFIG['boosting_cache_size'] or file == path:
+            break
+        try:
+            file.unlink()
+        except FileNotFoundError:
+            pass
+        size -= file_size
@@ -1,6 +1,7 @@
 # Author: Christian Brodbeck <christianbrodbeck@nyu.edu>
 # cython: language_level=3, boundscheck=False, wraparound=False
 from libc.math cimport fabs
+import numpy as np
 cimport numpy as np
 
 ctypedef np.int8_t INT8
@@ -175,6 +176,432 @@ def generate_options(
                     new_sign[i_stim, i_time] = 1
 
 
+cdef inline Py_ssize_t first_event(
+        INT64 [:] event_index,
+        Py_ssize_t lo,
+        Py_ssize_t hi,
+        INT64 value,
+    ) nogil:
+    "Index of the first event in ``event_index[lo:hi]`` at or after ``value``"
+    cdef Py_ssize_t mid
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if event_index[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def generate_options_sparse(
+        FLOAT64 [:] y_error,
+        FLOAT64 [:] x_pads,  # (n_stims,)
+        INT8 [:] x_active,  # for each predictor whether it is still used (and sparse)
+        INT64 [:] event_ptr,  # (n_stims + 1,) events of predictor i are event_ptr[i]:event_ptr[i+1]
+        INT64 [:] event_index,  # (n_events,) time index of each event
+        FLOAT64 [:] event_value,  # (n_events,) x at each event
+        INT64 [:,:] indexes,  # training segment indexes
+        int i_start,  # kernel start index (time axis offset)
+        INT64 [:] i_start_by_x,  # (n_stims,) kernel start index
+        INT64 [:] i_stop_by_x, # (n_stims,) kernel stop index
+        size_t error,  # ID of the error function (l1/l2)
+        double delta,
+        # buffers
+        FLOAT64 [:,:] new_error,  # (n_stims, n_times_trf)
+        INT8 [:,:] new_sign,  # (n_stims, n_times_trf)
+    ):
+    """Like :func:`generate_options` for predictors stored as events
+
+    Apart from the events, a sparse predictor is equal to its padding value.
+    The error for a step on the padding value is computed once for all lags,
+    and then only corrected at the samples affected by events.
+    """
+    cdef:
+        double d, d_event, r, base_add, base_sub, e_add, e_sub
+        size_t n_stims = new_error.shape[0]
+        size_t i, i_stim, seg_i
+        Py_ssize_t i_event, events_stop
+        INT64 seg_start, seg_stop, k_start, k_stop
+        int i_time
+
+    if error != 1 and error != 2:
+        raise RuntimeError("error=%r" % (error,))
+
+    with nogil:
+        for i_stim in range(n_stims):
+            if x_active[i_stim] == 0:
+                continue
+            # error with the padding value at every sample
+            d = delta * x_pads[i_stim]
+            base_add = 0.
+            base_sub = 0.
+            for seg_i in range(indexes.shape[0]):
+                for i in range(indexes[seg_i, 0], indexes[seg_i, 1]):
+                    if error == 1:
+                        base_add += fabs(y_error[i] - d)
+                        base_sub += fabs(y_error[i] + d)
+                    else:
+                        base_add += (y_error[i] - d) ** 2
+                        base_sub += (y_error[i] + d) ** 2
+
+            events_stop = event_ptr[i_stim + 1]
+            for i_time in range(i_start_by_x[i_stim], i_stop_by_x[i_stim]):
+                e_add = 0.
+                e_sub = 0.
+                for seg_i in range(indexes.shape[0]):
+                    seg_start = indexes[seg_i, 0]
+                    seg_stop = indexes[seg_i, 1]
+                    # events k with k and k + i_time in the segment
+                    k_start = seg_start
+                    k_stop = seg_stop
+                    if i_time > 0:
+                        k_stop -= i_time
+                    else:
+                        k_start -= i_time
+                    i_event = first_event(event_index, event_ptr[i_stim], events_stop, k_start)
+                    while i_event < events_stop and event_index[i_event] < k_stop:
+                        r = y_error[event_index[i_event] + i_time]
+                        d_event = delta * event_value[i_event]
+                        if error == 1:
+                            e_add += fabs(r - d_event) - fabs(r - d)
+                            e_sub += fabs(r + d_event) - fabs(r + d)
+                        else:
+                            e_add += (r - d_event) ** 2 - (r - d) ** 2
+                            e_sub += (r + d_event) ** 2 - (r + d) ** 2
+                        i_event += 1
+                e_add += base_add
+                e_sub += base_sub
+
+                i_time -= i_start
+                if e_add > e_sub:
+                    new_error[i_stim, i_time] = e_sub
+                    new_sign[i_stim, i_time] = -1
+                else:
+                    new_error[i_stim, i_time] = e_add
+                    new_sign[i_stim, i_time] = 1
+
+
+cdef inline void l1_accumulate(
+        FLOAT64 [:,::1] y_error,  # (n_times, n_y)
+        FLOAT64 [:] x,
+        bint pad,  # use x_pad instead of x
+        double x_pad,
+        int shift,  # TRF element offset
+        size_t i_start,  # time range
+        size_t i_stop,
+        size_t k0,  # first response of the block
+        FLOAT64 [::1] delta,  # (n_y,)
+        FLOAT64 [:,::1] e_add,  # (n_times_trf, n_y) running sums
+        FLOAT64 [:,::1] e_sub,  # (n_times_trf, n_y)
+        size_t i_lag,  # row of e_add/e_sub
+    ) nogil:
+    # Add time points to the error sums of a block of 4 responses, keeping the
+    # sums in registers
+    cdef:
+        double d
+        double x_i
+        double add[4]
+        double sub[4]
+        double delta_k[4]
+        size_t i, j
+
+    for j in range(4):
+        delta_k[j] = delta[k0 + j]
+        add[j] = e_add[i_lag, k0 + j]
+        sub[j] = e_sub[i_lag, k0 + j]
+
+    if pad:
+        for i in range(i_start, i_stop):
+            for j in range(4):
+                d = delta_k[j] * x_pad
+                add[j] += fabs(y_error[i, k0 + j] - d)
+                sub[j] += fabs(y_error[i, k0 + j] + d)
+    else:
+        for i in range(i_start, i_stop):
+            x_i = x[i - shift]
+            for j in range(4):
+                d = delta_k[j] * x_i
+                add[j] += fabs(y_error[i, k0 + j] - d)
+                sub[j] += fabs(y_error[i, k0 + j] + d)
+
+    for j in range(4):
+        e_add[i_lag, k0 + j] = add[j]
+        e_sub[i_lag, k0 + j] = sub[j]
+
+
+cdef inline void l2_accumulate(
+        FLOAT64 [:,::1] y_error,  # (n_times, n_y)
+        FLOAT64 [:] x,
+        bint pad,  # use x_pad instead of x
+        double x_pad,
+        int shift,  # TRF element offset
+        size_t i_start,  # time range
+        size_t i_stop,
+        size_t k0,  # first response of the block
+        FLOAT64 [::1] delta,  # (n_y,)
+        FLOAT64 [:,::1] e_add,  # (n_times_trf, n_y) running sums
+        FLOAT64 [:,::1] e_sub,  # (n_times_trf, n_y)
+        size_t i_lag,  # row of e_add/e_sub
+    ) nogil:
+    # Add time points to the error sums of a block of 4 responses, keeping the
+    # sums in registers
+    cdef:
+        double d
+        double x_i
+        double add[4]
+        double sub[4]
+        double delta_k[4]
+        size_t i, j
+
+    for j in range(4):
+        delta_k[j] = delta[k0 + j]
+        add[j] = e_add[i_lag, k0 + j]
+        sub[j] = e_sub[i_lag, k0 + j]
+
+    if pad:
+        for i in range(i_start, i_stop):
+            for j in range(4):
+                d = delta_k[j] * x_pad
+                add[j] += (y_error[i, k0 + j] - d) ** 2
+                sub[j] += (y_error[i, k0 + j] + d) ** 2
+    else:
+        for i in range(i_start, i_stop):
+            x_i = x[i - shift]
+            for j in range(4):
+                d = delta_k[j] * x_i
+                add[j] += (y_error[i, k0 + j] - d) ** 2
+                sub[j] += (y_error[i, k0 + j] + d) ** 2
+
+    for j in range(4):
+        e_add[i_lag, k0 + j] = add[j]
+        e_sub[i_lag, k0 + j] = sub[j]
+
+
+cdef void accumulate(
+        size_t error,
+        FLOAT64 [:,::1] y_error,
+        FLOAT64 [:] x,
+        bint pad,
+        double x_pad,
+        int shift,
+        size_t i_start,
+        size_t i_stop,
+        size_t n_y,
+        FLOAT64 [::1] delta,
+        FLOAT64 [:,::1] e_add,
+        FLOAT64 [:,::1] e_sub,
+        size_t i_lag,
+    ) nogil:
+    cdef size_t k0
+
+    if i_stop <= i_start:
+        return
+    for k0 in range(0, n_y, 4):
+        if error == 1:
+            l1_accumulate(y_error, x, pad, x_pad, shift, i_start, i_stop, k0, delta, e_add, e_sub, i_lag)
+        else:
+            l2_accumulate(y_error, x, pad, x_pad, shift, i_start, i_stop, k0, delta, e_add, e_sub, i_lag)
+
+
+def multi_buffers(size_t n_times, size_t n_y, size_t n_times_trf):
+    "Work buffers for :func:`generate_options_multi`"
+    n_y_blocks = (n_y + 3) // 4 * 4  # responses are processed in blocks of 4
+    return np.zeros((n_times, n_y_blocks)), np.empty((n_times_trf, n_y_blocks)), np.empty((n_times_trf, n_y_blocks))
+
+
+def generate_options_multi(
+        FLOAT64 [:,:] y_error,  # (n_times, n_y)
+        FLOAT64 [:,:] x,  # (n_stims, n_times)
+        FLOAT64 [:] x_pads,  # (n_stims,)
+        INT8 [:,:] x_active,  # (n_y, n_stims) for each response and predictor whether it is still used
+        INT64 [:,:] indexes,  # training segment indexes
+        int i_start,  # kernel start index (time axis offset)
+        INT64 [:] i_start_by_x,  # (n_stims,) kernel start index
+        INT64 [:] i_stop_by_x, # (n_stims,) kernel stop index
+        size_t error,  # ID of the error function (l1/l2)
+        FLOAT64 [:] delta,  # (n_y,)
+        # buffers
+        FLOAT64 [:,:,:] new_error,  # (n_y, n_stims, n_times_trf)
+        INT8 [:,:,:] new_sign,  # (n_y, n_stims, n_times_trf)
+        # work buffers (see multi_buffers())
+        FLOAT64 [:,::1] y_error_ys,  # active responses, copied into contiguous columns
+        FLOAT64 [:,::1] e_add,
+        FLOAT64 [:,::1] e_sub,
+    ):
+    """Like :func:`generate_options` for several responses
+
+    The error sums for each response are computed in the same order as in
+    :func:`generate_options`, but time is processed in chunks that are used
+    for all TRF lags and responses while they are in the cache.
+    """
+    cdef:
+        size_t n_times = y_error.shape[0]
+        size_t n_y = y_error.shape[1]
+        size_t n_stims = new_error.shape[1]
+        size_t n_y_blocks = y_error_ys.shape[1]
+        size_t i, i_stim, j, k, n_ys, n_ys_prev, seg_i, seg_start, seg_stop, conv_start, conv_stop, chunk_start, chunk_stop
+        size_t chunk_len = max(32, 4096 // n_y_blocks)
+        int i_time, i_lag
+        double x_pad
+        bint same_ys
+        FLOAT64 [:] x_stim
+        INT64 [::1] ys = np.empty(n_y, np.int64)
+        INT64 [::1] ys_prev = np.empty(n_y, np.int64)
+        FLOAT64 [::1] delta_ys = np.zeros(n_y_blocks)
+
+    if error != 1 and error != 2:
+        raise RuntimeError("error=%r" % (error,))
+
+    with nogil:
+        n_ys_prev = 0
+        for i_stim in range(n_stims):
+            # responses for which this predictor is active
+            n_ys = 0
+            same_ys = True
+            for k in range(n_y):
+                if x_active[k, i_stim]:
+                    if n_ys >= n_ys_prev or ys_prev[n_ys] != k:
+                        same_ys = False
+                    ys[n_ys] = k
+                    n_ys += 1
+            if n_ys == 0:
+                continue
+            elif n_ys != n_ys_prev or not same_ys:
+                for j in range(n_ys):
+                    ys_prev[j] = ys[j]
+                    delta_ys[j] = delta[ys[j]]
+                for j in range(n_ys, n_y_blocks):
+                    delta_ys[j] = 0
+                for i in range(n_times):
+                    for j in range(n_ys):
+                        y_error_ys[i, j] = y_error[i, ys[j]]
+                n_ys_prev = n_ys
+            x_stim = x[i_stim]
+            x_pad = x_pads[i_stim]
+            for i_time in range(i_start_by_x[i_stim], i_stop_by_x[i_stim]):
+                i_lag = i_time - i_start
+                for j in range(n_y_blocks):
+                    e_add[i_lag, j] = 0.
+                    e_sub[i_lag, j] = 0.
+
+            for seg_i in range(indexes.shape[0]):
+                seg_start = indexes[seg_i, 0]
+                seg_stop = indexes[seg_i, 1]
+                # padding (pre- and post-)
+                for i_time in range(i_start_by_x[i_stim], i_stop_by_x[i_stim]):
+                    i_lag = i_time - i_start
+                    conv_start = seg_start
+                    conv_stop = seg_stop
+                    if i_time > 0:
+                        conv_start += i_time
+                    elif i_time < 0:
+                        conv_stop += i_time
+                    accumulate(error, y_error_ys, x_stim, True, x_pad, i_time, seg_start, conv_start, n_ys, delta_ys, e_add, e_sub, i_lag)
+                    accumulate(error, y_error_ys, x_stim, True, x_pad, i_time, conv_stop, seg_stop, n_ys, delta_ys, e_add, e_sub, i_lag)
+                # valid segment, one chunk at a time
+                chunk_start = seg_start
+                while chunk_start < seg_stop:
+                    chunk_stop = min(chunk_start + chunk_len, seg_stop)
+                    for i_time in range(i_start_by_x[i_stim], i_stop_by_x[i_stim]):
+                        i_lag = i_time - i_start
+                        conv_start = seg_start
+                        conv_stop = seg_stop
+                        if i_time > 0:
+                            conv_start += i_time
+                        elif i_time < 0:
+                            conv_stop += i_time
+                        accumulate(error, y_error_ys, x_stim, False, x_pad, i_time, max(conv_start, chunk_start), min(conv_stop, chunk_stop), n_ys, delta_ys, e_add, e_sub, i_lag)
+                    chunk_start = chunk_stop
+
+            for i_time in range(i_start_by_x[i_stim], i_stop_by_x[i_stim]):
+                i_lag = i_time - i_start
+                for j in range(n_ys):
+                    k = ys[j]
+                    if e_add[i_lag, j] > e_sub[i_lag, j]:
+                        new_error[k, i_stim, i_lag] = e_sub[i_lag, j]
+                        new_sign[k, i_stim, i_lag] = -1
+                    else:
+                        new_error[k, i_stim, i_lag] = e_add[i_lag, j]
+                        new_sign[k, i_stim, i_lag] = 1
+
+
+def lagged_dot(
+        FLOAT64 [:] v,  # (n_times,)
+        FLOAT64 [:,:] x,  # (n_stims, n_times)
+        FLOAT64 [:] x_pads,  # (n_stims,)
+        INT64 [:,:] indexes,  # training segment indexes
+        int i_start,  # kernel start index (time axis offset)
+        INT64 [:] i_start_by_x,  # (n_stims,) kernel start index
+        INT64 [:] i_stop_by_x, # (n_stims,) kernel stop index
+        FLOAT64 [:,:] out,  # (n_stims, n_times_trf)
+    ):
+    "Dot product of ``v`` with each lagged (and padded) predictor"
+    cdef:
+        double s, x_pad
+        size_t i, i_stim, seg_i, seg_start, seg_stop, conv_start, conv_stop
+        int i_time
+
+    with nogil:
+        for i_stim in range(x.shape[0]):
+            x_pad = x_pads[i_stim]
+            for i_time in range(i_start_by_x[i_stim], i_stop_by_x[i_stim]):
+                s = 0.
+                for seg_i in range(indexes.shape[0]):
+                    seg_start = indexes[seg_i, 0]
+                    seg_stop = indexes[seg_i, 1]
+                    conv_start = seg_start
+                    conv_stop = seg_stop
+                    if i_time > 0:
+                        conv_start += i_time
+                    elif i_time < 0:
+                        conv_stop += i_time
+                    # padding
+                    for i in range(seg_start, conv_start):
+                        s += v[i] * x_pad
+                    for i in range(conv_stop, seg_stop):
+                        s += v[i] * x_pad
+                    # valid convolution
+                    for i in range(conv_start, conv_stop):
+                        s += v[i] * x[i_stim, i - i_time]
+                out[i_stim, i_time - i_start] = s
+
+
+def lagged_energy(
+        FLOAT64 [:,:] x,  # (n_stims, n_times)
+        FLOAT64 [:] x_pads,  # (n_stims,)
+        INT64 [:,:] indexes,  # training segment indexes
+        int i_start,  # kernel start index (time axis offset)
+        INT64 [:] i_start_by_x,  # (n_stims,) kernel start index
+        INT64 [:] i_stop_by_x, # (n_stims,) kernel stop index
+        FLOAT64 [:,:] out,  # (n_stims, n_times_trf)
+    ):
+    "Sum of squares of each lagged (and padded) predictor"
+    cdef:
+        double s, pad_energy
+        size_t i, i_stim, seg_i, seg_start, seg_stop, conv_start, conv_stop
+        int i_time
+
+    with nogil:
+        for i_stim in range(x.shape[0]):
+            pad_energy = x_pads[i_stim] ** 2
+            for i_time in range(i_start_by_x[i_stim], i_stop_by_x[i_stim]):
+                s = 0.
+                for seg_i in range(indexes.shape[0]):
+                    seg_start = indexes[seg_i, 0]
+                    seg_stop = indexes[seg_i, 1]
+                    conv_start = seg_start
+                    conv_stop = seg_stop
+                    if i_time > 0:
+                        conv_start += i_time
+                    elif i_time < 0:
+                        conv_stop += i_time
+                    s += (conv_start - seg_start + seg_stop - conv_stop) * pad_energy
+                    for i in range(conv_start, conv_stop):
+                        s += x[i_stim, i - i_time] ** 2
+                out[i_stim, i_time - i_start] = s
+
+
 def update_error(
         FLOAT64 [:] y_error,
         FLOAT64 [:] x,
@@ -207,3 +634,31 @@ def update_error(
             # part of the segment that is affected
             for i in range(conv_start, conv_stop):
                 y_error[i] -= delta * x[i - shift]
+
+
+def update_error_events(
+        FLOAT64 [:] y_error,
+        INT64 [:] event_index,  # time index of the events of one predictor
+        FLOAT64 [:] event_value,  # x at each event
+        INT64 [:,:] indexes,  # segment indexes
+        double delta,
+        int shift,
+    ):
+    "Like :func:`update_error` for a predictor that is 0 apart from the events"
+    cdef:
+        Py_ssize_t i_event
+        size_t seg_i
+        INT64 k_start, k_stop
+
+    with nogil:
+        for seg_i in range(indexes.shape[0]):
+            k_start = indexes[seg_i, 0]
+            k_stop = indexes[seg_i, 1]
+            if shift > 0:
+                k_stop -= shift
+            else:
+                k_start -= shift
+            i_event = first_event(event_index, 0, event_index.shape[0], k_start)
+            while i_event < event_index.shape[0] and event_index[i_event] < k_stop:
+                y_error[event_index[i_event] + shift] -= delta * event_value[i_event]
+                i_event += 1
@@ -4,7 +4,7 @@ from warnings import catch_warnings, filterwarnings
 
 import numpy as np
 from scipy.linalg import norm
-from scipy.stats import spearmanr
+from scipy.stats import rankdata, spearmanr
 
 from ._boosting_opt import l1, l2
 from .shared import RevCorrData
@@ -21,7 +21,8 @@ class Evaluator:
         if self.vector:
             if not data.vector_dim:
                 raise ValueError(f"{self.__class__.__name__}: Vector evaluator for non-vector data")
-            n //= len(data.vector_dim)
+            self.n_vec = len(data.vector_dim)
+            n //= self.n_vec
         self.x = np.empty(n, np.float64)
 
     @classmethod
@@ -40,6 +41,20 @@ class Evaluator:
     ):
         raise NotImplementedError
 
+    def add_ys(
+            self,
+            index: slice,  # y indexes (rows in data.y, or vectors for vector evaluators)
+            y: np.ndarray,  # actual data (n_rows, n_times)
+            y_pred: np.ndarray,  # data predicted by model (n_rows, n_times)
+            segments: np.ndarray,  # segments on which to evaluate
+    ):
+        "Add a block of rows (subclasses can evaluate them together)"
+        if self.vector:
+            y = y.reshape((-1, self.n_vec, y.shape[-1]))
+            y_pred = y_pred.reshape(y.shape)
+        for i, y_i, y_pred_i in zip(range(index.start, index.stop), y, y_pred):
+            self.add_y(i, y_i, y_pred_i, segments)
+
     def __repr__(self):
         return f"<{self.__class__.__name__} evaluator>"
 
@@ -57,6 +72,9 @@ class L1(Evaluator):
     ):
         self.x[i] = l1(y - y_pred, segments)
 
+    def add_ys(self, index, y, y_pred, segments):
+        self.x[index] = sum([np.abs(y[:, a:b] - y_pred[:, a:b]).sum(1) for a, b in segments])
+
 
 class L2(Evaluator):
     attr = 'residual'
@@ -71,6 +89,9 @@ class L2(Evaluator):
     ):
         self.x[i] = l2(y - y_pred, segments)
 
+    def add_ys(self, index, y, y_pred, segments):
+        self.x[index] = sum([((y[:, a:b] - y_pred[:, a:b]) ** 2).sum(1) for a, b in segments])
+
 
 class Correlation(Evaluator):
     attr = 'r'
@@ -90,6 +111,20 @@ class Correlation(Evaluator):
             r = np.corrcoef(y, y_pred)[0, 1]
         self.x[i] = 0 if np.isnan(r) else r
 
+    def add_ys(self, index, y, y_pred, segments):
+        y, y_pred = self._y_1_segment(y, y_pred, segments)
+        self.x[index] = self._r(y, y_pred)
+
+    @staticmethod
+    def _r(y, y_pred):
+        "Correlation of corresponding rows"
+        y = y - y.mean(1, keepdims=True)
+        y_pred = y_pred - y_pred.mean(1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = np.einsum('ij,ij->i', y, y_pred) / np.sqrt(np.einsum('ij,ij->i', y, y) * np.einsum('ij,ij->i', y_pred, y_pred))
+        r[np.isnan(r)] = 0
+        return r
+
 
 class RankCorrelation(Evaluator):
     attr = 'r_rank'
@@ -109,6 +144,10 @@ class RankCorrelation(Evaluator):
             r = spearmanr(y, y_pred)[0]
         self.x[i] = 0 if np.isnan(r) else r
 
+    def add_ys(self, index, y, y_pred, segments):
+        y, y_pred = self._y_1_segment(y, y_pred, segments)
+        self.x[index] = Correlation._r(np.apply_along_axis(rankdata, 1, y), np.apply_along_axis(rankdata, 1, y_pred))
+
 
 class VectorL1(Evaluator):
     vector = True
@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from functools import reduce
 from operator import mul
 from typing import List, Union
+import weakref
 
 import numpy as np
 import scipy.signal
@@ -12,6 +13,11 @@ from .. import _info
 from .._data_obj import CategorialArg, NDVarArg, Dataset, NDVar, Case, UTS, dataobj_repr, ascategorial, asndvar
 from .._utils import LazyProperty, PickleableDataClass
 from .._utils.numpy_utils import newaxis
+from .._utils.parallel import SharedArray, WorkerPool, memmap_location
+
+
+# number of samples of y that are read into memory together for y in a file
+Y_BLOCK_SIZE = 2 ** 22
 
 
 @dataclass
@@ -26,6 +32,28 @@ class Split(PickleableDataClass):
         return np.vstack([self.train, self.validate])
 
 
+@dataclass
+class SparseX(PickleableDataClass):
+    """Predictors stored as lists of events
+
+    Apart from the events, a sparse predictor is equal to its padding value
+    (i.e., the events are the non-zero samples of the original predictor).
+    """
+    sparse: np.ndarray  # (n_x,) int8, whether the predictor is stored as events
+    event_ptr: np.ndarray  # (n_x + 1,) events of predictor i are event_ptr[i]:event_ptr[i+1]
+    event_index: np.ndarray  # (n_events,) time index of each event
+    event_value: np.ndarray  # (n_events,) x at each event
+
+    @LazyProperty
+    def dense(self):
+        return 1 - self.sparse
+
+    def events(self, i: int):
+        "``(index, value)`` arrays for the events of predictor ``i``"
+        index = slice(self.event_ptr[i], self.event_ptr[i + 1])
+        return self.event_index[index], self.event_value[index]
+
+
 def merge_segments(
         segments: np.ndarray,
         soft_splits: Union[bool, np.ndarray] = None,
@@ -198,6 +226,17 @@ class RevCorrData:
         segments delimit chunks of continuous data, such as trials.
     splits : list of Split
         Cross-validation scheme.
+    y_norm : None | tuple of array
+        ``(offset, scale)`` for each row of ``y``, when ``y`` is normalized
+        while reading it (see :meth:`y_rows`).
+
+    Notes
+    -----
+    If ``y`` is backed by a file through :class:`numpy.memmap` (and its
+    dimensions are in an order that does not require copying the data), ``y``
+    is not loaded into memory. Instead, :meth:`normalize` computes the scale
+    of ``y`` reading blocks of rows, and rows are normalized as they are read
+    with :meth:`y_rows`. Workers read ``y`` from the same file.
     """
     # data
     x_mean = None
@@ -205,6 +244,7 @@ class RevCorrData:
     y_mean = None
     y_scale = None
     x_pads = None
+    y_norm = None
     _x_is_copy: bool = False
     _y_is_copy: bool = False
     # prefit
@@ -212,6 +252,9 @@ class RevCorrData:
     _prefit_repr: str = None
     # cross-validation
     splits: Splits = None
+    # data in shared memory
+    _shared = None
+    _shared_finalizer = None
 
     def __init__(
             self,
@@ -339,6 +382,8 @@ class RevCorrData:
         self.in_place = in_place
         # y
         self.y = y_data  # (n_signals, n_times)
+        self._y_in_file = not in_place and memmap_location(y_data) is not None
+        self._y_ndvar = y
         self.y_name = y.name
         self._y_repr = dataobj_repr(y)
         self.y_info = _info.copy(y.info)
@@ -349,6 +394,7 @@ class RevCorrData:
         self.vector_shape = vector_shape  # flat shape with vector dim separate
         # x
         self.x = x_data  # (n_predictors, n_times)
+        self._x_ndvars = xs
         self.x_name = x_name
         self.x_names = x_names
         self._x_meta = x_meta  # [(x.name, xdim, index), ...]; index is int or slice
@@ -360,15 +406,43 @@ class RevCorrData:
 
     def _copy_data(self, y=False):
         "Make sure the data is a copy before modifying"
+        self.release_shared()
         if self.in_place:
             return
         if not self._x_is_copy:
             self.x = self.x.copy()
             self._x_is_copy = True
         if y and not self._y_is_copy:
+            if self._y_in_file:
+                raise NotImplementedError(f"Modifying y={self._y_repr} stored in a file; load the data into memory first")
             self.y = self.y.copy()
             self._y_is_copy = True
 
+    def shared_data(self, pool: WorkerPool):
+        """``y``, ``x`` and ``x_pads`` to send to the workers of ``pool``
+
+        Copies in shared memory are kept for subsequent jobs, until the data
+        are modified or :meth:`release_shared` is called.
+        """
+        arrays = (self.y, self.x, self.x_pads)
+        if self._shared is not None:
+            cached_arrays, shared = self._shared
+            if all(a is b for a, b in zip(arrays, cached_arrays)):
+                return shared
+            self.release_shared()
+        shared = tuple([pool.share(array, keep=True) for array in arrays])
+        if all(isinstance(array, SharedArray) for array in shared):
+            self._shared = (arrays, shared)
+            self._shared_finalizer = weakref.finalize(self, _unlink, shared)
+        return shared
+
+    def release_shared(self):
+        "Release the copies of the data in shared memory"
+        if self._shared_finalizer is not None:
+            self._shared_finalizer()
+            self._shared_finalizer = None
+        self._shared = None
+
     def apply_basis(self, basis: float, basis_window: str):
         """Apply basis to x
 
@@ -395,47 +469,151 @@ class RevCorrData:
     def x_pads(self):
         return np.zeros(len(self.x))
 
-    def normalize(self, error: str):
-        self._copy_data(y=True)
-        y_mean = self.y.mean(1)
-        x_mean = self.x.mean(1)
-        self.y -= y_mean[:, newaxis]
-        self.x -= x_mean[:, newaxis]
+    def normalize(self, error: str, cache: dict = None):
+        """Normalize ``y`` and ``x``
+
+        Parameters
+        ----------
+        error : 'l1' | 'l2'
+            Error function (determines the scale).
+        cache : dict
+            Normalized data from other :class:`RevCorrData` objects, to avoid
+            normalizing the same ``y`` and ``x`` :class:`NDVar` more than once
+            (used by :func:`boosting_batch`; updated in place).
+        """
+        if error not in ('l1', 'l2'):
+            raise RuntimeError(f"error={error!r}")
+        if cache is None:
+            self._copy_data(y=not self._y_in_file)
+            if self._y_in_file:
+                y_mean, y_scale = self._y_in_file_scale(error)
+            else:
+                y_mean, y_scale = self._normalize_y(self.y, error)
+            x_mean, x_scale = _normalize_x(self.x, error)
+        else:
+            self.release_shared()
+            key = ('y', id(self._y_ndvar), error)
+            if key not in cache:
+                if self._y_in_file:
+                    cache[key] = (self._y_ndvar, self.y, *self._y_in_file_scale(error))
+                else:
+                    y = self.y.copy()
+                    cache[key] = (self._y_ndvar, y, *self._normalize_y(y, error))
+            _, self.y, y_mean, y_scale = cache[key]
+            self._y_is_copy = False  # shared with other objects
+            keys = []
+            for x_ndvar, (_, _, index) in zip(self._x_ndvars, self._x_meta):
+                key = ('x', id(x_ndvar), error, self.basis, self.basis_window)
+                if key not in cache:
+                    x = np.array(self.x[index], ndmin=2)
+                    cache[key] = (x_ndvar, x, *_normalize_x(x, error))
+                keys.append(key)
+            if len(keys) == 1:
+                key = keys[0]
+            else:
+                key = tuple(keys)
+                if key not in cache:
+                    components = [cache[key_][1:] for key_ in keys]
+                    cache[key] = (None, *[np.concatenate(arrays) for arrays in zip(*components)])
+            _, self.x, x_mean, x_scale = cache[key]
+            self._x_is_copy = False
+
+        self.scale_data = error
+        self.y_mean = y_mean
+        self.y_scale = y_scale
+        self.x_mean = x_mean
+        self.x_scale = x_scale
+        # zero-padding for convolution
+        self.x_pads = -x_mean / x_scale
+        if self._y_in_file:
+            n_vector = self.vector_shape[1] if self.vector_shape else 1
+            self.y_norm = (y_mean, np.repeat(y_scale, n_vector))
+
+    def _y_blocks(self):
+        "Slices of rows of ``y`` to read into memory together (whole vectors)"
+        n_y, n_times = self.y.shape
+        n_vector = self.vector_shape[1] if self.vector_shape else 1
+        n = max(1, Y_BLOCK_SIZE // (n_times * n_vector)) * n_vector
+        return [slice(i, min(i + n, n_y)) for i in range(0, n_y, n)]
+
+    def _y_in_file_scale(self, error: str):
+        "``(y_mean, y_scale)`` for ``y`` in a file, reading blocks of rows"
+        n_vector = self.vector_shape[1] if self.vector_shape else 1
+        y_mean = np.empty(len(self.y))
+        y_scale = np.empty(len(self.y) // n_vector)
+        for index in self._y_blocks():
+            y = np.array(self.y[index], np.float64)
+            index_scale = slice(index.start // n_vector, index.stop // n_vector)
+            y_mean[index], y_scale[index_scale] = self._normalize_y(y, error)
+        return y_mean, y_scale
+
+    def y_rows(self, index: Union[int, slice]) -> np.ndarray:
+        "Rows ``index`` of ``y``, normalized if :attr:`y_norm` is set"
+        return y_rows(self.y, index, self.y_norm)
+
+    def _normalize_y(self, y: np.ndarray, error: str):
+        "Normalize ``y`` in place, return ``(y_mean, y_scale)``"
+        y_mean = y.mean(1)
+        y -= y_mean[:, newaxis]
         # for vector data, scale by vector norm
         if self.vector_shape:
-            y_data_vector_shape = self.y.reshape(self.vector_shape)
+            y_data_vector_shape = y.reshape((-1, *self.vector_shape[1:]))
             y_data_for_scale = norm(y_data_vector_shape, axis=1)
         else:
             y_data_vector_shape = None
-            y_data_for_scale = self.y
+            y_data_for_scale = y
 
         if error == 'l1':
             y_scale = np.abs(y_data_for_scale).mean(-1)
-            x_scale = np.abs(self.x).mean(-1)
-        elif error == 'l2':
-            y_scale = (y_data_for_scale ** 2).mean(-1) ** 0.5
-            x_scale = (self.x ** 2).mean(-1) ** 0.5
         else:
-            raise RuntimeError(f"error={error!r}")
+            y_scale = (y_data_for_scale ** 2).mean(-1) ** 0.5
 
         if self.vector_shape:
             y_data_vector_shape /= y_scale[:, newaxis, newaxis]
         else:
-            self.y /= y_scale[:, newaxis]
-        self.x /= x_scale[:, newaxis]
+            y /= y_scale[:, newaxis]
+        return y_mean, y_scale
 
-        self.scale_data = error
-        self.y_mean = y_mean
-        self.y_scale = y_scale
-        self.x_mean = x_mean
-        self.x_scale = x_scale
-        # zero-padding for convolution
-        self.x_pads = -x_mean / x_scale
+    def sparse_x(
+            self,
+            sparse: bool = None,
+            max_density: float = 0.1,
+    ):
+        """Event lists for predictors that are mostly equal to their padding
+
+        Parameters
+        ----------
+        sparse
+            Store all predictors as events (``True``), none (``False``), or
+            only those in which at most ``max_density`` of the samples differ
+            from the padding value (``None``, default).
+        max_density
+            Threshold for detecting sparse predictors.
+
+        Returns
+        -------
+        x_sparse : SparseX | None
+            Event lists (``None`` if no predictor is sparse).
+        """
+        if sparse is False:
+            return None
+        is_event = self.x != self.x_pads[:, newaxis]
+        if sparse is None:
+            is_sparse = is_event.sum(1) <= max_density * is_event.shape[1]
+            if not np.any(is_sparse):
+                return None
+        else:
+            is_sparse = np.ones(len(self.x), bool)
+        is_event[~is_sparse] = False
+        event_stim, event_index = np.nonzero(is_event)
+        event_ptr = np.zeros(len(self.x) + 1, np.int64)
+        event_ptr[1:] = np.cumsum(is_event.sum(1))
+        return SparseX(is_sparse.astype(np.int8), event_ptr, event_index.astype(np.int64), self.x[event_stim, event_index])
 
     def _check_data(self):
         if self.x_scale is None:
             x_check = self.x.var(1)
-            y_check = self.y.var(1)
+            y_check = np.concatenate([self.y[index].var(1) for index in self._y_blocks()])
         else:
             x_check = self.x_scale
             y_check = self.y_scale
@@ -460,13 +638,69 @@ class RevCorrData:
         if not res:
             return
         from ._boosting import convolve
+        self._copy_data(y=True)
+        n_x = self.x.shape[0]
+        h_flat, h_index, i_start = self.kernel_data(res, 'prefit')
+        # assert scaling equivalent
+        # assert np.all(res.x_mean == self.x_mean[h_index])
+        # assert np.all(res.x_scale == self.x_scale[h_index])
+        # subset to relevant data
+        x = self.x[h_index]
+        x_pads = self.x_pads[h_index]
+        # subtract prefit predictions
+        for y, h in zip(self.y, h_flat):
+            y -= convolve(h, x, x_pads, i_start, self.segments)
+        # remove prefit predictors
+        keep = np.setdiff1d(np.arange(n_x), h_index)
+        self.x = self.x[keep]
+        self.x_mean = self.x_mean[keep]
+        self.x_scale = self.x_scale[keep]
+        self.x_pads = self.x_pads[keep]
+        self._x_is_copy = True
+        # update x meta-information
+        target_index = np.empty(n_x, int)
+        target_index.fill(-1)
+        target_index[keep] = np.arange(len(keep))
+        new_meta = []
+        new_ndvars = []
+        self.x_name = []
+        for x_ndvar, (name, xdim, index) in zip(self._x_ndvars, self._x_meta):
+            if isinstance(index, int):
+                new_index = target_index[index]
+                if new_index < 0:
+                    continue
+            else:
+                new_start = target_index[index.start]
+                if new_start < 0:
+                    continue
+                new_stop = target_index[index.stop - 1] + 1
+                new_index = slice(new_start, new_stop)
+            new_meta.append((name, xdim, new_index))
+            new_ndvars.append(x_ndvar)
+            self.x_name.append(name)
+        self._x_meta = new_meta
+        self._x_ndvars = new_ndvars
+        self._multiple_x = len(self._x_meta) > 1
+        self._prefit_repr = repr(res)
+
+    def kernel_data(self, res, desc: str):
+        """Kernels from ``res`` (:class:`BoostingResult`) as array
+
+        Returns
+        -------
+        h : array (n_y, n_h, n_times)
+            Kernels for the predictors in ``res``.
+        h_index : list of int
+            Index of the predictor (row in :attr:`x`) for each kernel.
+        i_start : int
+            Time lag of the first kernel sample.
+        """
         hs = (res.h_source,) if isinstance(res.h_source, NDVar) else res.h_source
         n_y = self.y.shape[0]
-        n_x = self.x.shape[0]
         # check that names are unique
         x_names = [name for name, *_ in self._x_meta]
         if len(set(x_names)) != len(x_names):
-            raise ValueError(f"prefit={res}: prefit requires that all predictors have unique names; x has names {x_names}")
+            raise ValueError(f"{desc}={res}: {desc} requires that all predictors have unique names; x has names {x_names}")
         # check that prefit matches y dims
         h0 = hs[0]
         index = {}
@@ -475,7 +709,7 @@ class RevCorrData:
             if hdim == ydim:
                 continue
             elif not hdim._is_superset_of(ydim):
-                raise ValueError(f"prefit: y dimension {ydim.name} has elements that are not contained in the prefit")
+                raise ValueError(f"{desc}: y dimension {ydim.name} has elements that are not contained in the {desc}")
             index[ydim.name] = hdim.index_into_dim(ydim)
         if index:
             hs = [h.sub(**index) for h in hs]
@@ -484,15 +718,16 @@ class RevCorrData:
         meta = {name: (dim, index) for name, dim, index in self._x_meta}
         for h in hs:
             if h.name not in meta:
-                raise ValueError(f"prefit: {h.name!r} not in x")
+                raise ValueError(f"{desc}: {h.name!r} not in x")
             dim, index = meta[h.name]
             need_dimnames = (*y_dimnames, 'time') if dim is None else (*y_dimnames, dim.name, 'time')
             if h.dimnames != need_dimnames:
-                raise ValueError(f"prefit: {h.name!r} dimension mismatch, has {h.dimnames}, needs {need_dimnames}")
+                raise ValueError(f"{desc}: {h.name!r} dimension mismatch, has {h.dimnames}, needs {need_dimnames}")
             if dim is not None and h.dims[-2] != dim:
-                raise ValueError(f"prefit: {h.name!r} {dim.name} dimension mismatch")
+                raise ValueError(f"{desc}: {h.name!r} {dim.name} dimension mismatch")
         # generate flat h
-        h_n_times = len(h0.get_dim('time'))
+        h_time = h0.get_dim('time')
+        h_n_times = len(h_time)
         h_flat = []
         h_index = []
         for h in hs:
@@ -507,49 +742,8 @@ class RevCorrData:
                 h_flat.append(h_data.reshape((n_y, n_hdim, h_n_times)))
                 h_index.extend(range(index.start, index.stop))
         h_flat = np.concatenate(h_flat, 1)
-        # assert scaling equivalent
-        # assert np.all(res.x_mean == self.x_mean[h_index])
-        # assert np.all(res.x_scale == self.x_scale[h_index])
-        # subset to relevant data
-        x = self.x[h_index]
-        x_pads = self.x_pads[h_index]
-        # subtract prefit predictions
-        if isinstance(res.tstart, list):
-            tstart1 = min(res.tstart)
-        else:
-            tstart1 = res.tstart
-        i_start = int(round(tstart1 / self.time.tstep))
-        for y, h in zip(self.y, h_flat):
-            y -= convolve(h, x, x_pads, i_start, self.segments)
-        # remove prefit predictors
-        keep = np.setdiff1d(np.arange(n_x), h_index)
-        self.x = self.x[keep]
-        self.x_mean = self.x_mean[keep]
-        self.x_scale = self.x_scale[keep]
-        self.x_pads = self.x_pads[keep]
-        self._x_is_copy = True
-        # update x meta-information
-        target_index = np.empty(n_x, int)
-        target_index.fill(-1)
-        target_index[keep] = np.arange(len(keep))
-        new_meta = []
-        self.x_name = []
-        for name, xdim, index in self._x_meta:
-            if isinstance(index, int):
-                new_index = target_index[index]
-                if new_index < 0:
-                    continue
-            else:
-                new_start = target_index[index.start]
-                if new_start < 0:
-                    continue
-                new_stop = target_index[index.stop - 1] + 1
-                new_index = slice(new_start, new_stop)
-            new_meta.append((name, xdim, new_index))
-            self.x_name.append(name)
-        self._x_meta = new_meta
-        self._multiple_x = len(self._x_meta) > 1
-        self._prefit_repr = repr(res)
+        i_start = int(round(h_time.tmin / self.time.tstep))
+        return h_flat, h_index, i_start
 
     def initialize_cross_validation(
             self,
@@ -689,3 +883,32 @@ class RevCorrData:
         else:
             dims = self.full_y_dims
         return NDVar(data, dims, name)
+
+
+def y_rows(
+        y: np.ndarray,
+        index: Union[int, slice],
+        y_norm: tuple = None,
+) -> np.ndarray:
+    "Rows ``index`` of ``y``, normalized with ``y_norm = (offset, scale)``"
+    if y_norm is None:
+        return y[index]
+    offset, scale = y_norm
+    return (y[index] - offset[index, newaxis]) / scale[index, newaxis]
+
+
+def _normalize_x(x: np.ndarray, error: str):
+    "Normalize ``x`` in place, return ``(x_mean, x_scale)``"
+    x_mean = x.mean(1)
+    x -= x_mean[:, newaxis]
+    if error == 'l1':
+        x_scale = np.abs(x).mean(-1)
+    else:
+        x_scale = (x ** 2).mean(-1) ** 0.5
+    x /= x_scale[:, newaxis]
+    return x_mean, x_scale
+
+
+def _unlink(shared_arrays):
+    for shared_array in shared_arrays:
+        shared_array.unlink()
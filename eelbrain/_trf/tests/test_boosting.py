@@ -14,12 +14,14 @@ import scipy.io
 import scipy.stats
 from eelbrain import (
     datasets, configure,
-    boosting, convolve, correlation_coefficient, epoch_impulse_predictor,
+    boosting, boosting_batch, convolve, correlation_coefficient, epoch_impulse_predictor,
     NDVar, UTS, Scalar,
 )
 
 from eelbrain.testing import assert_dataobj_equal
-from eelbrain._trf._boosting import Boosting, RevCorrData, Split, boost, convolve as boosting_convolve
+from eelbrain._trf import shared
+from eelbrain._trf._boosting import Boosting, RevCorrData, Split, boost, boost_multi, convolve as boosting_convolve, predict
+from eelbrain._trf._fit_metrics import get_evaluator
 
 
 def assert_res_equal(res1, res):
@@ -144,6 +146,86 @@ def test_boosting_epochs():
     assert res.residual.ndim == 0
 
 
+# with unscaled impulses, l1 steps on different lags can lead to exactly the same error
+@pytest.mark.parametrize('error, scale_data', [('l1', True), ('l2', True), ('l2', False)])
+def test_boosting_sparse(error, scale_data):
+    "Test boosting with predictors stored as events"
+    ds = datasets.get_uts(True)
+    p1 = epoch_impulse_predictor('uts', 'A=="a1"', name='a1', ds=ds)
+    p0 = epoch_impulse_predictor('uts', 'A=="a0"', name='a0', ds=ds)
+    ps = [p0, p1, p1.smooth('time', .05, 'hamming')]
+    data = RevCorrData('uts', ps, ds)
+    data.normalize(error)
+    x_sparse = data.sparse_x()
+    assert_array_equal(x_sparse.sparse, [1, 1, 0])
+    index, value = x_sparse.events(1)
+    assert_array_equal(index, np.flatnonzero(p1.x.ravel()))
+    assert_array_equal(value, data.x[1, index])
+    assert data.sparse_x(False) is None
+    assert data.sparse_x(True).sparse.all()
+
+    for tstart in (-0.1, 0, 0.1):
+        res = boosting('uts', ps, tstart, 0.5, scale_data, error=error, model='A', ds=ds, partitions=3, sparse=False)
+        for sparse in (None, True):
+            res_sparse = boosting('uts', ps, tstart, 0.5, scale_data, error=error, model='A', ds=ds, partitions=3, sparse=sparse)
+            for h_sparse, h in zip(res_sparse.h, res.h):
+                assert_allclose(h_sparse.x, h.x, atol=1e-12)
+            assert res_sparse.r == approx(res.r, abs=1e-12)
+    # prediction
+    h = np.random.RandomState(0).normal(0, 1, (3, 10))
+    for i_start in (-12, -3, 0, 4):
+        y = boosting_convolve(h, data.x, data.x_pads, i_start, data.segments)
+        y_sparse = boosting_convolve(h, data.x, data.x_pads, i_start, data.segments, x_sparse=x_sparse)
+        assert_allclose(y_sparse, y, atol=1e-12)
+
+
+def test_convolve():
+    "Test convolve() against a convolution of explicitly padded segments"
+    rng = np.random.RandomState(0)
+    x = rng.normal(0, 1, (2, 100))
+    x_pads = np.array([0.5, -2.])
+    segments = np.array([[0, 30], [30, 100]], np.int64)
+    for h_n_times, i_start in ((5, 0), (5, 3), (5, -2), (5, -7), (1, -1), (30, -12), (40, -5)):
+        h = rng.normal(0, 1, (2, h_n_times))
+        lags = range(i_start, i_start + h_n_times)
+        y = np.zeros(100)
+        for start, stop in segments:
+            for i_stim in range(2):
+                for i_t in range(start, stop):
+                    for i_h, lag in enumerate(lags):
+                        i_x = i_t - lag
+                        x_value = x[i_stim, i_x] if start <= i_x < stop else x_pads[i_stim]
+                        y[i_t] += h[i_stim, i_h] * x_value
+        assert_allclose(boosting_convolve(h, x, x_pads, i_start, segments), y, atol=1e-12)
+
+
+def test_predict():
+    "Test predicting several responses and evaluating them in blocks"
+    ds = datasets._get_continuous(ynd=True)
+    data = RevCorrData('ynd', ['x1', 'x2'], ds)
+    data.normalize('l2')
+    rng = np.random.RandomState(0)
+    n_y, n_times = data.y.shape
+    segments = np.array([[0, 40], [40, n_times]], np.int64)
+    for h_n_times, i_start in product((5, 30), (-12, -3, 0, 4)):
+        h = rng.normal(0, 1, (n_y, len(data.x), h_n_times))
+        y_pred = predict(h, data.x, data.x_pads, i_start, segments, np.empty(data.y.shape))
+        for h_i, y_pred_i in zip(h, y_pred):
+            assert_allclose(y_pred_i, boosting_convolve(h_i, data.x, data.x_pads, i_start, segments), atol=1e-12)
+
+    # evaluators
+    y_pred += data.y
+    eval_segments = np.array([[10, n_times]], np.int64)
+    for key in ('l1', 'l2', 'r', 'r_rank'):
+        e_ref = get_evaluator(key, data)
+        for i, (y_i, y_pred_i) in enumerate(zip(data.y, y_pred)):
+            e_ref.add_y(i, y_i, y_pred_i, eval_segments)
+        e = get_evaluator(key, data)
+        e.add_ys(slice(0, 1), data.y[:1], y_pred[:1], eval_segments)
+        e.add_ys(slice(1, n_y), data.y[1:], y_pred[1:], eval_segments)
+        assert_allclose(e.x, e_ref.x, rtol=1e-12)
+
+
 def test_boosting_oo():
     ds = datasets._get_continuous(ynd=True)
     data = RevCorrData('y', 'x2', ds)
@@ -158,6 +240,58 @@ def test_boosting_oo():
     assert res_oo.r == res_func.r
 
 
+@pytest.mark.parametrize('executor', ['multiprocessing', 'threading', 'socket'])
+def test_boosting_workers(executor, monkeypatch):
+    "Test collecting boosting results from workers"
+    import socket
+    from eelbrain._config import mpc
+    from eelbrain._utils import parallel
+
+    ds = datasets._get_continuous(ynd=True)
+    data = RevCorrData('ynd', 'x2', ds)
+    data.normalize('l2')
+    data.initialize_cross_validation(3, test=1)
+    configure(n_workers=0)
+    model = Boosting(data)
+    model.fit(0, 1, error='l2')
+    res_ref = model.evaluate_fit()
+
+    processes = []
+    if executor == 'socket':
+        monkeypatch.setenv('EELBRAIN_AUTHKEY', 'test-key')
+        with socket.socket() as sock:
+            sock.bind(('localhost', 0))
+            port = sock.getsockname()[1]
+        executor = f'localhost:{port}'
+        processes = [mpc.Process(target=parallel.remote_worker, args=(('localhost', port), b'test-key', 0.1), daemon=True) for _ in range(2)]
+        for process in processes:
+            process.start()
+    configure(n_workers=2, executor=executor)
+    try:
+        for batch_size in (1, 2):
+            model = Boosting(data)
+            model.fit(0, 1, error='l2', batch_size=batch_size)
+            res = model.evaluate_fit()
+            assert_dataobj_equal(res.h, res_ref.h)
+            assert_dataobj_equal(res.r, res_ref.r)
+            shared = data._shared
+            if executor == 'multiprocessing':
+                # data in shared memory is reused for subsequent fits
+                assert shared is not None
+                if batch_size > 1:
+                    assert shared is shared_1
+                shared_1 = shared
+            else:
+                assert shared is None
+    finally:
+        configure(n_workers=True, executor='multiprocessing')
+        for process in processes:
+            process.terminate()
+    # modifying the data releases the shared memory
+    data._copy_data()
+    assert data._shared is None
+
+
 def test_result():
     "Test boosting results"
     ds = datasets._get_continuous()
@@ -250,6 +384,266 @@ def test_boosting_func():
     assert_allclose(test_sse_history, mat['Str_testE'][0] / 3)
 
 
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_boosting_threads(n_workers):
+    "Test evaluating candidate steps in multiple threads"
+    rng = np.random.RandomState(0)
+    x = rng.normal(0, 1, (5, 1000))
+    y = rng.normal(0, 1, 1000)
+    x_pads = np.zeros(len(x))
+    split = Split(np.array([[100, 1000]], np.int64), np.array([[0, 100]], np.int64))
+    tstart = np.array([0, -2, 0, 1, 0], np.int64)
+    tstop = np.array([10, 5, 3, 9, 10], np.int64)
+    h, history = boost(y, x, x_pads, split, tstart, tstop, 0.005, 0.005, 'l2', return_history=True)
+    for n_threads in (2, 3, 16, 100):
+        h_t, history_t = boost(y, x, x_pads, split, tstart, tstop, 0.005, 0.005, 'l2', return_history=True, n_threads=n_threads)
+        assert_array_equal(h_t, h)
+        assert history_t == history
+
+    # through boosting()
+    configure(n_workers=n_workers)
+    ds = datasets._get_continuous(ynd=True)
+    res = boosting('y', ['x1', 'x2'], 0, 1, ds=ds, partitions=3)
+    configure(boosting_threads=3)
+    try:
+        res_t = boosting('y', ['x1', 'x2'], 0, 1, ds=ds, partitions=3)
+    finally:
+        configure(boosting_threads=1)
+    for h_t, h in zip(res_t.h, res.h):
+        assert_array_equal(h_t.x, h.x)
+    assert res_t.r == res.r
+
+
+def test_boosting_threads_executor():
+    "Test candidate threads in boosting jobs that run in worker threads"
+    ds = datasets._get_continuous(ynd=True)
+    jobs = [{'y': 'ynd', 'x': ['x1', 'x2'], 'tstart': 0, 'tstop': tstop, 'partitions': partitions} for tstop in (0.5, 0.8, 1) for partitions in range(3, 9)]
+    configure(n_workers=0)
+    results = dict(boosting_batch(jobs, ds=ds))
+    configure(n_workers=4, executor='threading', boosting_threads=3)
+    try:
+        results_t = dict(boosting_batch(jobs, ds=ds))
+    finally:
+        configure(n_workers=True, executor='multiprocessing', boosting_threads=1)
+    assert len(results_t) == len(jobs)
+    for i, res in results.items():
+        for h_t, h in zip(results_t[i].h, res.h):
+            assert_array_equal(h_t.x, h.x)
+        assert_array_equal(results_t[i].r.x, res.r.x)
+
+
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_boosting_batch(n_workers):
+    "Test estimating several models together"
+    configure(n_workers=n_workers)
+    ds = datasets._get_continuous(ynd=True)
+    jobs = [
+        (ds['y'], ds['x1']),
+        (ds['y'], [ds['x1'], ds['x2']]),
+        (ds['ynd'], [ds['x1'], ds['x2']]),
+        {'y': 'ynd', 'x': 'x2', 'tstop': 0.5, 'error': 'l1', 'ds': ds},
+    ]
+    results = dict(boosting_batch(jobs, tstart=0, tstop=1, partitions=3, test=1))
+    assert sorted(results) == [0, 1, 2, 3]
+    for job, res in zip(jobs, (results[i] for i in range(len(jobs)))):
+        if isinstance(job, dict):
+            res_ref = boosting(**{'tstart': 0, 'partitions': 3, 'test': 1, **job})
+        else:
+            res_ref = boosting(*job, 0, 1, partitions=3, test=1)
+        assert repr(res) == repr(res_ref)
+        if isinstance(res.h, tuple):
+            for h, h_ref in zip(res.h, res_ref.h):
+                assert_dataobj_equal(h, h_ref)
+        else:
+            assert_dataobj_equal(res.h, res_ref.h)
+        assert_array_equal(res.r_rank, res_ref.r_rank)
+    # invalid parameters
+    with pytest.raises(TypeError):
+        list(boosting_batch(jobs, tstart=0, tstop=1, basis_windw='hann'))
+    with pytest.raises(ValueError):
+        list(boosting_batch(jobs, tstart=0, tstop=1, scale_data='inplace'))
+
+
+@pytest.mark.parametrize('error', ['l1', 'l2'])
+@pytest.mark.parametrize('selective_stopping', [0, 1, 2])
+def test_boost_multi(error, selective_stopping):
+    "Test fitting several responses in lockstep"
+    rng = np.random.RandomState(0)
+    x = rng.normal(0, 1, (4, 1000))
+    k = rng.normal(0, 1, (4, 10)) * (rng.uniform(0, 1, (6, 4, 10)) > 0.7)
+    y = np.array([boosting_convolve(k_i, x, np.zeros(4), 0) for k_i in k])
+    y += rng.normal(0, 2, y.shape)
+    y[3] = rng.normal(0, 1, 1000)  # response that stops early
+    x_pads = np.zeros(len(x))
+    split = Split(np.array([[0, 800]], np.int64), np.array([[800, 1000]], np.int64))
+    tstart = np.array([0, -2, 0, 1], np.int64)
+    tstop = np.array([10, 5, 3, 8], np.int64)
+    args = (x, x_pads, split, tstart, tstop, 0.01, 0.0025, error, selective_stopping)
+    hs = [boost(y_i, *args) for y_i in y]
+    for n_threads in (1, 3):
+        hs_multi = boost_multi(y, *args, n_threads=n_threads)
+        assert len(hs_multi) == len(hs)
+        for h_multi, h in zip(hs_multi, hs):
+            if h is None:
+                assert h_multi is None
+            else:
+                assert_array_equal(h_multi, h)
+
+    # through boosting()
+    ds = datasets._get_continuous(ynd=True)
+    res = boosting('ynd', ['x1', 'x2'], 0, 1, ds=ds, partitions=3, error=error, selective_stopping=selective_stopping)
+    for batch_size in (2, 10):
+        res_batch = boosting('ynd', ['x1', 'x2'], 0, 1, ds=ds, partitions=3, error=error, selective_stopping=selective_stopping, batch_size=batch_size)
+        for h_batch, h in zip(res_batch.h, res.h):
+            assert_array_equal(h_batch.x, h.x)
+        assert_array_equal(res_batch.r.x, res.r.x)
+
+
+@pytest.mark.parametrize('selective_stopping', [0, 1])
+def test_boost_gram(selective_stopping):
+    "Test l2 boosting with the lagged predictor inner products"
+    rng = np.random.RandomState(0)
+    x = rng.normal(0, 1, (4, 1000))
+    x_pads = rng.normal(0, 0.5, len(x))
+    k = rng.normal(0, 1, (4, 10)) * (rng.uniform(0, 1, (3, 4, 10)) > 0.7)
+    y = np.array([boosting_convolve(k_i, x, x_pads, 0) for k_i in k])
+    y += rng.normal(0, 2, y.shape)
+    split = Split(np.array([[0, 400], [600, 1000]], np.int64), np.array([[400, 600]], np.int64))
+    tstart = np.array([0, -2, 0, 1], np.int64)
+    tstop = np.array([10, 5, 3, 8], np.int64)
+    args = (x, x_pads, split, tstart, tstop, 0.01, 0.0025, 'l2', selective_stopping)
+    hs = [boost(y_i, *args) for y_i in y]
+    for y_i, h in zip(y, hs):
+        assert_allclose(boost(y_i, *args, gram=True), h, atol=1e-12)
+    for h_multi, h in zip(boost_multi(y, *args, gram=True), hs):
+        assert_allclose(h_multi, h, atol=1e-12)
+
+    # through boosting()
+    ds = datasets._get_continuous(ynd=True)
+    res = boosting('ynd', ['x1', 'x2'], 0, 1, ds=ds, partitions=3, selective_stopping=selective_stopping)
+    res_gram = boosting('ynd', ['x1', 'x2'], 0, 1, ds=ds, partitions=3, selective_stopping=selective_stopping, gram=True)
+    for h_gram, h in zip(res_gram.h, res.h):
+        assert_allclose(h_gram.x, h.x, atol=1e-12)
+    assert_allclose(res_gram.r.x, res.r.x)
+    with pytest.raises(ValueError):
+        boosting('ynd', ['x1', 'x2'], 0, 1, ds=ds, error='l1', gram=True)
+
+
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_boosting_warm_start(n_workers):
+    "Test starting boosting from initial kernels"
+    rng = np.random.RandomState(0)
+    x = rng.normal(0, 1, (3, 1000))
+    y = np.convolve(x[0], [0, 0.5, 1, 0.5])[:1000] + rng.normal(0, 1, 1000)
+    x_pads = np.zeros(len(x))
+    split = Split(np.array([[100, 1000]], np.int64), np.array([[0, 100]], np.int64))
+    tstart = np.zeros(3, np.int64)
+    tstop = np.full(3, 5, np.int64)
+    h, history = boost(y, x, x_pads, split, tstart, tstop, 0.005, 0.005, 'l2', return_history=True)
+    h_warm, history_warm = boost(y, x, x_pads, split, tstart, tstop, 0.005, 0.005, 'l2', return_history=True, h_init=h)
+    assert len(history_warm) < len(history) / 10
+    assert_allclose(h_warm, h, atol=0.05)
+    assert history_warm[0] == approx(min(history))
+    # the initial kernel is returned if it can not be improved
+    h_warm, history_warm = boost(y, x, x_pads, split, tstart, tstop, 0.005, 0.005, 'l2', h_init=h, selective_stopping=1, return_history=True)
+    assert h_warm is not None
+
+    # through boosting()
+    configure(n_workers=n_workers)
+    ds = datasets._get_continuous(ynd=True)
+    res = boosting('ynd', ['x1', 'x2'], 0, 1, ds=ds, partitions=4, test=1)
+    assert res.n_warm_start_steps is None
+    res_warm = boosting('ynd', ['x1', 'x2'], 0, 1, ds=ds, partitions=4, test=1, warm_start=True)
+    assert res_warm.warm_start is True
+    assert res_warm.n_warm_start_steps > 0
+    assert repr(res_warm) == repr(res)
+    assert_allclose(res_warm.r.x, res.r.x, atol=0.1)
+    # from a previous result
+    res_prev = boosting('ynd', 'x1', 0, 0.5, ds=ds, partitions=4)
+    res_warm = boosting('ynd', ['x1', 'x2'], 0, 1, ds=ds, partitions=4, test=1, warm_start=res_prev)
+    assert res_warm.warm_start == repr(res_prev)
+    assert res_warm.n_warm_start_steps > 0
+    assert_allclose(res_warm.r.x, res.r.x, atol=0.1)
+    with pytest.raises(ValueError):
+        boosting('ynd', 'x2', 0, 1, ds=ds, partitions=4, warm_start=res_prev)
+
+
+@pytest.mark.parametrize('n_workers', [0, True])
+def test_boosting_memmap(n_workers, tmp_path, monkeypatch):
+    "Test boosting with y in a memory-mapped file"
+    monkeypatch.setattr(shared, 'Y_BLOCK_SIZE', 100)
+    configure(n_workers=n_workers)
+    ds = datasets._get_continuous(ynd=True)
+    ynd = ds['ynd'] + np.random.RandomState(0).normal(0, 1, ds['ynd'].shape)
+    y_data = np.memmap(tmp_path / 'y.dat', np.float64, 'w+', shape=ynd.shape)
+    y_data[:] = ynd.x
+    y_data.flush()
+    y_file = NDVar(np.memmap(tmp_path / 'y.dat', np.float64, 'r', shape=ynd.shape), ynd.dims, 'ynd')
+    ynd.name = 'ynd'
+    # y is not loaded
+    data = RevCorrData(y_file, [ds['x1'], ds['x2']])
+    data.normalize('l2')
+    assert isinstance(data.y, np.memmap)
+    assert_allclose(data.y_rows(slice(None)).mean(1), 0, atol=1e-12)
+    assert_allclose(data.y_rows(1).std(), 1)
+    # same result as in memory
+    for kwargs in [{}, {'test': 1, 'error': 'l1'}, {'scale_data': False}]:
+        res = boosting(ynd, ['x1', 'x2'], 0, 1, ds=ds, partitions=3, **kwargs)
+        res_file = boosting(y_file, ['x1', 'x2'], 0, 1, ds=ds, partitions=3, **kwargs)
+        assert_dataobj_equal(res_file.h[1], res.h[1])
+        assert_dataobj_equal(res_file.r, res.r)
+    # y can't be modified
+    with pytest.raises(NotImplementedError):
+        data.prefit(res)
+
+
+def test_boosting_cache(tmp_path):
+    "Test caching boosting results on disk"
+    ds = datasets._get_continuous(ynd=True)
+    configure(boosting_cache=tmp_path)
+    try:
+        res = boosting('y', ['x1', 'x2'], 0, 1, ds=ds, partitions=3)
+        files = list(tmp_path.glob('*.pickle'))
+        assert len(files) == 1
+        # identical data and parameters
+        res_cached = boosting('y', ['x1', 'x2'], 0, 1, ds=ds, partitions=3)
+        assert res_cached.t_run == res.t_run
+        for h_cached, h in zip(res_cached.h, res.h):
+            assert_dataobj_equal(h_cached, h)
+        ds_copy = ds.copy()
+        ds_copy['y'] = ds['y'].copy()
+        res_cached = boosting('y', ['x1', 'x2'], 0, 1, ds=ds_copy, partitions=3, batch_size=100)
+        assert res_cached.t_run == res.t_run
+        # different data or parameters
+        ds_copy['y'].x[0] += 1
+        res_2 = boosting('y', ['x1', 'x2'], 0, 1, ds=ds_copy, partitions=3)
+        assert res_2.t_run != res.t_run
+        res_3 = boosting('y', ['x1', 'x2'], 0, 1, ds=ds, partitions=3, error='l1')
+        assert res_3.error == 'l1'
+        assert len(list(tmp_path.glob('*.pickle'))) == 3
+        # debug results are not cached
+        boosting('y', ['x1', 'x2'], 0, 1, ds=ds, partitions=3, delta=0.01, debug=True)
+        assert len(list(tmp_path.glob('*.pickle'))) == 3
+        # boosting_batch()
+        results = dict(boosting_batch([
+            {'y': 'y', 'x': ['x1', 'x2'], 'tstart': 0, 'tstop': 1, 'partitions': 3},
+            {'y': 'y', 'x': ['x1', 'x2'], 'tstart': 0, 'tstop': 1, 'partitions': 4},
+        ], ds=ds))
+        assert results[0].t_run == res.t_run
+        assert results[1].partitions == 4
+        assert len(list(tmp_path.glob('*.pickle'))) == 4
+        # least recently used results are removed
+        for t, path in enumerate(sorted(tmp_path.glob('*.pickle')), 1000):
+            os.utime(path, (t, t))
+        os.utime(files[0], (2000, 2000))
+        configure(boosting_cache_size=int(files[0].stat().st_size * 2.5))
+        boosting('y', ['x1', 'x2'], 0, 1, ds=ds, partitions=5)
+        assert len(list(tmp_path.glob('*.pickle'))) == 2
+        assert files[0].exists()
+    finally:
+        configure(boosting_cache=False, boosting_cache_size=2 ** 30)
+
+
 @pytest.mark.parametrize('n_workers', [0, True])
 def test_trf_len(n_workers):
     configure(n_workers=n_workers)
@@ -0,0 +1,692 @@
+# Author: Christian Brodbeck <christianbrodbeck@nyu.edu>
+"""Pool of worker processes for permutation tests and boosting
+
+Workers run a sequence of jobs. For each job, a worker function is called in
+``n_workers`` workers as ``func(task_queue, result_queue, kill_beacon, *args)``;
+it processes tasks from ``task_queue`` until it receives ``None``. Large arrays
+are sent to the workers as :class:`SharedArray`, which only transfers the name
+of a shared memory block (or, for arrays backed by a :class:`numpy.memmap`, the
+name of the file).
+
+The backend that runs the workers is set with ``configure(executor=...)``:
+
+- ``'multiprocessing'``: worker processes on the local machine
+  (:class:`ProcessPool`).
+- ``'threading'``: worker threads in the main process (:class:`ThreadPool`).
+- :class:`concurrent.futures.Executor`: workers run as tasks of the executor
+  (:class:`ExecutorPool`).
+- ``'HOST:PORT'``: the main process serves the queues at this address, and
+  worker processes on other machines connect to it (:class:`SocketPool`; start
+  workers with ``python -m eelbrain._utils.parallel HOST:PORT``). Remote
+  workers keep reconnecting to the address, so that they serve all subsequent
+  pools until they are terminated.
+
+With ``configure(persistent_workers=True)``, the same workers are reused for
+subsequent jobs until they are shut down with
+``configure(persistent_workers=False)``.
+"""
+from abc import ABC, abstractmethod
+import atexit
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from copy import deepcopy
+from functools import partial
+import logging
+from multiprocessing.managers import BaseManager, EventProxy
+import mmap
+import os
+import queue
+import re
+import sys
+from threading import Event, Thread
+from time import sleep
+import traceback
+
+import numpy as np
+
+from .._config import CONFIG, mpc
+from .system import restore_main_spec
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python 3.7
+    resource_tracker = shared_memory = None
+
+
+POOL = None
+
+
+class SharedArray:
+    """Numpy array that can be sent to running worker processes
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Data (copied into shared memory, unless it is a view of a file-backed
+        :class:`numpy.memmap`).
+
+    Notes
+    -----
+    Pickling only transfers the name of the shared memory block (on Python 3.7,
+    which lacks :mod:`multiprocessing.shared_memory`, the data is pickled).
+    Arrays that are backed by a file through :class:`numpy.memmap` are not
+    copied; instead, worker processes map the same file (read-only).
+    The process that created the array should call :meth:`unlink` when the
+    array is no longer needed, other processes should call :meth:`close`.
+    """
+    def __init__(self, array):
+        self._file = memmap_location(array)
+        array = np.asarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype
+        if self._file is not None:
+            self.name = None
+            self._shm = None
+            self.array = array
+        elif shared_memory is None:
+            self.name = None
+            self._shm = None
+            self.array = array
+        else:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            self.name = self._shm.name
+            self.array = np.ndarray(self.shape, self.dtype, self._shm.buf)
+            self.array[...] = array
+
+    def __getstate__(self):
+        if self._file is not None:
+            return {'name': None, 'file': self._file, 'shape': self.shape, 'dtype': self.dtype}
+        elif self.name is None:
+            return {'name': None, 'array': self.array}
+        return {'name': self.name, 'shape': self.shape, 'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.name = state['name']
+        self._file = state.get('file')
+        if self._file is not None:
+            self._shm = None
+            self.shape = state['shape']
+            self.dtype = state['dtype']
+            filename, offset, strides = self._file
+            buffer = np.memmap(filename, np.uint8, 'r')
+            self.array = np.ndarray(self.shape, self.dtype, buffer, offset, strides)
+        elif self.name is None:
+            self._shm = None
+            self.array = state['array']
+            self.shape = self.array.shape
+            self.dtype = self.array.dtype
+        else:
+            self.shape = state['shape']
+            self.dtype = state['dtype']
+            self._shm = shared_memory.SharedMemory(self.name)
+            self.array = np.ndarray(self.shape, self.dtype, self._shm.buf)
+
+    @property
+    def is_shared(self):
+        "Changes to the array are visible in all processes"
+        return self.name is not None or self._file is not None
+
+    def close(self):
+        "Detach from the shared memory (all views of the array need to be deleted)"
+        self.array = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                pass  # views still exist; closed when garbage collected
+
+    def unlink(self):
+        "Release the shared memory"
+        self.close()
+        if self._shm is not None:
+            self._shm.unlink()
+            self._shm = None
+
+
+class LocalArray:
+    """Numpy array for workers that do not use shared memory
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Data (not copied).
+
+    Notes
+    -----
+    Worker threads use the array itself. Worker processes on other machines
+    receive a pickled copy (with ``is_shared=False``).
+    """
+    def __init__(self, array):
+        self.array = np.asarray(array)
+        self.is_shared = True
+
+    def __getstate__(self):
+        return {'array': self.array}
+
+    def __setstate__(self, state):
+        self.array = state['array']
+        self.is_shared = False
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def close(self):
+        pass
+
+    def unlink(self):
+        pass
+
+
+def memmap_location(array):
+    """Locate the data of a view of a file-backed :class:`numpy.memmap`
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Array.
+
+    Returns
+    -------
+    location : None | tuple
+        ``(filename, offset, strides)`` to reconstruct ``array`` from the file
+        (``None`` if ``array`` is not backed by a file, or if the file could
+        differ from the data, as for ``mode='c'``).
+    """
+    if not isinstance(array, np.memmap) or array._mmap is None or array.filename is None or array.mode == 'c':
+        return None
+    # the mmap starts at the allocation boundary preceding the memmap offset
+    start = array.offset - array.offset % mmap.ALLOCATIONGRANULARITY
+    mmap_address = np.frombuffer(array._mmap, np.uint8).__array_interface__['data'][0]
+    offset = start + array.__array_interface__['data'][0] - mmap_address
+    return array.filename, offset, array.strides
+
+
+class WorkerError(Exception):
+    "Exception in a worker process"
+
+
+class WorkerPool(ABC):
+    """Workers that run a sequence of jobs
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of workers.
+    job_queue : queue
+        Queue for jobs; every job is put into the queue ``n_workers`` times.
+    task_queue : queue
+        Queue for the tasks of the current job.
+    result_queue : queue
+        Queue for the results of the current job.
+    kill_beacon : Event
+        Set to stop the workers.
+
+    Notes
+    -----
+    Subclasses start the workers and implement :attr:`is_alive`,
+    :meth:`_join` and :meth:`_kill`. Workers take jobs from the common
+    ``job_queue``; if a worker finishes its copy of a job early, it might take
+    another copy, which then only consumes one of the ``None`` tasks.
+    """
+    def __init__(self, n_workers, job_queue, task_queue, result_queue, kill_beacon):
+        self.n_workers = n_workers
+        self.job_queue = job_queue
+        self.task_queue = task_queue
+        self.result_queue = result_queue
+        self.kill_beacon = kill_beacon
+        self._shared = []
+
+    @property
+    @abstractmethod
+    def is_alive(self):
+        "Whether all workers are running"
+
+    def share(self, array, keep=False):
+        """Copy ``array`` to shared memory for the current job
+
+        Parameters
+        ----------
+        array : numpy.ndarray
+            Data.
+        keep : bool
+            Keep the shared memory after the end of the :func:`worker_pool`
+            context, so that it can be used for subsequent jobs (the caller is
+            responsible for calling :meth:`SharedArray.unlink`).
+
+        Returns
+        -------
+        shared_array : SharedArray
+            Shared array, to be sent as argument to the worker function. The
+            shared memory is released at the end of the :func:`worker_pool`
+            context (unless ``keep=True``). Workers can write to the array
+            when :attr:`SharedArray.is_shared` is true (in the worker).
+        """
+        shared_array = SharedArray(array)
+        if not keep:
+            self._shared.append(shared_array)
+        return shared_array
+
+    def release_shared(self):
+        "Release the shared memory of all arrays created with :meth:`share`"
+        while self._shared:
+            self._shared.pop().unlink()
+
+    def run(self, func, args, tasks):
+        """Run a job and iterate over its results
+
+        Parameters
+        ----------
+        func : callable
+            Worker function, called in each worker as
+            ``func(task_queue, result_queue, kill_beacon, *args)``. It should
+            process tasks from ``task_queue`` until it receives ``None``.
+        args : tuple
+            Additional arguments for ``func``.
+        tasks : iterator
+            Tasks for the task queue (put into the queue from a separate
+            thread).
+
+        Yields
+        ------
+        result
+            Results from ``result_queue``, in the order in which they are put.
+        """
+        self._put_jobs(func, args)
+        errors = []
+        thread = Thread(target=self._put_tasks, args=(tasks, errors), daemon=True)
+        thread.start()
+        n_done = 0
+        while n_done < self.n_workers:
+            result = self.result_queue.get()
+            if result is None:
+                n_done += 1
+            elif isinstance(result, WorkerError):
+                raise result
+            else:
+                yield result
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def _put_jobs(self, func, args):
+        for _ in range(self.n_workers):
+            self.job_queue.put((func, args))
+
+    def _put_tasks(self, tasks, errors):
+        try:
+            for task in tasks:
+                self.task_queue.put(task)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            for _ in range(self.n_workers):
+                self.task_queue.put(None)
+
+    def shutdown(self):
+        "Shut down the workers after finishing the current job"
+        for _ in range(self.n_workers):
+            self.job_queue.put(None)
+        self._join()
+        self.release_shared()
+        logging.getLogger(__name__).debug("Workers shut down")
+
+    def terminate(self):
+        "Terminate the workers immediately"
+        self.kill_beacon.set()
+        self._kill()
+        self.release_shared()
+
+    @abstractmethod
+    def _join(self):
+        "Wait for the workers to finish after the ``None`` jobs"
+
+    @abstractmethod
+    def _kill(self):
+        "Stop the workers without waiting for the current job"
+
+
+class ProcessPool(WorkerPool):
+    """Worker processes on the local machine
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes.
+    """
+    def __init__(self, n_workers):
+        logger = logging.getLogger(__name__)
+        logger.debug("Setting up %i worker processes...", n_workers)
+        restore_main_spec()
+        if resource_tracker is not None:
+            # workers should share the resource tracker of the main process,
+            # otherwise their trackers try to clean up the shared memory
+            resource_tracker.ensure_running()
+        WorkerPool.__init__(self, n_workers, mpc.SimpleQueue(), mpc.SimpleQueue(), mpc.SimpleQueue(), mpc.Event())
+        args = (self.job_queue, self.task_queue, self.result_queue, self.kill_beacon, True)
+        self._processes = []
+        for _ in range(n_workers):
+            process = mpc.Process(target=pool_worker, args=args, daemon=True)
+            process.start()
+            self._processes.append(process)
+
+    @property
+    def is_alive(self):
+        return all(process.is_alive() for process in self._processes)
+
+    def _join(self):
+        for process in self._processes:
+            process.join()
+
+    def _kill(self):
+        for process in self._processes:
+            process.terminate()
+
+
+class ThreadPool(WorkerPool):
+    """Worker threads in the main process
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker threads.
+
+    Notes
+    -----
+    Arrays are not copied, and workers write directly into the arrays of the
+    main process; other arguments are copied for each worker. Speed-ups are
+    limited to computations that release the GIL.
+    """
+    def __init__(self, n_workers):
+        WorkerPool.__init__(self, n_workers, queue.SimpleQueue(), queue.SimpleQueue(), queue.SimpleQueue(), Event())
+        args = (self.job_queue, self.task_queue, self.result_queue, self.kill_beacon)
+        self._threads = [Thread(target=pool_worker, args=args, daemon=True) for _ in range(n_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def is_alive(self):
+        return all(thread.is_alive() for thread in self._threads)
+
+    def share(self, array, keep=False):
+        return LocalArray(array)
+
+    def _put_jobs(self, func, args):
+        # every thread needs its own copy of the arguments (except for arrays)
+        for _ in range(self.n_workers):
+            self.job_queue.put((func, deepcopy(args)))
+
+    def _join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _kill(self):
+        # threads can not be killed; unblock them so that they return
+        for _ in self._threads:
+            self.task_queue.put(None)
+            self.job_queue.put(None)
+
+
+class ExecutorPool(WorkerPool):
+    """Workers running as tasks of a :class:`concurrent.futures.Executor`
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of workers (each worker occupies one of the executor's workers
+        until the pool is shut down).
+    executor : concurrent.futures.Executor
+        Executor.
+
+    Notes
+    -----
+    Arrays are sent to the workers of a :class:`~concurrent.futures.ProcessPoolExecutor`
+    or :class:`~concurrent.futures.ThreadPoolExecutor` through shared memory,
+    which requires that the executor's workers run on the same machine (and,
+    for processes, use the resource tracker of the main process, as processes
+    started through :mod:`multiprocessing` do). For other executors, which
+    might run their workers elsewhere, arrays are sent by value.
+    """
+    def __init__(self, n_workers, executor):
+        self._local = isinstance(executor, (ProcessPoolExecutor, ThreadPoolExecutor))
+        if self._local and resource_tracker is not None:
+            resource_tracker.ensure_running()
+        self._manager = mpc.Manager()
+        WorkerPool.__init__(self, n_workers, self._manager.Queue(), self._manager.Queue(), self._manager.Queue(), self._manager.Event())
+        args = (self.job_queue, self.task_queue, self.result_queue, self.kill_beacon)
+        self._futures = [executor.submit(pool_worker, *args) for _ in range(n_workers)]
+
+    @property
+    def is_alive(self):
+        return not any(future.done() for future in self._futures)
+
+    def share(self, array, keep=False):
+        if self._local:
+            return WorkerPool.share(self, array, keep)
+        return LocalArray(array)
+
+    def _join(self):
+        wait(self._futures)
+        self._manager.shutdown()
+
+    def _kill(self):
+        for _ in self._futures:
+            self.task_queue.put(None)
+            self.job_queue.put(None)
+        self._manager.shutdown()
+
+
+_SERVER_OBJECTS = {}
+
+
+def _server_object(name, factory):
+    "Object in the server process of a :class:`SocketPool`"
+    if name not in _SERVER_OBJECTS:
+        _SERVER_OBJECTS[name] = factory()
+    return _SERVER_OBJECTS[name]
+
+
+class _PoolManager(BaseManager):
+    "Server for the queues of a :class:`SocketPool`, and connection of remote workers"
+
+
+for _name in ('job_queue', 'task_queue', 'result_queue'):
+    _PoolManager.register(f'get_{_name}', partial(_server_object, _name, queue.Queue))
+_PoolManager.register('get_kill_beacon', partial(_server_object, 'kill_beacon', Event), EventProxy)
+
+
+class SocketPool(WorkerPool):
+    """Serve jobs to worker processes on other machines
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of remote worker processes.
+    address : (str, int)
+        Address at which to serve the queues.
+    authkey : bytes
+        Key that workers need to connect.
+
+    Notes
+    -----
+    The queues are served by a server process. Workers are started with
+    :func:`remote_worker`. Arrays are sent to the workers by value, and jobs
+    proceed as soon as at least one worker is connected. When the pool is shut
+    down, the workers reconnect to the same address and wait for the next
+    pool.
+    """
+    def __init__(self, n_workers, address, authkey):
+        self._manager = _PoolManager(address, authkey, ctx=mpc)
+        self._manager.start()
+        self._running = True
+        self.address = self._manager.address
+        WorkerPool.__init__(self, n_workers, self._manager.get_job_queue(), self._manager.get_task_queue(), self._manager.get_result_queue(), self._manager.get_kill_beacon())
+        logging.getLogger(__name__).debug("Serving jobs at %s:%i", *self.address)
+
+    @property
+    def is_alive(self):
+        return self._running
+
+    def share(self, array, keep=False):
+        return LocalArray(array)
+
+    def _join(self):
+        self._stop()
+
+    def _kill(self):
+        # unblock workers so that they reconnect for the next pool
+        for _ in range(self.n_workers):
+            self.task_queue.put(None)
+            self.job_queue.put(None)
+        self._stop()
+
+    def _stop(self):
+        # remote workers reconnect when the connection is closed
+        self._running = False
+        self._manager.shutdown()
+
+
+def pool_worker(job_queue, task_queue, result_queue, kill_beacon, nice=False):
+    "Worker: run jobs from ``job_queue``"
+    if nice and CONFIG['nice']:
+        os.nice(CONFIG['nice'])
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            return
+        func, args = job
+        try:
+            func(task_queue, result_queue, kill_beacon, *args)
+        except Exception:
+            result_queue.put(WorkerError(traceback.format_exc()))
+            return
+        for shared_array in find_shared_arrays(args):
+            shared_array.close()
+        result_queue.put(None)
+
+
+def find_shared_arrays(args):
+    "Iterate over the :class:`SharedArray` objects in ``args``, including nested ones"
+    for arg in args:
+        if isinstance(arg, SharedArray):
+            yield arg
+        elif isinstance(arg, (list, tuple)):
+            yield from find_shared_arrays(arg)
+        elif isinstance(arg, dict):
+            yield from find_shared_arrays(arg.values())
+
+
+def remote_worker(address, authkey, interval=1.):
+    """Worker process for :class:`SocketPool` pools on another machine
+
+    Runs until it is terminated: whenever a pool is shut down, the worker
+    reconnects to ``address`` and serves the next pool.
+
+    Parameters
+    ----------
+    address : (str, int)
+        Address of the :class:`SocketPool`.
+    authkey : bytes
+        Key for the connection.
+    interval : scalar
+        Time (in seconds) between attempts to connect.
+    """
+    if CONFIG['nice']:
+        os.nice(CONFIG['nice'])
+    while True:
+        manager = _PoolManager(address, authkey)
+        try:
+            manager.connect()
+        except ConnectionError:
+            sleep(interval)  # no pool running
+            continue
+        try:
+            pool_worker(manager.get_job_queue(), manager.get_task_queue(), manager.get_result_queue(), manager.get_kill_beacon())
+        except (EOFError, ConnectionError):
+            pass  # pool was shut down
+        sleep(interval)
+
+
+def parse_address(address):
+    "Parse a ``'HOST:PORT'`` address"
+    match = re.match(r'^(.*):(\d+)$', address)
+    if not match:
+        raise ValueError(f"{address!r}: address needs to be 'HOST:PORT'")
+    return match.group(1), int(match.group(2))
+
+
+def get_authkey():
+    "Key for :class:`SocketPool` connections (``EELBRAIN_AUTHKEY`` environment variable)"
+    authkey = os.environ.get('EELBRAIN_AUTHKEY')
+    if not authkey:
+        raise RuntimeError("Set the EELBRAIN_AUTHKEY environment variable to a secret key, both in the main process and for the remote workers")
+    return authkey.encode()
+
+
+def make_worker_pool():
+    "Worker pool with ``CONFIG['n_workers']`` workers for ``CONFIG['executor']``"
+    executor = CONFIG['executor']
+    n_workers = CONFIG['n_workers']
+    if isinstance(executor, Executor):
+        return ExecutorPool(n_workers, executor)
+    elif executor == 'multiprocessing':
+        return ProcessPool(n_workers)
+    elif executor == 'threading':
+        return ThreadPool(n_workers)
+    else:
+        return SocketPool(n_workers, parse_address(executor), get_authkey())
+
+
+@contextmanager
+def worker_pool():
+    """Context with a pool of ``CONFIG['n_workers']`` workers
+
+    With ``CONFIG['persistent_workers']``, the pool is kept for subsequent
+    jobs, otherwise it is shut down at the end of the context. If an exception
+    occurs, the workers are terminated.
+    """
+    global POOL
+    if CONFIG['persistent_workers']:
+        if POOL is not None and (POOL.n_workers != CONFIG['n_workers'] or not POOL.is_alive):
+            shutdown_worker_pool()
+        if POOL is None:
+            POOL = make_worker_pool()
+        pool = POOL
+    else:
+        pool = make_worker_pool()
+
+    try:
+        yield pool
+    except BaseException:
+        pool.terminate()
+        if pool is POOL:
+            POOL = None
+        raise
+    if pool is POOL:
+        pool.release_shared()
+    else:
+        pool.shutdown()
+
+
+def shutdown_worker_pool():
+    "Shut down the persistent worker pool"
+    global POOL
+    if POOL is not None:
+        POOL.shutdown()
+        POOL = None
+
+
+atexit.register(shutdown_worker_pool)
+
+
+if __name__ == '__main__':
+    # python -m eelbrain._utils.parallel HOST:PORT [N_PROCESSES]
+    # (workers run until they are interrupted)
+    _address = parse_address(sys.argv[1])
+    _n = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    _authkey = get_authkey()
+    _processes = [mpc.Process(target=remote_worker, args=(_address, _authkey)) for _ in range(_n)]
+    for _process in _processes:
+        _process.start()
+    for _process in _processes:
+        _process.join()